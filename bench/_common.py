@@ -0,0 +1,101 @@
+"""Shared helpers for the ts-server benchmarks.
+
+The server under test runs in a child process so its CPU time can be
+measured separately from the load-generating client. Everything here is
+stdlib-only so the benchmarks run anywhere the server itself runs.
+"""
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from functools import partial
+
+# Values of make_server(engine=...), for the benchmarks' --engine options
+ENGINES = ("threading", "pool", "asyncio")
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py")
+
+
+def load_server_module():
+    """Import ts-server.py (the hyphen rules out a plain import)."""
+    spec = importlib.util.spec_from_file_location("ts_server", SERVER_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _serve(conn, directory, handler_attrs, handler_kwargs, engine):
+    """Child process entry point: serve until the parent asks to stop."""
+    import logging
+    logging.disable(logging.INFO)
+    os.chdir(directory)
+    ts_server = load_server_module()
+    handler_class = type("BenchHandler", (ts_server.AuthHandler,), dict(handler_attrs))
+    # No access log unless a benchmark asks for one
+    handler = partial(handler_class, **{"access_log": None, **handler_kwargs})
+    httpd = ts_server.make_server(("127.0.0.1", 0), handler, engine=engine)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    conn.send(httpd.server_address[1])
+    while True:
+        message = conn.recv()
+        if message == "cpu":
+            conn.send(time.process_time())
+        elif message == "threads":
+            conn.send(threading.active_count())
+        elif message == "stop":
+            break
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class BenchServer:
+    """A ts-server instance running in a child process.
+
+    handler_attrs are set as class attributes on a throwaway AuthHandler
+    subclass (e.g. {'use_sendfile': False}); handler_kwargs are passed to
+    the handler constructor like run_server does. engine is "threading",
+    "pool" or "asyncio".
+    """
+
+    def __init__(self, directory, handler_attrs=None, handler_kwargs=None, engine="threading"):
+        context = multiprocessing.get_context("fork" if hasattr(os, "fork") else "spawn")
+        self._conn, child_conn = context.Pipe()
+        self._lock = threading.Lock()
+        self._process = context.Process(
+            target=_serve,
+            args=(child_conn, directory, handler_attrs or {}, handler_kwargs or {}, engine),
+            daemon=True,
+        )
+        self._process.start()
+        self.port = self._conn.recv()
+
+    def _ask(self, message):
+        with self._lock:
+            self._conn.send(message)
+            return self._conn.recv()
+
+    def cpu_time(self):
+        """Total CPU seconds the server process has used so far."""
+        return self._ask("cpu")
+
+    def thread_count(self):
+        """Number of threads currently alive in the server process."""
+        return self._ask("threads")
+
+    def close(self):
+        self._conn.send("stop")
+        self._process.join(5)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def emit(result):
+    """Write one machine-readable result line to stdout."""
+    sys.stdout.write(json.dumps(result, sort_keys=True) + "\n")
+    sys.stdout.flush()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Download throughput and server CPU-per-GB, sendfile vs. userspace copies.
+
+Usage:
+    python3 bench/bench_download.py [--size-mb 1024] [--rounds 3] [--engine threading|pool|asyncio]
+
+Modes: "stdlib" is SimpleHTTPRequestHandler.copyfile (the original path),
+"copy" is the large-buffer fallback and "sendfile" the zero-copy path.
+Prints one JSON line per mode with the wall-clock throughput and the CPU
+seconds the server process spent per GB sent.
+"""
+import argparse
+import http.client
+import http.server
+import os
+import tempfile
+import time
+
+from _common import ENGINES, BenchServer, emit
+
+
+def download(port, name, rounds):
+    """Fetch /name `rounds` times over fresh connections; return bytes read."""
+    total = 0
+    for _ in range(rounds):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        conn.request("GET", "/" + name)
+        response = conn.getresponse()
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            total += len(chunk)
+        conn.close()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024, help="Size of the test file (default: 1024)")
+    parser.add_argument("--rounds", type=int, default=3, help="Downloads per mode (default: 3)")
+    parser.add_argument("--engine", choices=ENGINES, default="threading", help="Server engine (default: threading)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        name = "payload.bin"
+        with open(os.path.join(directory, name), "wb") as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(block)
+
+        modes = (
+            ("stdlib", {"copyfile": http.server.SimpleHTTPRequestHandler.copyfile}),
+            ("copy", {"use_sendfile": False}),
+            ("sendfile", {"use_sendfile": True}),
+        )
+        for mode, handler_attrs in modes:
+            with BenchServer(directory, handler_attrs=handler_attrs, engine=args.engine) as server:
+                cpu_before = server.cpu_time()
+                start = time.perf_counter()
+                total = download(server.port, name, args.rounds)
+                elapsed = time.perf_counter() - start
+                cpu = server.cpu_time() - cpu_before
+            emit({
+                "benchmark": "download",
+                "engine": args.engine,
+                "mode": mode,
+                "bytes": total,
+                "seconds": round(elapsed, 4),
+                "mb_per_s": round(total / elapsed / 1e6, 1),
+                "server_cpu_s_per_gb": round(cpu / (total / 1e9), 4),
+            })
+
+
+if __name__ == "__main__":
+    main()
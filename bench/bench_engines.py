@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Threaded, worker pool and asyncio engines under 10/100/1000 concurrent connections.
+
+Usage:
+    python3 bench/bench_engines.py [--concurrency 10,100,1000] [--seconds 5] [--file-kb 64]
+
+Each simulated client repeatedly opens a connection, downloads a small
+file and, with --think-ms, waits before its next request, like a slow
+Funnel client. Prints one JSON line per (engine, concurrency) with the
+request rate, 503 rejections, latency percentiles, server CPU seconds per 1000 requests
+and the peak number of server threads.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from _common import ENGINES, BenchServer, emit
+
+
+async def fetch(port, request):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(request)
+        return await reader.read()
+    finally:
+        writer.close()
+
+
+async def client(port, path, deadline, think, latencies, errors, rejected, timeout=10):
+    """Issue requests until the deadline, recording each latency in ms.
+
+    Requests taking longer than timeout seconds count as errors, 503s as
+    rejected.
+    """
+    request = f"GET {path} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n".encode()
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(fetch(port, request), timeout)
+            if response.startswith(b"HTTP/1.0 503"):
+                rejected.append(1)
+                await asyncio.sleep(0.05)
+                continue
+            if not response.startswith(b"HTTP/1.0 200"):
+                raise ValueError(response[:40])
+        except (OSError, ValueError, asyncio.TimeoutError):
+            errors.append(1)
+            await asyncio.sleep(0.05)
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        if think:
+            await asyncio.sleep(think)
+
+
+async def run_load(port, path, concurrency, seconds, think):
+    latencies, errors, rejected = [], [], []
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(client(port, path, deadline, think, latencies, errors, rejected)
+                           for _ in range(concurrency)))
+    return latencies, errors, rejected
+
+
+def sample_threads(server, stop, peak):
+    """Poll the server's thread count until stop is set."""
+    while not stop.is_set():
+        peak[0] = max(peak[0], server.thread_count())
+        stop.wait(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="10,100,1000",
+                        help="Comma-separated client counts (default: 10,100,1000)")
+    parser.add_argument("--seconds", type=float, default=5, help="Duration per measurement (default: 5)")
+    parser.add_argument("--file-kb", type=int, default=64, help="Size of the downloaded file (default: 64)")
+    parser.add_argument("--think-ms", type=int, default=0, help="Pause between a client's requests (default: 0)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "payload.bin"), "wb") as f:
+            f.write(os.urandom(args.file_kb * 1024))
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            for engine in ENGINES:
+                with BenchServer(directory, engine=engine) as server:
+                    stop, peak = threading.Event(), [0]
+                    sampler = threading.Thread(target=sample_threads, args=(server, stop, peak))
+                    sampler.start()
+                    cpu_before = server.cpu_time()
+                    latencies, errors, rejected = asyncio.run(run_load(
+                        server.port, "/payload.bin", concurrency, args.seconds, args.think_ms / 1000))
+                    stop.set()
+                    sampler.join()
+                    cpu = server.cpu_time() - cpu_before
+                latencies.sort()
+                count = len(latencies)
+                emit({
+                    "benchmark": "engines",
+                    "engine": engine,
+                    "concurrency": concurrency,
+                    "requests": count,
+                    "errors": len(errors),
+                    "rejected": len(rejected),
+                    "requests_per_s": round(count / args.seconds, 1),
+                    "median_ms": round(statistics.median(latencies), 2) if latencies else None,
+                    "p99_ms": round(latencies[max(0, int(count * 0.99) - 1)], 2) if latencies else None,
+                    "server_cpu_s_per_1k": round(cpu / count * 1000, 4) if count else None,
+                    "peak_threads": peak[0],
+                })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Per-request latency with a new connection per request vs. keep-alive.
+
+Usage:
+    python3 bench/bench_keepalive.py [--requests 500] [--engines threading,asyncio]
+
+Fetches a small file, the upload page's stylesheet and /list, either
+opening a fresh TCP connection for every request ("new") or reusing one
+persistent HTTP/1.1 connection ("reuse"). Prints one JSON line per
+(engine, path, mode) with the median and p95 latency in milliseconds and
+the number of connections the client opened.
+"""
+import argparse
+import http.client
+import os
+import statistics
+import tempfile
+import time
+
+from _common import BenchServer, emit, load_server_module
+
+
+def measure(port, path, requests, reuse):
+    """Return (latencies in milliseconds, connections opened)."""
+    latencies = []
+    connections = 0
+    conn = None
+    for _ in range(requests):
+        start = time.perf_counter()
+        if conn is None:
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            connections += 1
+        conn.request("GET", path, headers={} if reuse else {"Connection": "close"})
+        response = conn.getresponse()
+        response.read()
+        if not reuse or response.will_close:
+            conn.close()
+            conn = None
+        latencies.append((time.perf_counter() - start) * 1000)
+    if conn is not None:
+        conn.close()
+    return latencies, connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per measurement (default: 500)")
+    parser.add_argument("--engines", default="threading,asyncio",
+                        help="Comma-separated server engines (default: threading,asyncio)")
+    args = parser.parse_args()
+
+    stylesheet = next(path for path in load_server_module().STATIC_ASSETS if path.endswith(".css"))
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(100):
+            with open(os.path.join(directory, f"file-{i:03d}.txt"), "wb") as f:
+                f.write(b"x" * 4096)
+        for engine in args.engines.split(","):
+            with BenchServer(directory, engine=engine) as server:
+                for path in ("/file-000.txt", stylesheet, "/list"):
+                    for mode in ("new", "reuse"):
+                        measure(server.port, path, 10, mode == "reuse")
+                        latencies, connections = measure(server.port, path, args.requests, mode == "reuse")
+                        latencies.sort()
+                        emit({
+                            "benchmark": "keepalive",
+                            "engine": engine,
+                            "path": path,
+                            "mode": mode,
+                            "requests": args.requests,
+                            "connections": connections,
+                            "median_ms": round(statistics.median(latencies), 3),
+                            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+                        })
+
+
+if __name__ == "__main__":
+    main()
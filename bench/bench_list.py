@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""/list latency across directory sizes, uncached scan vs. directory index.
+
+Usage:
+    python3 bench/bench_list.py [--sizes 1000,100000,1000000] [--requests 20] [--engine threading|pool|asyncio]
+
+"scan" reproduces the original listdir + isfile + getsize implementation;
+"index" is the full listing streamed from the inotify-backed DirectoryIndex
+and "page" a single 1000-entry page of it. "catalog" is that page from a
+server restarted with --catalog, whose first request is answered from the
+catalog instead of a directory scan. Prints one JSON line per (size, mode)
+with the first, median and p95 request latency in milliseconds.
+"""
+import argparse
+import http.client
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from _common import ENGINES, BenchServer, emit, load_server_module
+
+
+def scan_file_list(self, query):
+    """The original per-request /list implementation."""
+    files = []
+    for name in os.listdir(self.directory):
+        if name.startswith('.'):
+            continue
+        fullname = os.path.join(self.directory, name)
+        if os.path.isfile(fullname):
+            files.append({'name': name, 'size': os.path.getsize(fullname)})
+    body = json.dumps(files).encode()
+    self.send_response(200)
+    self.send_header('Content-type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+def populate(directory, count):
+    """Top the directory up to count small files."""
+    existing = sum(1 for name in os.listdir(directory) if not name.startswith('.'))
+    for i in range(existing, count):
+        with open(os.path.join(directory, f"file-{i:07d}.dat"), "wb") as f:
+            f.write(b"x" * (i % 4096))
+
+
+def measure(port, requests, path="/list"):
+    """Return per-request latencies in milliseconds over one connection each."""
+    latencies = []
+    for _ in range(requests):
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        start = time.perf_counter()
+        conn.request("GET", path)
+        conn.getresponse().read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        conn.close()
+    return latencies
+
+
+def build_catalog(directory, count):
+    """Run a --catalog server until its scanner has hashed count files."""
+    ts_server = load_server_module()
+    path = os.path.join(directory, ts_server.STATE_DIR_NAME, ts_server.CATALOG_NAME)
+    with BenchServer(directory, handler_kwargs={"catalog": True}) as server:
+        measure(server.port, 1)
+        while True:
+            with sqlite3.connect(path, timeout=30) as db:
+                hashed, = db.execute("SELECT COUNT(*) FROM files WHERE sha256 IS NOT NULL").fetchone()
+            if hashed >= count:
+                return
+            time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000,1000000",
+                        help="Comma-separated directory sizes (default: 1000,100000,1000000)")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per measurement (default: 20)")
+    parser.add_argument("--engine", choices=ENGINES, default="threading", help="Server engine (default: threading)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sorted(int(s) for s in args.sizes.split(",")):
+            populate(directory, size)
+            build_catalog(directory, size)
+            modes = (
+                ("scan", {"send_file_list": scan_file_list}, "/list", {}),
+                ("index", {}, "/list", {}),
+                ("page", {}, "/list?limit=1000", {}),
+                ("catalog", {}, "/list?limit=1000", {"catalog": True}),
+            )
+            for mode, handler_attrs, path, handler_kwargs in modes:
+                with BenchServer(directory, handler_attrs=handler_attrs, handler_kwargs=handler_kwargs,
+                                 engine=args.engine) as server:
+                    # The first request builds the index; report it separately
+                    first = measure(server.port, 1, path)[0]
+                    latencies = sorted(measure(server.port, args.requests, path))
+                emit({
+                    "benchmark": "list",
+                    "engine": args.engine,
+                    "mode": mode,
+                    "files": size,
+                    "first_ms": round(first, 2),
+                    "median_ms": round(statistics.median(latencies), 2),
+                    "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+                })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Upload throughput under each --durability mode with concurrent uploaders.
+
+Usage:
+    python3 bench/bench_uploads.py [--concurrency 1,16] [--uploads 64] [--file-kb 4,1024] [--dir PATH] [--dedup]
+                                   [--engine threading|pool|asyncio]
+
+Each client posts --uploads / concurrency multipart uploads of a
+--file-kb file, one after another on a kept-alive connection, to a server writing into --dir (a
+temp dir by default; point it at the disk you care about, since fsync
+cost depends entirely on the device). Small files measure per-upload
+overhead, large ones throughput. Prints one JSON line per (durability,
+file size, concurrency) with uploads per second, MB/s and the median
+and p99 latency in milliseconds. Every upload carries the same bytes, so
+with --dedup all but the first are stored as links to one blob.
+"""
+import argparse
+import http.client
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from _common import ENGINES, BenchServer, emit, load_server_module
+
+BOUNDARY = "benchboundary"
+
+
+def upload(conn, name, payload, latencies):
+    body = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode() + payload + f"\r\n--{BOUNDARY}--\r\n".encode()
+    start = time.perf_counter()
+    conn.request("POST", "/", body=body,
+                 headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+    response = conn.getresponse()
+    response.read()
+    if response.status != 200:
+        raise RuntimeError(f"upload failed with {response.status}")
+    latencies.append((time.perf_counter() - start) * 1000)
+
+
+def client(port, index, count, payload, latencies):
+    """Upload count files over one kept-alive connection."""
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    try:
+        for i in range(count):
+            upload(conn, f"upload-{index}-{i}.bin", payload, latencies)
+    finally:
+        conn.close()
+
+
+def measure(args, durability, file_kb, payload, concurrency):
+    """Run one (durability, file size, concurrency) measurement and emit its result."""
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        with BenchServer(directory, handler_kwargs={"durability": durability, "dedup": args.dedup},
+                         engine=args.engine) as server:
+            latencies = []
+            per_client = max(1, args.uploads // concurrency)
+            threads = [threading.Thread(target=client, args=(server.port, i, per_client, payload, latencies))
+                       for i in range(concurrency)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+    latencies.sort()
+    count = len(latencies)
+    emit({
+        "benchmark": "uploads",
+        "engine": args.engine,
+        "durability": durability,
+        "dedup": args.dedup,
+        "file_kb": file_kb,
+        "concurrency": concurrency,
+        "uploads": count,
+        "uploads_per_s": round(count / elapsed, 1),
+        "mb_per_s": round(count * len(payload) / elapsed / 1e6, 1),
+        "median_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(latencies[max(0, int(count * 0.99) - 1)], 2),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,16", help="Comma-separated uploader counts (default: 1,16)")
+    parser.add_argument("--uploads", type=int, default=64, help="Uploads per measurement (default: 64)")
+    parser.add_argument("--file-kb", default="4,1024", help="Comma-separated upload sizes (default: 4,1024)")
+    parser.add_argument("--dir", help="Directory to upload into (default: a temp dir)")
+    parser.add_argument("--dedup", action="store_true", help="Run the server with --dedup")
+    parser.add_argument("--engine", choices=ENGINES, default="threading", help="Server engine (default: threading)")
+    args = parser.parse_args()
+
+    modes = load_server_module().DURABILITY_MODES
+    for durability in (mode for mode in modes if not (args.dedup and mode == "none")):
+        for file_kb in (int(size) for size in args.file_kb.split(",")):
+            payload = os.urandom(file_kb * 1024)
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                measure(args, durability, file_kb, payload, concurrency)
+
+
+if __name__ == "__main__":
+    main()
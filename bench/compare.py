@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare two benchmark result files, e.g. two releases or two engines.
+
+Usage:
+    python3 bench/compare.py BASELINE.jsonl CANDIDATE.jsonl [--threshold 10] [--ignore engine]
+
+Reads files written by bench/run_all.py (or saved output of any single
+benchmark). Results are paired on their settings: every field that is
+not a measurement or a tally, minus the fields named by --ignore, so
+"--ignore engine" compares a threading run against an asyncio run.
+Prints each measurement's baseline and candidate values with the change
+in percent. Changes for the worse beyond --threshold percent are marked
+and make the exit status 1.
+"""
+import argparse
+import json
+import sys
+
+# Measurement fields by suffix, and whether a larger value is better
+MEASUREMENT_SUFFIXES = (
+    ("_per_s", True),
+    ("_ms", False),
+    ("_s_per_gb", False),
+    ("_s_per_1k", False),
+)
+# Counts that vary from run to run without describing the setup
+TALLIES = {"requests", "uploads", "bytes", "seconds", "errors", "rejected", "connections", "peak_threads"}
+
+
+def measurement_direction(field):
+    """Return True if larger is better, False if smaller is, or None for a setting."""
+    for suffix, larger_is_better in MEASUREMENT_SUFFIXES:
+        if field.endswith(suffix):
+            return larger_is_better
+    return None
+
+
+def load(path, ignore):
+    """Return {settings: result} for the results in a file."""
+    results = {}
+    with open(path) as f:
+        for line in f:
+            result = json.loads(line)
+            if result.get("benchmark") == "run" or "error" in result:
+                continue
+            settings = tuple(sorted(
+                (field, value) for field, value in result.items()
+                if measurement_direction(field) is None and field not in TALLIES and field not in ignore))
+            results[settings] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="Percent change counted as a regression (default: 10)")
+    parser.add_argument("--ignore", default="", help="Comma-separated setting fields to pair results across")
+    args = parser.parse_args()
+
+    ignore = set(filter(None, args.ignore.split(",")))
+    baseline, candidate = load(args.baseline, ignore), load(args.candidate, ignore)
+    regressions = 0
+    for settings in sorted(baseline.keys() & candidate.keys(), key=repr):
+        print(" ".join(f"{field}={value}" for field, value in settings))
+        old, new = baseline[settings], candidate[settings]
+        for field in old:
+            larger_is_better = measurement_direction(field)
+            if larger_is_better is None or old[field] is None or new.get(field) is None:
+                continue
+            change = (new[field] - old[field]) / old[field] * 100 if old[field] else 0.0
+            worse = -change if larger_is_better else change
+            marker = "  REGRESSION" if worse > args.threshold else ""
+            regressions += bool(marker)
+            print(f"    {field:<22} {old[field]:>12} -> {new[field]:>12}  {change:+7.1f}%{marker}")
+    for label, unmatched in (("baseline", baseline.keys() - candidate.keys()),
+                             ("candidate", candidate.keys() - baseline.keys())):
+        if unmatched:
+            print(f"{len(unmatched)} results only in the {label}")
+    if regressions:
+        sys.exit(f"{regressions} measurements regressed by more than {args.threshold:g}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Run the whole benchmark suite and collect its results in one file.
+
+Usage:
+    python3 bench/run_all.py [--preset quick|full] [--only uploads,download,...] [--output PATH] [--label NAME]
+
+Runs each bench_*.py in a subprocess with the preset's options: "quick"
+finishes in a few minutes, "full" uses each benchmark's own defaults.
+Writes JSON lines to --output (default: stdout). The first line describes
+the run (label, git commit, Python version, platform, CPU count, start
+time); every other line is a result exactly as the benchmark printed it,
+or a {"benchmark", "error"} line for a benchmark that failed. Two such
+files can be compared with bench/compare.py.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Benchmark options per preset, in the order the benchmarks run
+PRESETS = {
+    "quick": {
+        "uploads": ["--concurrency", "1,8", "--uploads", "32", "--file-kb", "4,1024"],
+        "download": ["--size-mb", "128", "--rounds", "2"],
+        "list": ["--sizes", "1000,10000", "--requests", "10"],
+        "engines": ["--concurrency", "10,100", "--seconds", "2"],
+        "keepalive": ["--requests", "200"],
+    },
+    "full": {
+        "uploads": [],
+        "download": [],
+        "list": [],
+        "engines": [],
+        "keepalive": [],
+    },
+}
+
+
+def git_commit():
+    """Return (short commit, whether the tree has local changes), or (None, None) outside git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BENCH_DIR,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def run_benchmark(name, options, output):
+    """Run bench_<name>.py, copying its result lines to output; return True on success."""
+    script = os.path.join(BENCH_DIR, f"bench_{name}.py")
+    process = subprocess.Popen([sys.executable, script, *options], stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        output.write(line)
+        output.flush()
+    if process.wait() != 0:
+        output.write(json.dumps({"benchmark": name, "error": f"exit status {process.returncode}"}) + "\n")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--preset", choices=PRESETS, default="quick", help="Benchmark sizes (default: quick)")
+    parser.add_argument("--only", help="Comma-separated benchmarks to run (default: all)")
+    parser.add_argument("--output", help="File to write results to (default: stdout)")
+    parser.add_argument("--label", help="Name recorded with the run, e.g. a release or engine")
+    args = parser.parse_args()
+
+    benchmarks = PRESETS[args.preset]
+    names = args.only.split(",") if args.only else list(benchmarks)
+    unknown = [name for name in names if name not in benchmarks]
+    if unknown:
+        parser.error("unknown benchmark: " + ", ".join(unknown))
+
+    commit, dirty = git_commit()
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        output.write(json.dumps({
+            "benchmark": "run",
+            "label": args.label,
+            "preset": args.preset,
+            "commit": commit,
+            "dirty": dirty,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "started": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        }, sort_keys=True) + "\n")
+        failed = [name for name in names if not run_benchmark(name, benchmarks[name], output)]
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if failed:
+        sys.exit("failed: " + ", ".join(failed))
+
+
+if __name__ == "__main__":
+    main()
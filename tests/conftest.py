@@ -50,4 +50,33 @@ def running_server(test_server, temp_dir):
     yield server
     
     server.shutdown()
-    server.server_close()
\ No newline at end of file
+    server.server_close()
+
+@pytest.fixture(params=["threading", "asyncio"])
+def engine(request):
+    """Run a test on the threaded engine and on the asyncio engine."""
+    return request.param
+
+@pytest.fixture
+def start_server(request, temp_dir):
+    """Start servers in background threads and stop them after the test.
+
+    start_server(engine="threading", **handler_kwargs) returns a running
+    server for AuthHandler(**handler_kwargs). It is built from the test
+    module's own ts_server, so attributes the test patches there apply.
+    """
+    module = getattr(request.module, "ts_server", ts_server)
+    servers = []
+    def _start(engine="threading", **handler_kwargs):
+        handler_kwargs.setdefault("password", "")
+        handler = partial(module.AuthHandler, **handler_kwargs)
+        server = module.make_server(('localhost', 0), handler, engine=engine)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        servers.append((server, thread))
+        return server
+    yield _start
+    for server, thread in servers:
+        server.shutdown()
+        server.server_close()
+        thread.join(5)
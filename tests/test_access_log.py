@@ -0,0 +1,123 @@
+import pytest
+import json
+import os
+import sys
+import threading
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = ts_server.Metrics()
+    monkeypatch.setattr(ts_server, "METRICS", metrics)
+    return metrics
+
+class StalledStream:
+    """A log stream whose writes block until released, like a stuck pipe."""
+
+    def __init__(self):
+        self.writing = threading.Event()
+        self.release = threading.Event()
+        self.lines = []
+
+    def write(self, data):
+        self.writing.set()
+        self.release.wait()
+        self.lines.extend(data.splitlines())
+
+    def flush(self):
+        pass
+
+class TestAccessLog:
+    """Test the queued access log writer."""
+
+    def test_stalled_stream_drops_instead_of_blocking(self, metrics):
+        """Test that logging never waits for the stream and counts what it drops."""
+        stream = StalledStream()
+        access_log = ts_server.AccessLog(stream, queue_size=2)
+        access_log.log({"n": 0})
+        assert stream.writing.wait(5)
+        for n in range(1, 5):
+            access_log.log({"n": n})
+        assert metrics.snapshot()[("ts_server_access_log_dropped_total", ())] == 2
+
+        stream.release.set()
+        assert access_log.flush()
+        assert [json.loads(line)["n"] for line in stream.lines] == [0, 1, 2]
+
+class TestResolveAccessLog:
+    """Test the checks on --access-log PATH made before the server starts."""
+
+    def test_paths(self, temp_dir, tmp_path):
+        """Test that served paths and unopenable paths are refused."""
+        served = os.path.join(temp_dir, "served")
+        os.mkdir(served)
+        outside = str(tmp_path / "access.log")
+        assert ts_server.resolve_access_log(outside, served) == os.path.realpath(outside)
+        assert os.path.exists(outside)
+
+        state_log = os.path.join(served, ".ts-server", "logs", "access.log")
+        assert ts_server.resolve_access_log(state_log, served) == os.path.realpath(state_log)
+
+        for path in (os.path.join(served, "access.log"), os.path.join(served, "sub", "a.log"),
+                     os.path.join(served, ".ts-server"), "/nonexistent/dir/a.log"):
+            with pytest.raises(ValueError):
+                ts_server.resolve_access_log(path, served)
+        assert not os.path.exists(os.path.join(served, "access.log"))
+
+class TestAccessLogServer:
+    """Test the records written for requests to the running server."""
+
+    @pytest.fixture
+    def server(self, start_server, engine, temp_dir, metrics):
+        log_path = os.path.join(temp_dir, "access.log")
+        server = start_server(engine, use_auth=True, password="test123", access_log=log_path)
+        server.log_path = log_path
+        return server
+
+    def read_log(self, server):
+        assert ts_server.get_access_log(server.log_path).flush()
+        with open(server.log_path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_request_records(self, server, temp_dir):
+        """Test that each request is logged with its route, status, bytes and duration."""
+        with open(os.path.join(temp_dir, "a.bin"), "wb") as f:
+            f.write(os.urandom(5000))
+        base_url = f"http://localhost:{server.server_address[1]}"
+        session = requests.Session()
+        session.auth = ('user', 'test123')
+        session.get(base_url + "/a.bin")
+        session.post(base_url + "/", files={"file": ("up.bin", b"u" * 3000)})
+        session.get(base_url + "/missing.txt?x=1")
+        requests.get(base_url + "/list", headers={"X-Forwarded-For": "203.0.113.9"})
+
+        records = [record for record in self.read_log(server) if "route" in record]
+        assert [(r["method"], r["path"], r["route"], r["status"]) for r in records] == [
+            ("GET", "/a.bin", "file", 200),
+            ("POST", "/", "upload", 200),
+            ("GET", "/missing.txt?x=1", "file", 404),
+            ("GET", "/list", "list", 401),
+        ]
+        assert records[0]["bytes"] > 5000 and records[0]["received"] > 0
+        assert records[1]["received"] > 3000
+        assert records[3]["client"] == "203.0.113.9"
+        for record in records:
+            assert record["duration_ms"] >= 0
+            assert record["time"].endswith("+00:00")
+
+    def test_messages_are_queued(self, server):
+        """Test that log_message() output goes to the access log, not stderr."""
+        response = requests.get(f"http://localhost:{server.server_address[1]}/nope", auth=('user', 'test123'))
+        assert response.status_code == 404
+        messages = [record["message"] for record in self.read_log(server) if "message" in record]
+        assert messages == ["code 404, message File not found"]
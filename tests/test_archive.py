@@ -0,0 +1,203 @@
+import pytest
+import http.client
+import io
+import os
+import sys
+import tarfile
+import zipfile
+import requests
+from functools import partial
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+def write(temp_dir, name, data):
+    path = os.path.join(temp_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+def read_archive(archive_format, data):
+    """Return {name: bytes} for a downloaded archive."""
+    if archive_format == "zip":
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.testzip() is None
+            return {name: archive.read(name) for name in archive.namelist()}
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive.getmembers()}
+
+class TestArchivePaths:
+    """Test how a requested selection is resolved."""
+
+    def test_select_archive_paths(self, temp_dir):
+        """Test that nested selections collapse and unsafe paths are refused."""
+        write(temp_dir, "docs/a.txt", b"a")
+        write(temp_dir, "docs/sub/b.txt", b"b")
+        write(temp_dir, "c.txt", b"c")
+        select = partial(ts_server.select_archive_paths, temp_dir)
+        assert [name for name, _ in select(["docs/sub", "/docs/", "c.txt", "docs/a.txt"])] == ["c.txt", "docs"]
+        assert [name for name, _ in select(["c.txt", "/"])] == [""]
+        for path in ("../etc/passwd", "docs/../c.txt", ".ts-server", "docs/.hidden"):
+            with pytest.raises(ValueError):
+                select([path])
+        with pytest.raises(FileNotFoundError):
+            select(["c.txt", "missing.txt"])
+
+class TestArchiveDownloads:
+    """Test archive downloads through the running server."""
+
+    @pytest.fixture
+    def base_url(self, start_server, engine):
+        server = start_server(engine)
+        return f"http://localhost:{server.server_address[1]}"
+
+    @pytest.fixture
+    def files(self, temp_dir):
+        files = {
+            "notes.txt": b"top level",
+            "photos/big.bin": os.urandom(3 * 1024 * 1024 + 7),
+            "photos/empty.bin": b"",
+            "photos/2024/café.jpg": b"\xff\xd8 unicode name",
+        }
+        for name, data in files.items():
+            write(temp_dir, name, data)
+        write(temp_dir, "photos/.thumbs/skip.jpg", b"hidden")
+        write(temp_dir, ".hidden.txt", b"hidden")
+        return files
+
+    @pytest.mark.parametrize("archive_format", ["zip", "tar", "tgz"])
+    def test_directory_archive(self, base_url, files, archive_format):
+        """Test that a directory is archived recursively, without hidden entries."""
+        response = requests.get(base_url + "/archive", params={"path": "photos", "format": archive_format})
+        assert response.status_code == 200
+        assert response.headers["Transfer-Encoding"] == "chunked"
+        extension = ts_server.ARCHIVE_FORMATS[archive_format][1]
+        assert f'filename="photos{extension}"' in response.headers["Content-Disposition"]
+        assert read_archive(archive_format, response.content) == \
+            {name: data for name, data in files.items() if name.startswith("photos/")}
+
+    def test_everything_and_selections(self, base_url, files):
+        """Test path=/ and a selection posted as a form."""
+        response = requests.get(base_url + "/archive?path=/&format=tar")
+        assert read_archive("tar", response.content) == files
+
+        response = requests.post(base_url + "/archive", data={
+            "path": ["notes.txt", "photos/empty.bin", "photos/2024"], "format": "zip"})
+        assert response.status_code == 200
+        assert 'filename="files.zip"' in response.headers["Content-Disposition"]
+        assert sorted(read_archive("zip", response.content)) == \
+            ["notes.txt", "photos/2024/café.jpg", "photos/empty.bin"]
+
+    def test_invalid_requests(self, base_url, files):
+        """Test that bad formats and paths are refused before anything is streamed."""
+        assert requests.get(base_url + "/archive?path=notes.txt&format=rar").status_code == 400
+        assert requests.get(base_url + "/archive?format=zip").status_code == 400
+        for path in ("missing.txt", "../etc/passwd", ".ts-server", ".hidden.txt"):
+            assert requests.get(base_url + "/archive", params={"path": path}).status_code == 404
+        response = requests.post(base_url + "/archive", data=b"path=notes.txt",
+                                 headers={"Content-Type": "text/plain"})
+        assert response.status_code == 400
+
+    def test_http10_client(self, base_url, files):
+        """Test that an HTTP/1.0 client gets an unframed body ending at close."""
+        conn = http.client.HTTPConnection(base_url[len("http://"):])
+        conn._http_vsn, conn._http_vsn_str = 10, "HTTP/1.0"
+        conn.request("GET", "/archive?path=notes.txt&format=tgz")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.getheader("Connection") == "close"
+        assert read_archive("tgz", response.read()) == {"notes.txt": b"top level"}
+        conn.close()
+
+def make_tar(members, mode="w"):
+    """Build a tar in memory from (TarInfo fields, data) pairs."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as archive:
+        for fields, data in members:
+            info = tarfile.TarInfo(fields.pop("name"))
+            for name, value in fields.items():
+                setattr(info, name, value)
+            info.size = len(data) if info.isfile() else 0
+            archive.addfile(info, io.BytesIO(data) if info.isfile() else None)
+    return buffer.getvalue()
+
+class TestArchiveUploads:
+    """Test extracting posted tar streams through the running server."""
+
+    @pytest.fixture
+    def base_url(self, start_server):
+        server = start_server()
+        return f"http://localhost:{server.server_address[1]}"
+
+    def test_extract_tree(self, base_url, temp_dir):
+        """Test that a compressed tree lands on disk, below path= if given."""
+        big = os.urandom(2 * 1024 * 1024 + 3)
+        data = make_tar([({"name": "./", "type": tarfile.DIRTYPE}, b""), ({"name": "./top.txt"}, b"top"),
+                         ({"name": "tree/a/b/deep.bin"}, big), ({"name": "tree/empty", "type": tarfile.DIRTYPE}, b"")],
+                        mode="w:gz")
+        session = requests.Session()
+        response = session.post(base_url + "/extract", data=data)
+        assert response.status_code == 200
+        assert response.json() == {"files": 2, "size": len(big) + 3, "skipped": 0}
+        with open(os.path.join(temp_dir, "tree/a/b/deep.bin"), "rb") as f:
+            assert f.read() == big
+        assert os.path.isdir(os.path.join(temp_dir, "tree/empty"))
+        assert [entry["name"] for entry in session.get(base_url + "/list").json()] == ["top.txt"]
+
+        # The same connection carries on after the body, padding included
+        response = session.post(base_url + "/extract?path=backup/2024", data=make_tar([({"name": "x.txt"}, b"x")]))
+        assert response.json()["files"] == 1
+        with open(os.path.join(temp_dir, "backup/2024/x.txt"), "rb") as f:
+            assert f.read() == b"x"
+
+    def test_unsafe_members_are_skipped(self, start_server, temp_dir):
+        """Test that members cannot escape the served directory or write state files."""
+        outside = os.path.join(temp_dir, "outside")
+        os.makedirs(os.path.join(temp_dir, "served"))
+        os.mkdir(outside)
+        os.symlink(outside, os.path.join(temp_dir, "served", "link"))
+        os.chdir(os.path.join(temp_dir, "served"))
+        server = start_server()
+        data = make_tar([
+            ({"name": "../escape.txt"}, b"no"),
+            ({"name": "ok/../../escape.txt"}, b"no"),
+            ({"name": "link/through-symlink.txt"}, b"no"),
+            ({"name": "link"}, b"no"),
+            ({"name": "sym", "type": tarfile.SYMTYPE, "linkname": "/etc/passwd"}, b""),
+            ({"name": "hard", "type": tarfile.LNKTYPE, "linkname": "/etc/passwd"}, b""),
+            ({"name": "/abs/kept.txt"}, b"kept"),
+            ({"name": ".ts-server/blobs/x"}, b"renamed"),
+            ({"name": "a<b>.txt"}, b"renamed"),
+        ])
+        response = requests.post(f"http://localhost:{server.server_address[1]}/extract", data=data)
+        assert response.status_code == 200
+        assert response.json()["skipped"] == 6
+        assert os.listdir(outside) == []
+        assert not os.path.exists(os.path.join(temp_dir, "escape.txt"))
+        assert sorted(os.listdir(os.path.join(temp_dir, "served"))) == \
+            [".ts-server", "a_b_.txt", "abs", "file_.ts-server", "link"]
+        with open(os.path.join(temp_dir, "served/file_.ts-server/blobs/x"), "rb") as f:
+            assert f.read() == b"renamed"
+
+    def test_malformed_uploads(self, base_url, temp_dir):
+        """Test that truncated archives and bodies without a length are refused."""
+        data = make_tar([({"name": "a.txt"}, b"a" * 5000), ({"name": "b.txt"}, b"b" * 5000)])
+        response = requests.post(base_url + "/extract", data=data[:7000])
+        assert response.status_code == 400
+        assert response.headers["Connection"] == "close"
+        assert not os.path.exists(os.path.join(temp_dir, "b.txt"))
+        assert requests.post(base_url + "/extract", data=b"not a tar" * 100).status_code == 400
+
+        conn = http.client.HTTPConnection(base_url[len("http://"):])
+        conn.putrequest("POST", "/extract")
+        conn.putheader("Transfer-Encoding", "chunked")
+        conn.endheaders()
+        assert conn.getresponse().status == 411
+        conn.close()
@@ -0,0 +1,105 @@
+import pytest
+import os
+import sys
+import socket
+import threading
+import requests
+from functools import partial
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+class TestAsyncioEngine:
+    """Test that the asyncio engine serves the same routes as the threaded one."""
+
+    @pytest.fixture
+    def server(self, temp_dir):
+        handler = partial(ts_server.AuthHandler, use_auth=True, password="test123")
+        server = ts_server.AsyncioHTTPServer(('localhost', 0), handler, max_workers=4)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+        thread.join(5)
+        assert not thread.is_alive()
+
+    @pytest.fixture
+    def base_url(self, server):
+        return f"http://localhost:{server.server_address[1]}"
+
+    def test_requires_auth(self, base_url):
+        """Test that every route is authenticated."""
+        assert requests.get(base_url + "/").status_code == 401
+        assert requests.get(base_url + "/list").status_code == 401
+        assert requests.get(base_url + "/", auth=('user', 'test123')).status_code == 200
+
+    def test_download_and_range(self, base_url, temp_dir):
+        """Test whole-file and ranged downloads through the loop's sendfile."""
+        content = os.urandom(3 * 1024 * 1024 + 5)
+        with open(os.path.join(temp_dir, "data.bin"), "wb") as f:
+            f.write(content)
+        response = requests.get(base_url + "/data.bin", auth=('user', 'test123'))
+        assert response.status_code == 200
+        assert response.content == content
+
+        response = requests.get(base_url + "/data.bin", auth=('user', 'test123'),
+                                headers={'Range': 'bytes=100-199,-10'})
+        assert response.status_code == 206
+        assert content[100:200] in response.content
+        assert content[-10:] in response.content
+
+    def test_upload_and_list(self, base_url, temp_dir):
+        """Test a multipart upload and that /list shows it."""
+        content = os.urandom(2 * 1024 * 1024)
+        response = requests.post(base_url + "/", auth=('user', 'test123'),
+                                 files={'file': ('upload.bin', content)})
+        assert response.status_code == 200
+        with open(os.path.join(temp_dir, "upload.bin"), "rb") as f:
+            assert f.read() == content
+
+        listing = requests.get(base_url + "/list", auth=('user', 'test123')).json()
+        assert [entry['name'] for entry in listing] == ['upload.bin']
+
+    def test_resumable_upload(self, base_url, temp_dir):
+        """Test the resumable upload API on the asyncio engine."""
+        auth = ('user', 'test123')
+        session = requests.post(base_url + "/uploads", auth=auth,
+                                json={'filename': 'resumed.txt', 'size': 10}).json()
+        url = f"{base_url}/uploads/{session['id']}"
+        assert requests.patch(url, auth=auth, data=b"01234",
+                              headers={'Upload-Offset': '0'}).status_code == 204
+        assert requests.patch(url, auth=auth, data=b"56789",
+                              headers={'Upload-Offset': '5'}).status_code == 204
+        assert requests.post(url + "/finalize", auth=auth).status_code == 200
+        with open(os.path.join(temp_dir, "resumed.txt"), "rb") as f:
+            assert f.read() == b"0123456789"
+
+    def test_concurrent_idle_connections(self, server, base_url):
+        """Test that idle connections do not tie up the handler threads."""
+        idle = [socket.create_connection(server.server_address) for _ in range(20)]
+        try:
+            for conn in idle:
+                conn.sendall(b"GET / HTTP/1.1\r\n")
+            assert requests.get(base_url + "/", auth=('user', 'test123'), timeout=5).status_code == 200
+        finally:
+            for conn in idle:
+                conn.close()
+
+    def test_shutdown_with_stalled_upload(self, server):
+        """Test that shutdown is not blocked by a handler waiting for body data."""
+        conn = socket.create_connection(server.server_address)
+        conn.sendall(b"POST /uploads HTTP/1.1\r\nHost: x\r\nContent-Length: 100\r\n"
+                     b"Authorization: Basic dXNlcjp0ZXN0MTIz\r\n\r\n{")
+        try:
+            # The fixture's shutdown must return even though the body never arrives
+            server.shutdown()
+        finally:
+            conn.close()
@@ -0,0 +1,151 @@
+import pytest
+import os
+import sys
+import hashlib
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+@pytest.fixture
+def no_background_scan(monkeypatch):
+    """Keep the scanner thread from running so tests drive scan_once() themselves."""
+    monkeypatch.setattr(ts_server.Catalog, "run", lambda self: None)
+
+@pytest.mark.skipif(ts_server.sqlite3 is None, reason="needs sqlite3")
+class TestCatalog:
+    """Test the SQLite file catalog and its directory index integration."""
+
+    def write(self, temp_dir, name, data):
+        with open(os.path.join(temp_dir, name), "wb") as f:
+            f.write(data)
+
+    def test_scan_records_and_index_lists_checksums(self, temp_dir, no_background_scan):
+        """Test that a scan hashes every file and /list entries gain sha256."""
+        self.write(temp_dir, "a.txt", b"alpha")
+        self.write(temp_dir, "b.json", b"{}")
+        index = ts_server.DirectoryIndex(temp_dir)
+        catalog = ts_server.Catalog(temp_dir, index)
+        catalog.scan_once()
+
+        rows = {row.name: row for row in catalog.rows()}
+        assert rows["a.txt"].sha256 == sha256(b"alpha")
+        assert rows["b.json"].mime == "application/json"
+        assert index.lookup("a.txt").sha256 == sha256(b"alpha")
+        assert b'"sha256": "%s"' % sha256(b"{}").encode() in index.lookup("b.json").listing
+
+        # A changed file loses its checksum until it is hashed again
+        version = index.version()
+        self.write(temp_dir, "a.txt", b"alpha, edited")
+        index.mark_dirty("a.txt")
+        assert index.lookup("a.txt").sha256 is None
+        catalog.scan_once()
+        assert index.lookup("a.txt").sha256 == sha256(b"alpha, edited")
+        assert index.version() != version
+
+        os.unlink(os.path.join(temp_dir, "b.json"))
+        index.mark_dirty("b.json")
+        catalog.scan_once()
+        assert [row.name for row in catalog.rows()] == ["a.txt"]
+
+    def test_restart_lists_from_catalog(self, temp_dir, no_background_scan):
+        """Test that a new index is seeded from the catalog and reconciled later."""
+        self.write(temp_dir, "kept.txt", b"kept")
+        self.write(temp_dir, "removed.txt", b"removed")
+        ts_server.Catalog(temp_dir, ts_server.DirectoryIndex(temp_dir)).scan_once()
+        os.unlink(os.path.join(temp_dir, "removed.txt"))
+        self.write(temp_dir, "added.txt", b"added")
+
+        # Poll mode: the seeded entries are served until the scanner reconciles
+        index = ts_server.DirectoryIndex(temp_dir)
+        catalog = ts_server.Catalog(temp_dir, index)
+        assert index.reconcile_pending
+        assert sorted(name for name, _ in index.items()) == ["kept.txt", "removed.txt"]
+        assert index.lookup("kept.txt").sha256 == sha256(b"kept")
+
+        catalog.scan_once()
+        assert not index.reconcile_pending
+        assert sorted(name for name, _ in index.items()) == ["added.txt", "kept.txt"]
+        assert index.lookup("kept.txt").sha256 == sha256(b"kept")
+        assert index.lookup("added.txt").sha256 == sha256(b"added")
+
+    def test_seeded_index_does_not_answer_revalidations(self, start_server, temp_dir, no_background_scan):
+        """Test that a file rewritten while the server was down is not answered 304 from a stale row."""
+        self.write(temp_dir, "notes.txt", b"before the restart")
+        ts_server.Catalog(temp_dir, ts_server.DirectoryIndex(temp_dir)).scan_once()
+        old = os.stat(os.path.join(temp_dir, "notes.txt"))
+        with open(os.path.join(temp_dir, "notes.txt"), "r+b") as f:
+            f.write(b"rewritten in place, same inode")
+        old_etag = ts_server.file_etag(old.st_size, old.st_mtime_ns, old.st_ino)
+
+        assert ts_server.get_catalog(temp_dir).index.reconcile_pending
+        server = start_server(catalog=True)
+        response = requests.get(f"http://localhost:{server.server_address[1]}/notes.txt",
+                                headers={'If-None-Match': old_etag})
+        assert response.status_code == 200
+        assert response.content == b"rewritten in place, same inode"
+        assert response.headers['ETag'] != old_etag
+
+    def test_checksum_hashes_stale_rows(self, temp_dir, no_background_scan):
+        """Test that checksum() reuses a current row and rehashes a stale one."""
+        self.write(temp_dir, "a.bin", b"one")
+        catalog = ts_server.Catalog(temp_dir, ts_server.DirectoryIndex(temp_dir))
+        assert catalog.checksum("a.bin").sha256 == sha256(b"one")
+        self.write(temp_dir, "a.bin", b"two, longer")
+        assert catalog.checksum("a.bin").sha256 == sha256(b"two, longer")
+        assert catalog.get("a.bin").size == len(b"two, longer")
+        with pytest.raises(OSError):
+            catalog.checksum("missing.bin")
+
+@pytest.mark.skipif(ts_server.sqlite3 is None, reason="needs sqlite3")
+class TestCatalogServer:
+    """Test /checksum and checksums in /list through the running server."""
+
+    @pytest.fixture(params=[True, False], ids=["catalog", "no-catalog"])
+    def server(self, request, start_server, temp_dir):
+        with open(os.path.join(temp_dir, "existing.txt"), "wb") as f:
+            f.write(b"was here first")
+        server = start_server(catalog=request.param)
+        server.catalog = request.param
+        return server
+
+    def url(self, server):
+        return f"http://localhost:{server.server_address[1]}"
+
+    def test_checksum_endpoint(self, server):
+        """Test that /checksum reports a file's metadata and SHA-256."""
+        base_url = self.url(server)
+        response = requests.get(base_url + "/checksum/existing.txt")
+        assert response.status_code == 200
+        info = response.json()
+        assert info["sha256"] == sha256(b"was here first")
+        assert info["size"] == 14 and info["type"] == "text/plain"
+        for name in ("missing.txt", ".ts-server", "", "..%2Fetc%2Fpasswd"):
+            assert requests.get(base_url + "/checksum/" + name).status_code == 404
+
+    def test_uploads_are_listed_with_checksums(self, server):
+        """Test that uploads are catalogued with the hash taken while streaming."""
+        base_url = self.url(server)
+        content = os.urandom(20000)
+        assert requests.post(base_url + "/", files={"file": ("new.bin", content)}).status_code == 200
+        session = requests.post(base_url + "/uploads", json={"filename": "resumed.bin", "size": 3}).json()
+        requests.patch(base_url + "/uploads/" + session['id'], data=b"abc", headers={'Upload-Offset': '0'})
+        assert requests.post(base_url + "/uploads/" + session['id'] + "/finalize").status_code == 200
+
+        listing = {entry["name"]: entry for entry in requests.get(base_url + "/list").json()}
+        if server.catalog:
+            assert listing["new.bin"]["sha256"] == sha256(content)
+            assert listing["resumed.bin"]["sha256"] == sha256(b"abc")
+        else:
+            assert "sha256" not in listing["new.bin"]
+        assert requests.get(base_url + "/checksum/new.bin").json()["sha256"] == sha256(content)
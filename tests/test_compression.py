@@ -0,0 +1,146 @@
+import pytest
+import os
+import sys
+import gzip
+import zlib
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+TEXT = b"timestamp,level,message\n" + b"2024-01-01T00:00:00,INFO,all systems nominal\n" * 2000
+
+class TestEncodingNegotiation:
+    """Test Accept-Encoding parsing and type selection."""
+
+    def test_acceptable_encodings(self):
+        """Test q-values, wildcards and server preference order."""
+        assert ts_server.acceptable_encodings('gzip') == ['gzip']
+        assert ts_server.acceptable_encodings('gzip, deflate, br, zstd') == ['zstd', 'br', 'gzip']
+        assert ts_server.acceptable_encodings('gzip;q=1.0, zstd;q=0.5') == ['gzip', 'zstd']
+        assert ts_server.acceptable_encodings('*;q=0.1, gzip;q=0') == ['zstd', 'br']
+        assert ts_server.acceptable_encodings('identity') == []
+        assert ts_server.acceptable_encodings(None) == []
+
+    def test_compressible_types(self):
+        """Test that already-compressed types are skipped."""
+        assert ts_server.is_compressible('text/csv')
+        assert ts_server.is_compressible('application/json')
+        assert ts_server.is_compressible('image/svg+xml')
+        assert not ts_server.is_compressible('image/png')
+        assert not ts_server.is_compressible('application/zip')
+        assert not ts_server.is_compressible('video/mp4')
+        assert not ts_server.is_compressible('application/octet-stream')
+
+class TestCompressionCache:
+    """Test the on-disk cache of compressed variants."""
+
+    def test_builds_once_and_evicts_lru(self, temp_dir):
+        """Test that variants are reused and the oldest is evicted first."""
+        sources = []
+        for i in range(3):
+            path = os.path.join(temp_dir, f"f{i}.txt")
+            with open(path, "wb") as f:
+                f.write(os.urandom(4096))
+            sources.append(open(path, "rb"))
+        try:
+            cache = ts_server.CompressionCache(temp_dir, max_bytes=10000)
+            first = cache.get(sources[0], '"a"', 'gzip')
+            assert gzip.decompress(open(first, "rb").read()) == open(sources[0].name, "rb").read()
+            assert cache.get(sources[0], '"a"', 'gzip') == first
+
+            second = cache.get(sources[1], '"b"', 'gzip')
+            cache.get(sources[0], '"a"', 'gzip')
+            third = cache.get(sources[2], '"c"', 'gzip')
+            assert os.path.exists(first)
+            assert not os.path.exists(second)
+            assert os.path.exists(third)
+            assert cache.total <= 10000
+
+            # A new process picks up the existing entries
+            reloaded = ts_server.CompressionCache(temp_dir, max_bytes=10000)
+            assert reloaded.total == cache.total
+        finally:
+            for source in sources:
+                source.close()
+
+class TestCompressedResponses:
+    """Test Content-Encoding through the running server."""
+
+    @pytest.fixture
+    def base_url(self, running_server, temp_dir):
+        with open(os.path.join(temp_dir, "log.csv"), "wb") as f:
+            f.write(TEXT)
+        return f"http://localhost:{running_server.server_address[1]}"
+
+    def get(self, url, encoding='gzip', **headers):
+        headers['Accept-Encoding'] = encoding
+        return requests.get(url, headers=headers, stream=True)
+
+    def test_gzip_on_the_fly(self, base_url):
+        """Test that a text file is gzipped and revalidates against its variant ETag."""
+        response = self.get(base_url + "/log.csv")
+        body = response.raw.read()
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert response.headers['Content-Length'] == str(len(body))
+        assert response.headers['ETag'].endswith('-gzip"')
+        assert len(body) < len(TEXT) // 10
+        assert gzip.decompress(body) == TEXT
+
+        cached = self.get(base_url + "/log.csv", **{'If-None-Match': response.headers['ETag']})
+        assert cached.status_code == 304
+        assert cached.headers['Vary'] == 'Accept-Encoding'
+
+    def test_identity(self, base_url):
+        """Test that clients without Accept-Encoding get the file as is."""
+        response = self.get(base_url + "/log.csv", encoding='identity')
+        assert 'Content-Encoding' not in response.headers
+        assert response.headers['Vary'] == 'Accept-Encoding'
+        assert response.raw.read() == TEXT
+
+    def test_range_is_not_compressed(self, base_url):
+        """Test that byte ranges address the identity encoding."""
+        response = self.get(base_url + "/log.csv", Range='bytes=0-8')
+        assert response.status_code == 206
+        assert 'Content-Encoding' not in response.headers
+        assert response.raw.read() == b"timestamp"
+
+    def test_precompressed_sibling(self, base_url, temp_dir):
+        """Test that a fresh .gz sibling is served verbatim and a stale one ignored."""
+        sibling = gzip.compress(TEXT, compresslevel=9, mtime=0)
+        with open(os.path.join(temp_dir, "log.csv.gz"), "wb") as f:
+            f.write(sibling)
+        response = self.get(base_url + "/log.csv")
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.raw.read() == sibling
+
+        stat = os.stat(os.path.join(temp_dir, "log.csv"))
+        os.utime(os.path.join(temp_dir, "log.csv.gz"), ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+        response = self.get(base_url + "/log.csv")
+        body = response.raw.read()
+        assert body != sibling
+        assert gzip.decompress(body) == TEXT
+
+    def test_incompressible_and_small_files(self, base_url, temp_dir):
+        """Test that compressed formats and tiny files are sent unencoded."""
+        with open(os.path.join(temp_dir, "photo.png"), "wb") as f:
+            f.write(TEXT)
+        with open(os.path.join(temp_dir, "tiny.txt"), "wb") as f:
+            f.write(b"small")
+        assert 'Content-Encoding' not in self.get(base_url + "/photo.png").headers
+        assert 'Content-Encoding' not in self.get(base_url + "/tiny.txt").headers
+
+    def test_list_is_compressed(self, base_url):
+        """Test that the streamed /list JSON is gzipped on the fly."""
+        response = self.get(base_url + "/list")
+        assert response.headers['Content-Encoding'] == 'gzip'
+        body = zlib.decompress(response.raw.read(), 31)
+        assert b'"log.csv"' in body
@@ -0,0 +1,110 @@
+import pytest
+import os
+import sys
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server", 
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+class TestEtagMatching:
+    """Test validator comparison rules."""
+    
+    def test_weak_comparison(self):
+        """Test If-None-Match style comparison."""
+        assert ts_server.etag_matches('"a"', '"a"')
+        assert ts_server.etag_matches('W/"a"', '"a"')
+        assert ts_server.etag_matches('"x", W/"a"', 'W/"a"')
+        assert ts_server.etag_matches('*', '"a"')
+        assert not ts_server.etag_matches('"b"', '"a"')
+    
+    def test_strong_comparison(self):
+        """Test If-Range style comparison."""
+        assert ts_server.etag_matches('"a"', '"a"', weak=False)
+        assert not ts_server.etag_matches('W/"a"', '"a"', weak=False)
+        assert not ts_server.etag_matches('"a"', 'W/"a"', weak=False)
+
+class TestConditionalRequests:
+    """Test 304 responses through the running server."""
+    
+    @pytest.fixture
+    def base_url(self, running_server, temp_dir):
+        with open(os.path.join(temp_dir, "data.txt"), "w") as f:
+            f.write("version one")
+        return f"http://localhost:{running_server.server_address[1]}"
+    
+    def revalidate(self, url, response):
+        return requests.get(url, headers={'If-None-Match': response.headers['ETag']})
+    
+    def test_file_etag_and_304(self, base_url, temp_dir):
+        """Test that an unchanged file revalidates with 304 and a changed one does not."""
+        url = base_url + "/data.txt"
+        response = requests.get(url)
+        assert response.headers['ETag'].startswith('"')
+        assert response.headers['Cache-Control'] == 'no-cache'
+        assert 'Last-Modified' in response.headers
+        
+        cached = self.revalidate(url, response)
+        assert cached.status_code == 304
+        assert cached.content == b''
+        assert cached.headers['ETag'] == response.headers['ETag']
+        
+        with open(os.path.join(temp_dir, "data.txt"), "w") as f:
+            f.write("version two!")
+        changed = self.revalidate(url, response)
+        assert changed.status_code == 200
+        assert changed.text == "version two!"
+        assert changed.headers['ETag'] != response.headers['ETag']
+    
+    def test_if_modified_since(self, base_url):
+        """Test that If-Modified-Since still works without an ETag."""
+        url = base_url + "/data.txt"
+        response = requests.get(url)
+        cached = requests.get(url, headers={'If-Modified-Since': response.headers['Last-Modified']})
+        assert cached.status_code == 304
+    
+    def test_if_range_with_etag(self, base_url):
+        """Test that If-Range accepts the file's ETag."""
+        url = base_url + "/data.txt"
+        etag = requests.get(url).headers['ETag']
+        response = requests.get(url, headers={'Range': 'bytes=0-6', 'If-Range': etag})
+        assert response.status_code == 206
+        assert response.text == "version"
+        response = requests.get(url, headers={'Range': 'bytes=0-6', 'If-Range': '"stale"'})
+        assert response.status_code == 200
+    
+    def test_list_revalidation(self, base_url, temp_dir):
+        """Test that /list returns 304 until the directory changes."""
+        url = base_url + "/list"
+        response = requests.get(url)
+        assert response.headers['ETag'].startswith('W/"list-')
+        assert self.revalidate(url, response).status_code == 304
+        
+        # A different query is a different representation
+        other = requests.get(url + "?sort=size", headers={'If-None-Match': response.headers['ETag']})
+        assert other.status_code == 200
+        
+        with open(os.path.join(temp_dir, "new.txt"), "w") as f:
+            f.write("new")
+        assert self.revalidate(url, response).status_code == 200
+    
+    def test_upload_page_revalidation(self, base_url):
+        """Test that the upload page carries a stable ETag."""
+        response = requests.get(base_url + "/", headers={'Accept-Encoding': 'identity'})
+        assert response.status_code == 200
+        assert response.headers['Content-Length'] == str(len(response.content))
+        assert self.revalidate(base_url + "/", response).status_code == 200
+        cached = requests.get(base_url + "/", headers={'Accept-Encoding': 'identity',
+                                                       'If-None-Match': response.headers['ETag']})
+        assert cached.status_code == 304
+    
+    def test_api_responses_not_cached(self, base_url):
+        """Test that upload API responses are marked no-store."""
+        response = requests.post(base_url + "/uploads", json={"filename": "a", "size": 1})
+        assert response.headers['Cache-Control'] == 'no-store'
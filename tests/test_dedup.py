@@ -0,0 +1,91 @@
+import pytest
+import os
+import stat
+import sys
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+class TestBlobStore:
+    """Test content-addressed deduplication of upload sinks."""
+
+    def upload(self, temp_dir, blobs, name, content):
+        sink = ts_server.UploadSink(os.path.join(temp_dir, name), "rename", os.path.join(temp_dir, "tmp"), blobs)
+        sink.write(content[:10])
+        sink.write(content[10:])
+        sink.close()
+        return sink
+
+    def test_identical_content_shares_one_inode(self, temp_dir):
+        """Test that a second upload of the same bytes links to the first."""
+        blobs = ts_server.BlobStore(temp_dir)
+        content = os.urandom(100000)
+        assert not self.upload(temp_dir, blobs, "a.bin", content).deduplicated
+        assert self.upload(temp_dir, blobs, "b.bin", content).deduplicated
+        assert not self.upload(temp_dir, blobs, "c.bin", content + b"!").deduplicated
+
+        a, b, c = (os.stat(os.path.join(temp_dir, name)) for name in ("a.bin", "b.bin", "c.bin"))
+        assert a.st_ino == b.st_ino and a.st_nlink == 3
+        assert c.st_ino != a.st_ino
+        with open(os.path.join(temp_dir, "b.bin"), "rb") as f:
+            assert f.read() == content
+        assert os.listdir(os.path.join(temp_dir, "tmp")) == []
+
+        blob = blobs.blob_path(ts_server.hashlib.sha256(content).hexdigest())
+        assert os.path.samefile(blob, os.path.join(temp_dir, "a.bin"))
+        assert os.path.basename(os.path.dirname(blob)) == os.path.basename(blob)[:2]
+        assert not os.stat(blob).st_mode & stat.S_IWUSR
+
+    def test_unused_blobs_are_purged(self, temp_dir):
+        """Test that a blob is removed once no served file links to it."""
+        blobs = ts_server.BlobStore(temp_dir)
+        self.upload(temp_dir, blobs, "a.bin", b"first version of a")
+        self.upload(temp_dir, blobs, "kept.bin", b"kept")
+        self.upload(temp_dir, blobs, "a.bin", b"second version of a")
+        blobs.purge_orphans()
+        digests = sorted(name for prefix in os.listdir(blobs.path)
+                         for name in os.listdir(os.path.join(blobs.path, prefix)))
+        assert digests == sorted(ts_server.hashlib.sha256(content).hexdigest()
+                                 for content in (b"kept", b"second version of a"))
+
+    def test_aborted_upload_adds_no_blob(self, temp_dir):
+        """Test that a failed upload leaves neither a file nor a blob."""
+        blobs = ts_server.BlobStore(temp_dir)
+        sink = ts_server.UploadSink(os.path.join(temp_dir, "a.bin"), "rename", os.path.join(temp_dir, "tmp"), blobs)
+        sink.write(b"cut short")
+        sink.abort()
+        assert not os.path.exists(os.path.join(temp_dir, "a.bin"))
+        assert not os.path.exists(blobs.path)
+
+class TestDedupServer:
+    """Test deduplicated uploads through the running server."""
+
+    @pytest.fixture
+    def base_url(self, start_server):
+        server = start_server(dedup=True)
+        return f"http://localhost:{server.server_address[1]}"
+
+    def test_multipart_and_resumable_uploads_deduplicate(self, base_url, temp_dir):
+        """Test that both upload paths link repeated content and list each name."""
+        content = os.urandom(50000)
+        response = requests.post(base_url + "/", files=[("file", ("one.bin", content)),
+                                                         ("file", ("two.bin", content))])
+        assert response.status_code == 200
+
+        session = requests.post(base_url + "/uploads", json={"filename": "three.bin", "size": len(content)}).json()
+        requests.patch(base_url + "/uploads/" + session['id'], data=content, headers={'Upload-Offset': '0'})
+        assert requests.post(base_url + "/uploads/" + session['id'] + "/finalize").status_code == 200
+
+        inodes = {os.stat(os.path.join(temp_dir, name)).st_ino for name in ("one.bin", "two.bin", "three.bin")}
+        assert len(inodes) == 1
+        assert requests.get(base_url + "/three.bin").content == content
+        assert sorted(entry['name'] for entry in requests.get(base_url + "/list").json()) == \
+            ["one.bin", "three.bin", "two.bin"]
@@ -0,0 +1,162 @@
+import pytest
+import os
+import sys
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server", 
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+@pytest.fixture(params=["inotify", "polling"])
+def index(request, temp_dir):
+    """A DirectoryIndex using inotify where available, and one that polls."""
+    if request.param == "inotify":
+        inotify = ts_server.Inotify()
+        if not inotify.available:
+            pytest.skip("inotify not available")
+        return ts_server.DirectoryIndex(temp_dir, inotify)
+    return ts_server.DirectoryIndex(temp_dir, None)
+
+class TestDirectoryIndex:
+    """Test the cached directory index behind /list."""
+    
+    def test_tracks_creates_and_deletes(self, index, temp_dir):
+        """Test that new and removed files show up on the next lookup."""
+        assert index.items() == []
+        write(os.path.join(temp_dir, "a.txt"), "abc")
+        write(os.path.join(temp_dir, ".hidden"), "secret")
+        os.mkdir(os.path.join(temp_dir, "subdir"))
+        assert [(name, entry.size) for name, entry in index.items()] == [("a.txt", 3)]
+        
+        os.rename(os.path.join(temp_dir, "a.txt"), os.path.join(temp_dir, "b.txt"))
+        assert [name for name, _ in index.items()] == ["b.txt"]
+        
+        os.unlink(os.path.join(temp_dir, "b.txt"))
+        assert index.items() == []
+    
+    def test_tracks_size_changes(self, index, temp_dir):
+        """Test that writes to an existing file update its size."""
+        path = os.path.join(temp_dir, "grow.log")
+        write(path, "x")
+        assert index.lookup("grow.log").size == 1
+        
+        with open(path, "a") as f:
+            f.write("more")
+        index.mark_dirty("grow.log")
+        assert index.lookup("grow.log").size == 5
+    
+    def test_unchanged_directory_is_not_rescanned(self, temp_dir, monkeypatch):
+        """Test that repeated listings are served from memory with inotify."""
+        inotify = ts_server.Inotify()
+        if not inotify.available:
+            pytest.skip("inotify not available")
+        for i in range(50):
+            write(os.path.join(temp_dir, f"f{i}.txt"), "x")
+        index = ts_server.DirectoryIndex(temp_dir, inotify)
+        assert len(index.items()) == 50
+        
+        def fail(*args, **kwargs):
+            raise AssertionError("filesystem touched")
+        monkeypatch.setattr(ts_server.os, "scandir", fail)
+        monkeypatch.setattr(ts_server.os, "stat", fail)
+        generation = index.generation
+        assert len(index.items()) == 50
+        assert index.generation == generation
+    
+    def test_directory_removed(self, temp_dir):
+        """Test that a vanished directory raises rather than serving stale data."""
+        path = os.path.join(temp_dir, "gone")
+        os.mkdir(path)
+        write(os.path.join(path, "a.txt"), "abc")
+        index = ts_server.get_directory_index(path)
+        assert len(index.items()) == 1
+        
+        os.unlink(os.path.join(path, "a.txt"))
+        os.rmdir(path)
+        with pytest.raises(OSError):
+            index.items()
+
+class TestListQueries:
+    """Test pagination, sorting and filtering of /list."""
+    
+    @pytest.fixture
+    def populated(self, temp_dir):
+        for i in range(25):
+            path = os.path.join(temp_dir, f"file{i:02d}.{'txt' if i % 2 else 'log'}")
+            write(path, "x" * (100 - i))
+            os.utime(path, (1000000 + i, 1000000 + i))
+        return ts_server.DirectoryIndex(temp_dir, None)
+    
+    def collect(self, index, **kwargs):
+        names, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = ts_server.query_directory_index(index, cursor=cursor, **kwargs)
+            names += [name for _, name, _ in rows]
+            pages += 1
+            if cursor is None:
+                return names, pages
+    
+    def test_pages_cover_listing_once(self, populated):
+        """Test that walking the cursors visits every file exactly once."""
+        names, pages = self.collect(populated, limit=10)
+        assert names == sorted(f"file{i:02d}.{'txt' if i % 2 else 'log'}" for i in range(25))
+        assert pages == 3
+    
+    @pytest.mark.parametrize("sort,descending", [("size", False), ("mtime", True), ("name", True)])
+    def test_sorted_pagination(self, populated, sort, descending):
+        """Test that each sort order paginates consistently."""
+        paged, _ = self.collect(populated, sort=sort, descending=descending, limit=7)
+        whole, _ = self.collect(populated, sort=sort, descending=descending)
+        assert paged == whole
+        assert len(whole) == 25
+        if sort == "size":
+            assert whole[0] == "file24.log"
+        if sort == "mtime":
+            assert whole[0] == "file24.log"
+    
+    def test_prefix_and_glob_filters(self, populated):
+        """Test prefix and glob filtering."""
+        names, _ = self.collect(populated, prefix="file1", limit=3)
+        assert names == [f"file1{i}.{'txt' if i % 2 else 'log'}" for i in range(10)]
+        names, _ = self.collect(populated, pattern="*.txt", sort="size", limit=4)
+        assert len(names) == 12 and all(name.endswith(".txt") for name in names)
+    
+    def test_invalid_cursor(self, populated):
+        """Test that garbage and mismatched cursors are rejected."""
+        with pytest.raises(ValueError):
+            ts_server.query_directory_index(populated, cursor="!!!")
+        _, cursor = ts_server.query_directory_index(populated, limit=1)
+        with pytest.raises(ValueError):
+            ts_server.query_directory_index(populated, sort="size", cursor=cursor)
+    
+    def test_list_endpoint(self, running_server, populated):
+        """Test the paginated /list endpoint over HTTP."""
+        import requests
+        base = f"http://localhost:{running_server.server_address[1]}"
+        
+        response = requests.get(base + "/list")
+        assert response.status_code == 200
+        assert len(response.json()) == 25
+        assert 'X-Next-Cursor' not in response.headers
+        
+        response = requests.get(base + "/list", params={"sort": "size", "limit": 10})
+        page = response.json()
+        assert [f['size'] for f in page] == list(range(76, 86))
+        assert response.links['next']['url'].startswith('/list?')
+        
+        response = requests.get(base + "/list", params={"sort": "size", "limit": 10,
+                                                        "cursor": response.headers['X-Next-Cursor']})
+        assert [f['size'] for f in response.json()] == list(range(86, 96))
+        
+        assert requests.get(base + "/list", params={"sort": "colour"}).status_code == 400
+        assert requests.get(base + "/list", params={"limit": "x"}).status_code == 400
+        assert requests.get(base + "/list", params={"cursor": "x"}).status_code == 400
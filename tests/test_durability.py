@@ -0,0 +1,162 @@
+import pytest
+import os
+import sys
+import threading
+import time
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+class TestUploadSink:
+    """Test the temp file and rename pipeline of UploadSink."""
+
+    @pytest.fixture(params=["rename", "fsync", "group"])
+    def durability(self, request):
+        return request.param
+
+    def test_file_appears_only_when_complete(self, temp_dir, durability):
+        """Test that the final name only ever holds a complete upload."""
+        path = os.path.join(temp_dir, "a.bin")
+        temp_path = os.path.join(temp_dir, "tmp")
+        sink = ts_server.UploadSink(path, durability, temp_path)
+        sink.write(b"x" * 1000)
+        assert not os.path.exists(path)
+        assert len(os.listdir(temp_path)) == 1
+        sink.write(b"y" * 1000)
+        sink.close()
+        with open(path, "rb") as f:
+            assert f.read() == b"x" * 1000 + b"y" * 1000
+        assert os.listdir(temp_path) == []
+
+    def test_failed_upload_keeps_previous_file(self, temp_dir, durability):
+        """Test that an aborted upload leaves an existing file untouched."""
+        path = os.path.join(temp_dir, "a.bin")
+        with open(path, "wb") as f:
+            f.write(b"original")
+        sink = ts_server.UploadSink(path, durability, os.path.join(temp_dir, "tmp"))
+        sink.write(b"replacement, cut short")
+        sink.abort()
+        with open(path, "rb") as f:
+            assert f.read() == b"original"
+        assert os.listdir(os.path.join(temp_dir, "tmp")) == []
+
+    def test_same_name_uploads_do_not_interleave(self, temp_dir, durability):
+        """Test that concurrent uploads of one name end with one of them whole."""
+        path = os.path.join(temp_dir, "a.bin")
+        sinks = [ts_server.UploadSink(path, durability, os.path.join(temp_dir, "tmp")) for _ in range(2)]
+        for _ in range(100):
+            sinks[0].write(b"a" * 100)
+            sinks[1].write(b"b" * 100)
+        for sink in sinks:
+            sink.close()
+        with open(path, "rb") as f:
+            assert f.read() == b"b" * 10000
+
+    def test_none_writes_in_place(self, temp_dir):
+        """Test that durability 'none' writes straight to the final name."""
+        path = os.path.join(temp_dir, "a.bin")
+        sink = ts_server.UploadSink(path, "none")
+        sink.write(b"partial")
+        sink.file.flush()
+        with open(path, "rb") as f:
+            assert f.read() == b"partial"
+        sink.abort()
+        assert not os.path.exists(path)
+
+    def test_stale_temp_files_are_purged(self, temp_dir):
+        """Test that temp files abandoned by a crash are removed, recent ones kept."""
+        temp_path = os.path.join(temp_dir, ts_server.STATE_DIR_NAME, "tmp")
+        os.makedirs(temp_path)
+        for name in ("upload-old.tmp", "upload-new.tmp"):
+            open(os.path.join(temp_path, name), "wb").close()
+        old = time.time() - ts_server.UPLOAD_TEMP_TTL - 60
+        os.utime(os.path.join(temp_path, "upload-old.tmp"), (old, old))
+        ts_server.ResumableUploadStore(temp_dir)
+        assert os.listdir(temp_path) == ["upload-new.tmp"]
+
+class TestGroupCommitter:
+    """Test batching of filesystem syncs."""
+
+    def test_concurrent_syncs_share_one_call(self, temp_dir):
+        """Test that callers arriving during a sync are covered by the next one."""
+        calls = []
+        def slow_syncfs(fd):
+            calls.append(fd)
+            time.sleep(0.1)
+        committer = ts_server.GroupCommitter(syncfs=slow_syncfs)
+        with open(os.path.join(temp_dir, "a"), "wb") as f:
+            threads = [threading.Thread(target=committer.sync, args=(f.fileno(),)) for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert committer.finished == committer.started == len(calls)
+        assert 1 <= len(calls) <= 3
+
+    def test_sync_waits_for_a_later_sync(self, temp_dir):
+        """Test that a caller does not return on a sync that began before it."""
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        def syncfs(fd):
+            calls.append(fd)
+            if len(calls) == 1:
+                started.set()
+                release.wait(5)
+        committer = ts_server.GroupCommitter(syncfs=syncfs)
+        with open(os.path.join(temp_dir, "a"), "wb") as f:
+            first = threading.Thread(target=committer.sync, args=(f.fileno(),))
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=committer.sync, args=(f.fileno(),))
+            second.start()
+            time.sleep(0.1)
+            release.set()
+            first.join()
+            second.join()
+        assert len(calls) == 2
+
+    def test_failed_syncfs_falls_back_to_fsync(self, temp_dir):
+        """Test that a syncfs error switches to fsyncing each file."""
+        def broken_syncfs(fd):
+            raise OSError(5, "Input/output error")
+        committer = ts_server.GroupCommitter(syncfs=broken_syncfs)
+        with open(os.path.join(temp_dir, "a"), "wb") as f:
+            committer.sync(f.fileno())
+            committer.sync(f.fileno())
+        assert committer.syncfs is None
+        assert committer.syncs == 1
+
+class TestDurableUploads:
+    """Test uploads through the running server in each durability mode."""
+
+    @pytest.fixture(params=ts_server.DURABILITY_MODES)
+    def base_url(self, request, start_server):
+        server = start_server(durability=request.param)
+        return f"http://localhost:{server.server_address[1]}"
+
+    def test_multipart_and_resumable_uploads(self, base_url, temp_dir):
+        """Test that both upload paths land the file and leave no temp files."""
+        response = requests.post(base_url + "/", files={"file": ("form.bin", b"f" * 5000)})
+        assert response.status_code == 200
+        with open(os.path.join(temp_dir, "form.bin"), "rb") as f:
+            assert f.read() == b"f" * 5000
+
+        session = requests.post(base_url + "/uploads", json={"filename": "resumed.bin", "size": 3}).json()
+        requests.patch(base_url + "/uploads/" + session['id'], data=b"abc", headers={'Upload-Offset': '0'})
+        assert requests.post(base_url + "/uploads/" + session['id'] + "/finalize").status_code == 200
+        with open(os.path.join(temp_dir, "resumed.bin"), "rb") as f:
+            assert f.read() == b"abc"
+
+        temp_path = os.path.join(temp_dir, ts_server.STATE_DIR_NAME, "tmp")
+        assert not os.path.exists(temp_path) or os.listdir(temp_path) == []
+        assert sorted(entry['name'] for entry in requests.get(base_url + "/list").json()) == \
+            ["form.bin", "resumed.bin"]
@@ -3,6 +3,7 @@ import os
 import json
 import tempfile
 import io
+import socket
 import sys
 
 # Add the parent directory to the path so we can import ts-server
@@ -151,4 +152,65 @@ class TestFunctionality:
         handler_with_auth = ts_server.AuthHandler(None, None, None, use_auth=True, password='test123')
         assert handler_with_auth.use_auth == True
         assert handler_with_auth.password == 'test123'
-        assert handler_with_auth.username == 'user'
\ No newline at end of file
+        assert handler_with_auth.username == 'user'
+
+    def test_send_file_range_userspace_fallback(self, temp_dir):
+        """Test the buffered copy used when the output is not a plain socket."""
+        content = os.urandom(3 * 1024 * 1024 + 17)
+        path = os.path.join(temp_dir, "data.bin")
+        with open(path, "wb") as f:
+            f.write(content)
+
+        output = io.BytesIO()
+        with open(path, "rb") as source:
+            sent = ts_server.send_file_range(output, source, 1000, len(content) - 2000)
+
+        assert sent == len(content) - 2000
+        assert output.getvalue() == content[1000:-1000]
+
+    def test_file_download_uses_sendfile(self, running_server, temp_dir, monkeypatch):
+        """Test that file bodies and ranges go out through socket.sendfile()."""
+        import requests
+        content = os.urandom(2 * 1024 * 1024)
+        with open(os.path.join(temp_dir, "download.bin"), "wb") as f:
+            f.write(content)
+        port = running_server.server_address[1]
+
+        calls = []
+        sendfile = socket.socket.sendfile
+        def recording_sendfile(sock, file, offset=0, count=None):
+            calls.append((offset, count))
+            return sendfile(sock, file, offset, count)
+        monkeypatch.setattr(socket.socket, "sendfile", recording_sendfile)
+
+        response = requests.get(f"http://localhost:{port}/download.bin")
+        assert response.status_code == 200
+        assert response.content == content
+        assert calls == [(0, len(content))]
+
+        response = requests.get(f"http://localhost:{port}/download.bin", headers={'Range': 'bytes=1000-2999'})
+        assert response.status_code == 206
+        assert response.content == content[1000:3000]
+        assert calls[1:] == [(1000, 2000)]
+
+    def test_upload_page_assets(self, running_server):
+        """Test that the page loads its prebuilt assets locally with long-lived caching."""
+        import re
+        import gzip
+        import requests
+        base_url = f"http://localhost:{running_server.server_address[1]}"
+
+        page = requests.get(base_url + "/")
+        assert page.headers['Content-Encoding'] == 'gzip'
+        assert 'cdnjs' not in page.text
+        assert '<symbol id="icon-copy"' in page.text
+
+        urls = re.findall(r'(?:href|src)="(/\.ts-server/static/app\.[0-9a-f]{16}\.(?:css|js))"', page.text)
+        assert len(urls) == 2
+        for url in urls:
+            response = requests.get(base_url + url, headers={'Accept-Encoding': 'gzip'}, stream=True)
+            assert response.status_code == 200
+            assert response.headers['Cache-Control'] == 'max-age=31536000, immutable'
+            body = gzip.decompress(response.raw.read())
+            assert body == ts_server.STATIC_ASSETS[url].body
+        assert requests.get(base_url + "/.ts-server/static/app.0000000000000000.css").status_code == 404
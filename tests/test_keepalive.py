@@ -0,0 +1,191 @@
+import pytest
+import os
+import sys
+import socket
+import threading
+import time
+import http.client
+from http.server import ThreadingHTTPServer
+from functools import partial
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+AUTH = {'Authorization': 'Basic dXNlcjp0ZXN0MTIz'}
+
+class IgnoresBodyHandler(ts_server.AuthHandler):
+    """A handler that answers POSTs without reading their body."""
+
+    def do_POST(self):
+        self.send_response(204)
+        self.end_headers()
+
+class TestKeepAlive:
+    """Test HTTP/1.1 persistent connections."""
+
+    @pytest.fixture(params=["threading", "asyncio"])
+    def make_server(self, request, temp_dir):
+        with open(os.path.join(temp_dir, "a.txt"), "w") as f:
+            f.write("kept alive")
+        servers = []
+        def _create(handler_class=ts_server.AuthHandler, **kwargs):
+            handler = partial(handler_class, use_auth=True, password="test123", **kwargs)
+            if request.param == "asyncio":
+                server = ts_server.AsyncioHTTPServer(('localhost', 0), handler, max_workers=4)
+            else:
+                server = ThreadingHTTPServer(('localhost', 0), handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+            return server
+        yield _create
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    def connect(self, server):
+        conn = http.client.HTTPConnection('localhost', server.server_address[1], timeout=5)
+        conn.connect()
+        return conn
+
+    def get(self, conn, path, headers=AUTH, **kwargs):
+        conn.request(kwargs.pop('method', 'GET'), path, headers=headers, **kwargs)
+        response = conn.getresponse()
+        return response, response.read()
+
+    def test_routes_share_one_connection(self, make_server):
+        """Test that page, assets, files, listings, 401s and 304s reuse the connection."""
+        conn = self.connect(make_server())
+        sock = conn.sock
+        try:
+            response, body = self.get(conn, "/", headers={})
+            assert response.status == 401
+            assert body == b'Authentication required'
+
+            response, page = self.get(conn, "/", headers=dict(AUTH, **{'Accept-Encoding': 'identity'}))
+            assert response.status == 200
+            response, _ = self.get(conn, "/", headers=dict(AUTH, **{
+                'Accept-Encoding': 'identity', 'If-None-Match': response.getheader('ETag')}))
+            assert response.status == 304
+
+            response, body = self.get(conn, "/a.txt")
+            assert body == b"kept alive"
+
+            response, body = self.get(conn, "/a.txt", headers=dict(AUTH, Range='bytes=100-'))
+            assert response.status == 416
+
+            response, body = self.get(conn, "/list")
+            assert response.getheader('Transfer-Encoding') == 'chunked'
+            assert b'"a.txt"' in body
+
+            response, body = self.get(conn, "/list", method='HEAD')
+            assert response.status == 200
+            assert body == b''
+
+            assert conn.sock is sock
+            assert not response.will_close
+        finally:
+            conn.close()
+
+    def test_error_closes_connection(self, make_server):
+        """Test that error responses and unread bodies end the connection."""
+        server = make_server()
+        conn = self.connect(server)
+        try:
+            response, _ = self.get(conn, "/missing.txt")
+            assert response.status == 404
+            assert response.getheader('Connection') == 'close'
+        finally:
+            conn.close()
+
+        conn = self.connect(server)
+        try:
+            response, _ = self.get(conn, "/uploads/abc", method='PUT', headers={}, body=b"x" * 100)
+            assert response.status == 401
+            assert response.getheader('Connection') == 'close'
+        finally:
+            conn.close()
+
+    def test_unread_body_is_not_a_request(self, make_server):
+        """Test that a POST body the handler leaves unread is never parsed as the next request."""
+        server = make_server(handler_class=IgnoresBodyHandler)
+        smuggled = b"GET /missing.txt HTTP/1.1\r\nHost: localhost\r\n\r\n"
+        conn = self.connect(server)
+        sock = conn.sock
+        try:
+            response, _ = self.get(conn, "/", method='POST', body=smuggled)
+            assert response.status == 204
+            assert not response.will_close
+            response, body = self.get(conn, "/a.txt")
+            assert response.status == 200 and body == b"kept alive"
+            assert conn.sock is sock
+        finally:
+            conn.close()
+
+        conn = self.connect(server)
+        try:
+            body = smuggled + b"x" * (ts_server.MAX_DRAINED_BODY + 1)
+            response, _ = self.get(conn, "/", method='POST', body=body)
+            assert response.status == 204
+            assert response.getheader('Connection') == 'close'
+        finally:
+            conn.close()
+
+    def test_max_requests(self, make_server):
+        """Test that the last allowed request is answered with Connection: close."""
+        conn = self.connect(make_server(max_requests=3))
+        try:
+            for _ in range(2):
+                response, _ = self.get(conn, "/a.txt")
+                assert not response.will_close
+            response, _ = self.get(conn, "/a.txt")
+            assert response.getheader('Connection') == 'close'
+            assert conn.sock is None or conn.sock.recv(1) == b''
+        finally:
+            conn.close()
+
+    def test_idle_timeout(self, make_server):
+        """Test that an idle connection is closed after keepalive_timeout."""
+        conn = self.connect(make_server(keepalive_timeout=0.3))
+        try:
+            self.get(conn, "/a.txt")
+            start = time.monotonic()
+            assert conn.sock.recv(1) == b''
+            assert time.monotonic() - start < 3
+        finally:
+            conn.close()
+
+    def test_http10_client(self, make_server):
+        """Test that HTTP/1.0 clients get a streamed listing ended by closing."""
+        server = make_server()
+        with socket.create_connection(server.server_address) as sock:
+            sock.sendall(b"GET /list HTTP/1.0\r\nAuthorization: Basic dXNlcjp0ZXN0MTIz\r\n\r\n")
+            response = b''
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                response += data
+        head, body = response.split(b'\r\n\r\n', 1)
+        assert b'Transfer-Encoding' not in head
+        assert b'Connection: close' in head
+        assert b'"a.txt"' in body
+
+    def test_reused_requests_do_not_stall(self, make_server):
+        """Test that responses on a reused connection are not held back by Nagle."""
+        conn = self.connect(make_server())
+        try:
+            self.get(conn, "/a.txt")
+            start = time.monotonic()
+            for _ in range(20):
+                self.get(conn, "/a.txt")
+                self.get(conn, "/list")
+            assert time.monotonic() - start < 0.5
+        finally:
+            conn.close()
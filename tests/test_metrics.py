@@ -0,0 +1,107 @@
+import pytest
+import gc
+import os
+import sys
+import threading
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+AUTH = ('user', 'test123')
+
+def parse(text):
+    """Return {series: value} from the Prometheus text format."""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            series, value = line.rsplit(' ', 1)
+            samples[series] = float(value)
+    return samples
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = ts_server.Metrics()
+    monkeypatch.setattr(ts_server, "METRICS", metrics)
+    return metrics
+
+class TestMetrics:
+    """Test the sharded metrics registry and its exposition format."""
+
+    def test_counters_and_histograms(self, metrics):
+        """Test that values from every thread are summed into cumulative buckets."""
+        def work():
+            for _ in range(1000):
+                metrics.inc('ts_server_requests_total', labels=(('route', 'list'), ('method', 'GET'), ('status', '200')))
+            metrics.observe('ts_server_request_duration_seconds', 0.003, (('route', 'list'),))
+            metrics.observe('ts_server_request_duration_seconds', 100, (('route', 'list'),))
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        samples = parse(metrics.render())
+        assert samples['ts_server_requests_total{route="list",method="GET",status="200"}'] == 8000
+        assert samples['ts_server_request_duration_seconds_bucket{route="list",le="0.0025"}'] == 0
+        assert samples['ts_server_request_duration_seconds_bucket{route="list",le="0.005"}'] == 8
+        assert samples['ts_server_request_duration_seconds_bucket{route="list",le="60.0"}'] == 8
+        assert samples['ts_server_request_duration_seconds_bucket{route="list",le="+Inf"}'] == 16
+        assert samples['ts_server_request_duration_seconds_count{route="list"}'] == 16
+        assert samples['ts_server_request_duration_seconds_sum{route="list"}'] == pytest.approx(8 * 100.003)
+
+        # Shards of finished threads are folded into the totals
+        gc.collect()
+        assert not metrics.shards or list(metrics.shards) == [id(metrics.local.shard)]
+        assert '# TYPE ts_server_upload_size_bytes histogram' in metrics.render()
+
+    def test_label_escaping(self, metrics):
+        """Test that label values are escaped."""
+        metrics.inc('ts_server_auth_failures_total', labels=(('reason', 'a"b\\c\nd'),))
+        assert 'ts_server_auth_failures_total{reason="a\\"b\\\\c\\nd"} 1' in metrics.render()
+
+class TestMetricsEndpoint:
+    """Test /metrics through the running server."""
+
+    @pytest.fixture
+    def base_url(self, start_server, engine, metrics):
+        server = start_server(engine, use_auth=True, password="test123")
+        return f"http://localhost:{server.server_address[1]}"
+
+    def test_requests_are_counted(self, base_url, temp_dir):
+        """Test request, byte, upload, auth failure and disk write metrics."""
+        with open(os.path.join(temp_dir, "a.txt"), "wb") as f:
+            f.write(os.urandom(10000))
+        assert requests.get(base_url + "/metrics").status_code == 401
+        session = requests.Session()
+        session.auth = AUTH
+        session.get(base_url + "/")
+        session.get(base_url + "/a.txt")
+        session.get(base_url + "/missing.txt")
+        session.post(base_url + "/", files={"file": ("up.bin", b"u" * 5000)})
+        requests.get(base_url + "/list", auth=('user', 'wrong'))
+
+        response = session.get(base_url + "/metrics")
+        assert response.status_code == 200
+        assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+        samples = parse(response.text)
+        assert samples['ts_server_requests_total{route="page",method="GET",status="200"}'] == 1
+        assert samples['ts_server_requests_total{route="file",method="GET",status="200"}'] == 1
+        assert samples['ts_server_requests_total{route="file",method="GET",status="404"}'] == 1
+        assert samples['ts_server_requests_total{route="upload",method="POST",status="200"}'] == 1
+        assert samples['ts_server_request_duration_seconds_count{route="file"}'] == 2
+        assert samples['ts_server_auth_failures_total{reason="missing"}'] == 1
+        assert samples['ts_server_auth_failures_total{reason="invalid"}'] == 1
+        assert samples['ts_server_upload_size_bytes_bucket{path="multipart",le="4096.0"}'] == 0
+        assert samples['ts_server_upload_size_bytes_bucket{path="multipart",le="16384.0"}'] == 1
+        assert samples['ts_server_disk_write_seconds_count{op="commit"}'] == 1
+        assert samples['ts_server_received_bytes_total'] > 5000
+        assert samples['ts_server_sent_bytes_total'] > 10000
+        assert samples['ts_server_active_connections'] >= 1
+        assert samples['ts_server_threads'] >= 2
@@ -93,4 +93,93 @@ Empty filename content\r
         
         files = ts_server.parse_multipart_form_data(test_data, boundary)
         
-        assert len(files) == 0
\ No newline at end of file
+        assert len(files) == 0
+
+class TestStreamingMultipartParsing:
+    """Test the incremental multipart parser used for uploads."""
+
+    BOUNDARY = "----WebKitFormBoundary7MA4YWxkTrZu0gW"
+
+    def build_body(self, parts):
+        body = b""
+        for filename, content in parts:
+            body += (b"--" + self.BOUNDARY.encode() + b"\r\n"
+                     b'Content-Disposition: form-data; name="file"; filename="'
+                     + filename.encode() + b'"\r\n'
+                     b"Content-Type: application/octet-stream\r\n\r\n"
+                     + content + b"\r\n")
+        return body + b"--" + self.BOUNDARY.encode() + b"--\r\n"
+
+    def test_content_with_trailing_dashes_and_newlines_preserved(self):
+        """Test that part content is not trimmed at the boundary."""
+        content = b"line one\r\n--not a boundary--\r\n-"
+        files = ts_server.parse_multipart_form_data(
+            self.build_body([("data.bin", content)]), self.BOUNDARY)
+
+        assert files == [{'filename': 'data.bin', 'content': content}]
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64, 4096])
+    def test_boundaries_split_across_chunks(self, chunk_size):
+        """Test that boundaries are found when split across chunk edges."""
+        parts = [("a.bin", bytes(range(256)) * 40), ("b.txt", b"\r\n" * 300)]
+        body = self.build_body(parts)
+        received = {}
+
+        class Sink:
+            def __init__(self, name):
+                self.name = name
+                received[name] = bytearray()
+
+            def write(self, data):
+                received[self.name] += data
+
+            def close(self):
+                pass
+
+        parser = ts_server.MultipartParser(self.BOUNDARY, Sink)
+        for i in range(0, len(body), chunk_size):
+            parser.feed(body[i:i + chunk_size])
+        parser.close()
+
+        assert received == {name: bytearray(content) for name, content in parts}
+        assert [f['size'] for f in parser.files] == [len(c) for _, c in parts]
+
+    def test_stream_writes_parts_to_disk(self, temp_dir):
+        """Test streaming a body from a file object into UploadSink files."""
+        import io
+        content = os.urandom(1024 * 1024)
+        body = self.build_body([("big.bin", content)])
+
+        files = ts_server.stream_multipart_form_data(
+            io.BytesIO(body), self.BOUNDARY, len(body),
+            lambda name: ts_server.UploadSink(os.path.join(temp_dir, name)),
+            chunk_size=1000)
+
+        assert files == [{'filename': 'big.bin', 'size': len(content)}]
+        with open(os.path.join(temp_dir, "big.bin"), "rb") as f:
+            assert f.read() == content
+
+    def test_stream_truncated_body_removes_partial_file(self, temp_dir):
+        """Test that a truncated upload raises and leaves no partial file behind."""
+        import io
+        body = self.build_body([("cut.bin", b"x" * 10000)])[:5000]
+
+        with pytest.raises(ts_server.MultipartError):
+            ts_server.stream_multipart_form_data(
+                io.BytesIO(body), self.BOUNDARY, len(body) + 100,
+                lambda name: ts_server.UploadSink(os.path.join(temp_dir, name)))
+
+        assert not os.path.exists(os.path.join(temp_dir, "cut.bin"))
+
+    def test_upload_over_http(self, running_server, temp_dir):
+        """Test a full upload through the running server."""
+        import requests
+        port = running_server.server_address[1]
+        content = os.urandom(300 * 1024)
+
+        response = requests.post(f"http://localhost:{port}/",
+                                 files={"file": ("upload.bin", content)})
+
+        assert response.status_code == 200
+        with open(os.path.join(temp_dir, "upload.bin"), "rb") as f:
+            assert f.read() == content
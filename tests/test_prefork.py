@@ -0,0 +1,108 @@
+import pytest
+import os
+import sys
+import signal
+import socket
+import subprocess
+import time
+import requests
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py")
+
+# Runs a prefork server in its own process, so forking does not copy the
+# test runner's threads
+PREFORK_MAIN = """
+import importlib.util, sys
+from functools import partial
+spec = importlib.util.spec_from_file_location("ts_server", sys.argv[1])
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+handler = partial(ts_server.AuthHandler, use_auth=True, password="shared-secret")
+factory = partial(ts_server.make_server, handler=handler, engine=sys.argv[2])
+server = ts_server.PreforkServer(("127.0.0.1", 0), factory, workers=2)
+print(server.server_address[1], flush=True)
+try:
+    server.serve_forever()
+finally:
+    server.server_close()
+"""
+
+def worker_pids(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return set(int(child) for child in f.read().split())
+
+def is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+def accepts_connections(port):
+    try:
+        socket.create_connection(("127.0.0.1", port)).close()
+        return True
+    except OSError:
+        return False
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+@pytest.mark.skipif(not hasattr(os, "fork") or not os.path.exists("/proc/self/task"),
+                    reason="prefork workers need fork() and /proc")
+class TestPrefork:
+    """Test the multi-process prefork mode."""
+
+    @pytest.fixture(params=["threading", "asyncio"])
+    def supervisor(self, request, temp_dir):
+        with open(os.path.join(temp_dir, "shared.txt"), "w") as f:
+            f.write("served by a worker")
+        process = subprocess.Popen([sys.executable, "-c", PREFORK_MAIN, SERVER_SCRIPT, request.param],
+                                   cwd=temp_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        process.port = int(process.stdout.readline())
+        assert wait_for(lambda: len(worker_pids(process.pid)) == 2)
+        assert wait_for(lambda: accepts_connections(process.port))
+        yield process
+        if process.poll() is None:
+            process.terminate()
+            process.wait(10)
+
+    def test_workers_share_port_and_password(self, supervisor):
+        """Test that every worker serves the port with the same credentials."""
+        url = f"http://127.0.0.1:{supervisor.port}/shared.txt"
+        for _ in range(20):
+            assert requests.get(url).status_code == 401
+            response = requests.get(url, auth=('user', 'shared-secret'))
+            assert response.text == "served by a worker"
+
+    def test_crashed_worker_is_restarted(self, supervisor):
+        """Test that the supervisor replaces a worker that dies."""
+        before = worker_pids(supervisor.pid)
+        victim = before.pop()
+        os.kill(victim, signal.SIGKILL)
+        assert wait_for(lambda: len(worker_pids(supervisor.pid)) == 2 and
+                        victim not in worker_pids(supervisor.pid))
+        url = f"http://127.0.0.1:{supervisor.port}/shared.txt"
+        for _ in range(10):
+            assert requests.get(url, auth=('user', 'shared-secret')).status_code == 200
+
+    def test_sigterm_stops_workers(self, supervisor):
+        """Test that stopping the supervisor stops its workers."""
+        workers = worker_pids(supervisor.pid)
+        supervisor.send_signal(signal.SIGTERM)
+        supervisor.wait(10)
+        for pid in workers:
+            assert wait_for(lambda: not is_running(pid))
+
+    def test_workers_exit_with_killed_supervisor(self, supervisor):
+        """Test that workers do not outlive a supervisor that was killed."""
+        workers = worker_pids(supervisor.pid)
+        supervisor.kill()
+        supervisor.wait(10)
+        for pid in workers:
+            assert wait_for(lambda: not is_running(pid))
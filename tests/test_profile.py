@@ -0,0 +1,118 @@
+import pytest
+import marshal
+import os
+import pstats
+import sys
+import time
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+def slow_work():
+    time.sleep(0.1)
+
+class TestRequestProfiler:
+    """Test request sampling and the aggregated profile."""
+
+    def test_routes_and_rate_select_requests(self):
+        """Test that named routes are always sampled and others by rate."""
+        profiler = ts_server.RequestProfiler(0, ("list",))
+        assert profiler.start("file") is None
+        profile = profiler.start("list")
+        assert profile is not None
+        profiler.finish(profile)
+        assert profiler.requests == 1
+
+        profiler = ts_server.RequestProfiler(1.0)
+        for route in ("file", "page"):
+            profiler.finish(profiler.start(route))
+        assert profiler.requests == 2
+
+    def test_one_at_a_time_counts_skips(self, monkeypatch):
+        """Test that a request sampled while another is profiled is skipped and counted."""
+        metrics = ts_server.Metrics()
+        monkeypatch.setattr(ts_server, "METRICS", metrics)
+        profiler = ts_server.RequestProfiler(0, ("upload",), one_at_a_time=True)
+        profile = profiler.start("upload")
+        assert profile is not None
+        assert profiler.start("upload") is None
+        profiler.finish(profile)
+        profiler.finish(profiler.start("upload"))
+
+        assert profiler.requests == 2 and profiler.skipped == 1
+        assert profiler.report().startswith("2 requests profiled in process %d, 1 skipped" % os.getpid())
+        assert metrics.snapshot()[("ts_server_profile_skipped_total", ())] == 1
+
+    def test_report_formats(self, temp_dir):
+        """Test the pstats totals, the sampled stacks and dumping both."""
+        profiler = ts_server.RequestProfiler(0, ("upload",))
+        profile = profiler.start("upload")
+        slow_work()
+        profiler.finish(profile)
+
+        assert profiler.report().startswith("1 requests profiled")
+        assert "slow_work" in profiler.report()
+        functions = {name for _, _, name in marshal.loads(profiler.pstats_data())}
+        assert "slow_work" in functions
+        stacks = profiler.collapsed().splitlines()
+        assert stacks
+        for line in stacks:
+            stack, count = line.rsplit(" ", 1)
+            assert stack.startswith("upload;") and int(count) > 0
+        assert any("slow_work (test_profile.py" in line for line in stacks)
+
+        pstats_path, collapsed_path = profiler.dump(temp_dir)
+        assert os.path.dirname(pstats_path) == os.path.join(temp_dir, ".ts-server", "profile")
+        pstats.Stats(pstats_path)
+        with open(collapsed_path) as f:
+            assert f.read() == profiler.collapsed()
+
+        profiler.reset()
+        assert profiler.requests == 0 and profiler.collapsed() == ""
+
+class TestProfileEndpoint:
+    """Test GET /profile through the running server."""
+
+    @pytest.fixture
+    def base_url(self, start_server):
+        profiler = ts_server.RequestProfiler(0, ("upload",))
+        server = start_server(use_auth=True, password="test123", profiler=profiler)
+        return f"http://localhost:{server.server_address[1]}"
+
+    def test_profile_endpoint(self, base_url, temp_dir):
+        """Test that profiled uploads are reported in each format."""
+        session = requests.Session()
+        session.auth = ('user', 'test123')
+        assert requests.get(base_url + "/profile").status_code == 401
+        for i in range(3):
+            session.post(base_url + "/", files={"file": (f"up{i}.bin", os.urandom(100000))})
+        session.get(base_url + "/list")
+
+        response = session.get(base_url + "/profile")
+        assert response.status_code == 200
+        assert response.text.startswith("3 requests profiled")
+        assert "stream_multipart_form_data" in response.text
+        assert session.get(base_url + "/profile?sort=tottime").status_code == 200
+        assert session.get(base_url + "/profile?sort=nonsense").status_code == 400
+        assert session.get(base_url + "/profile?format=svg").status_code == 400
+
+        response = session.get(base_url + "/profile?format=pstats&reset=1")
+        assert "attachment" in response.headers["Content-Disposition"]
+        path = os.path.join(temp_dir, "upload.pstats")
+        with open(path, "wb") as f:
+            f.write(response.content)
+        assert any(name == "do_POST" for _, _, name in pstats.Stats(path).stats)
+        assert session.get(base_url + "/profile").text.startswith("0 requests profiled")
+
+    def test_profile_needs_profiler(self, start_server):
+        """Test that without --profile /profile is just a path."""
+        server = start_server()
+        assert requests.get(f"http://localhost:{server.server_address[1]}/profile").status_code == 404
@@ -0,0 +1,118 @@
+import pytest
+import os
+import sys
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server", 
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+class TestRangeParsing:
+    """Test parsing of the Range request header."""
+    
+    def test_single_ranges(self):
+        """Test closed, open-ended and suffix ranges."""
+        assert ts_server.parse_range_header("bytes=0-99", 1000) == [(0, 99)]
+        assert ts_server.parse_range_header("bytes=900-", 1000) == [(900, 999)]
+        assert ts_server.parse_range_header("bytes=-100", 1000) == [(900, 999)]
+        assert ts_server.parse_range_header("bytes=-5000", 1000) == [(0, 999)]
+        assert ts_server.parse_range_header("bytes=990-5000", 1000) == [(990, 999)]
+    
+    def test_multiple_ranges_are_merged(self):
+        """Test that overlapping and adjacent ranges are coalesced."""
+        assert ts_server.parse_range_header("bytes=0-9, 20-29", 100) == [(0, 9), (20, 29)]
+        assert ts_server.parse_range_header("bytes=20-29,0-10,5-19", 100) == [(0, 29)]
+    
+    def test_unsatisfiable(self):
+        """Test that ranges past the end yield an empty list."""
+        assert ts_server.parse_range_header("bytes=1000-", 1000) == []
+        assert ts_server.parse_range_header("bytes=-0", 1000) == []
+        assert ts_server.parse_range_header("bytes=0-", 0) == []
+    
+    def test_malformed_is_ignored(self):
+        """Test that malformed headers return None so the full file is sent."""
+        for header in ["items=0-1", "bytes=", "bytes=a-b", "bytes=5-1", "bytes=1", "bytes=--1"]:
+            assert ts_server.parse_range_header(header, 1000) is None
+        too_many = "bytes=" + ",".join(f"{i * 2}-{i * 2}" for i in range(100))
+        assert ts_server.parse_range_header(too_many, 1000) is None
+
+class TestRangeRequests:
+    """Test partial downloads through the running server."""
+    
+    @pytest.fixture
+    def content(self, temp_dir):
+        data = os.urandom(100000)
+        with open(os.path.join(temp_dir, "data.bin"), "wb") as f:
+            f.write(data)
+        return data
+    
+    def url(self, server):
+        return f"http://localhost:{server.server_address[1]}/data.bin"
+    
+    def test_full_download_advertises_ranges(self, running_server, content):
+        """Test that a plain GET returns 200 with Accept-Ranges."""
+        response = requests.get(self.url(running_server))
+        assert response.status_code == 200
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        assert response.content == content
+    
+    def test_single_range(self, running_server, content):
+        """Test resuming a download from an offset."""
+        response = requests.get(self.url(running_server), headers={'Range': 'bytes=90000-'})
+        assert response.status_code == 206
+        assert response.headers['Content-Range'] == 'bytes 90000-99999/100000'
+        assert response.content == content[90000:]
+    
+    def test_multiple_ranges(self, running_server, content):
+        """Test that multiple ranges come back as multipart/byteranges."""
+        response = requests.get(self.url(running_server), headers={'Range': 'bytes=0-9,-10'})
+        assert response.status_code == 206
+        ctype = response.headers['Content-Type']
+        assert ctype.startswith('multipart/byteranges; boundary=')
+        boundary = ctype.split('boundary=')[1].encode()
+        assert int(response.headers['Content-Length']) == len(response.content)
+        
+        parts = response.content.split(b'--' + boundary)
+        assert parts[-1] == b'--\r\n'
+        bodies = [part.split(b'\r\n\r\n', 1)[1][:-2] for part in parts[1:-1]]
+        assert bodies == [content[:10], content[-10:]]
+        assert b'Content-Range: bytes 99990-99999/100000' in parts[2]
+    
+    def test_unsatisfiable_range(self, running_server, content):
+        """Test that a range past the end returns 416."""
+        response = requests.get(self.url(running_server), headers={'Range': 'bytes=200000-'})
+        assert response.status_code == 416
+        assert response.headers['Content-Range'] == 'bytes */100000'
+    
+    def test_if_range_mismatch_sends_full_file(self, running_server, content):
+        """Test that a stale If-Range validator returns the whole file."""
+        headers = {'Range': 'bytes=0-9', 'If-Range': 'Mon, 01 Jan 2001 00:00:00 GMT'}
+        response = requests.get(self.url(running_server), headers=headers)
+        assert response.status_code == 200
+        assert response.content == content
+        
+        headers['If-Range'] = response.headers['Last-Modified']
+        response = requests.get(self.url(running_server), headers=headers)
+        assert response.status_code == 206
+        assert response.content == content[:10]
+    
+    def test_head_requires_auth(self, test_server, temp_dir, content):
+        """Test that HEAD is authenticated like GET."""
+        import threading
+        server = test_server(use_auth=True, password="test123")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = self.url(server)
+            assert requests.head(url).status_code == 401
+            response = requests.head(url, auth=('user', 'test123'))
+            assert response.status_code == 200
+            assert response.headers['Content-Length'] == '100000'
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,113 @@
+import pytest
+import os
+import sys
+import threading
+import time
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+class TestTokenBucket:
+    """Test the token bucket behind every limit."""
+
+    def test_try_take(self):
+        """Test that a burst is allowed and the wait for the next token is reported."""
+        bucket = ts_server.TokenBucket(rate=10, burst=3)
+        assert [bucket.try_take() for _ in range(3)] == [0, 0, 0]
+        wait = bucket.try_take()
+        assert 0 < wait <= 0.1
+        time.sleep(0.15)
+        assert bucket.try_take() == 0
+
+    def test_take_paces_callers(self):
+        """Test that take() sleeps until the tokens are paid for, across threads."""
+        bucket = ts_server.TokenBucket(rate=1000, burst=100)
+        start = time.monotonic()
+        threads = [threading.Thread(target=bucket.take, args=(150,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 300 tokens with 100 in the bucket take at least 0.2 seconds
+        assert 0.18 <= time.monotonic() - start < 1
+
+    def test_limiter_keeps_buckets_per_client(self, monkeypatch):
+        """Test that clients get their own buckets and idle ones are dropped."""
+        monkeypatch.setattr(ts_server, "MAX_RATE_LIMITED_CLIENTS", 2)
+        limiter = ts_server.RateLimiter(5)
+        first = limiter.bucket("10.0.0.1")
+        assert limiter.bucket("10.0.0.1") is first
+        assert limiter.bucket("10.0.0.2") is not first
+        limiter.bucket("10.0.0.3")
+        assert list(limiter.buckets) == ["10.0.0.2", "10.0.0.3"]
+
+class TestRateLimitedServer:
+    """Test limits enforced by the running server."""
+
+    @pytest.fixture
+    def make_url(self, start_server):
+        def _create(**kwargs):
+            return f"http://localhost:{start_server(**kwargs).server_address[1]}"
+        return _create
+
+    def test_request_rate(self, make_url):
+        """Test that requests beyond the rate get 429 and each client has its own budget."""
+        base_url = make_url(request_rate=2)
+        session = requests.Session()
+        assert session.get(base_url + "/list").status_code == 200
+        assert session.get(base_url + "/list").status_code == 200
+        response = session.get(base_url + "/list")
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '1'
+        # The connection stays usable
+        time.sleep(0.6)
+        assert session.get(base_url + "/list").status_code == 200
+
+        # Clients behind the local proxy are told apart by X-Forwarded-For
+        other = {'X-Forwarded-For': '203.0.113.7'}
+        assert requests.get(base_url + "/list", headers=other).status_code == 200
+
+    def test_download_rate(self, make_url, temp_dir):
+        """Test that downloads are paced while streaming, for sendfile and ranges."""
+        content = os.urandom(300 * 1024)
+        with open(os.path.join(temp_dir, "data.bin"), "wb") as f:
+            f.write(content)
+        base_url = make_url(download_rate=200 * 1024)
+
+        start = time.monotonic()
+        response = requests.get(base_url + "/data.bin")
+        # A second's burst, then 100 KiB at 200 KiB/s
+        assert time.monotonic() - start >= 0.4
+        assert response.content == content
+
+        start = time.monotonic()
+        response = requests.get(base_url + "/data.bin", headers={'Range': 'bytes=0-102399'})
+        assert time.monotonic() - start >= 0.4
+        assert response.content == content[:102400]
+
+    def test_upload_rate(self, make_url, temp_dir):
+        """Test that multipart and resumable uploads are read at the upload rate."""
+        base_url = make_url(upload_rate=200 * 1024)
+        content = os.urandom(300 * 1024)
+
+        start = time.monotonic()
+        response = requests.post(base_url + "/", files={'file': ('up.bin', content)})
+        assert response.status_code == 200
+        assert time.monotonic() - start >= 0.4
+        with open(os.path.join(temp_dir, "up.bin"), "rb") as f:
+            assert f.read() == content
+
+        session = requests.post(base_url + "/uploads", json={'filename': 'resumed.bin', 'size': 100 * 1024}).json()
+        start = time.monotonic()
+        response = requests.patch(base_url + "/uploads/" + session['id'], data=content[:100 * 1024],
+                                  headers={'Upload-Offset': '0'})
+        assert response.status_code == 204
+        assert time.monotonic() - start >= 0.4
@@ -0,0 +1,128 @@
+import pytest
+import os
+import sys
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server", 
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+class TestResumableUploads:
+    """Test the resumable upload API."""
+    
+    @pytest.fixture
+    def base_url(self, running_server):
+        return f"http://localhost:{running_server.server_address[1]}"
+    
+    def create(self, base_url, filename, size):
+        response = requests.post(base_url + "/uploads", json={"filename": filename, "size": size})
+        assert response.status_code == 201
+        assert response.headers['Location'] == '/uploads/' + response.json()['id']
+        return response.json()['id']
+    
+    def test_chunked_upload_and_finalize(self, base_url, temp_dir):
+        """Test uploading a file in chunks and finalizing it."""
+        content = os.urandom(250000)
+        upload_id = self.create(base_url, "../evil/big.bin", len(content))
+        
+        for offset in range(0, len(content), 100000):
+            response = requests.patch(f"{base_url}/uploads/{upload_id}",
+                                      data=content[offset:offset + 100000],
+                                      headers={'Upload-Offset': str(offset)})
+            assert response.status_code == 204
+            assert response.headers['Upload-Offset'] == str(min(offset + 100000, len(content)))
+        
+        response = requests.post(f"{base_url}/uploads/{upload_id}/finalize")
+        assert response.status_code == 200
+        assert response.json() == {'name': 'big.bin', 'size': len(content)}
+        with open(os.path.join(temp_dir, "big.bin"), "rb") as f:
+            assert f.read() == content
+        assert requests.get(f"{base_url}/uploads/{upload_id}").status_code == 404
+    
+    def test_wrong_offset_reports_committed_offset(self, base_url):
+        """Test that a chunk at the wrong offset is refused with the real offset."""
+        upload_id = self.create(base_url, "a.bin", 10)
+        requests.put(f"{base_url}/uploads/{upload_id}", data=b"12345", headers={'Upload-Offset': '0'})
+        
+        response = requests.patch(f"{base_url}/uploads/{upload_id}", data=b"xxxxx",
+                                  headers={'Upload-Offset': '0'})
+        assert response.status_code == 409
+        assert response.json()['offset'] == 5
+        
+        response = requests.head(f"{base_url}/uploads/{upload_id}")
+        assert response.headers['Upload-Offset'] == '5'
+    
+    def test_incomplete_upload_cannot_be_finalized(self, base_url, temp_dir):
+        """Test that finalize requires every byte to have arrived."""
+        upload_id = self.create(base_url, "partial.bin", 10)
+        response = requests.post(f"{base_url}/uploads/{upload_id}/finalize")
+        assert response.status_code == 409
+        assert not os.path.exists(os.path.join(temp_dir, "partial.bin"))
+    
+    def test_finalize_with_body_rejected(self, base_url, temp_dir):
+        """Test that finalize refuses a request body and closes the connection."""
+        upload_id = self.create(base_url, "whole.bin", 4)
+        requests.patch(f"{base_url}/uploads/{upload_id}", data=b"1234", headers={'Upload-Offset': '0'})
+        response = requests.post(f"{base_url}/uploads/{upload_id}/finalize",
+                                 data=b"GET /list HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        assert response.status_code == 400
+        assert response.headers['Connection'] == 'close'
+        assert not os.path.exists(os.path.join(temp_dir, "whole.bin"))
+        assert requests.post(f"{base_url}/uploads/{upload_id}/finalize").status_code == 200
+
+    def test_chunk_past_declared_size_rejected(self, base_url):
+        """Test that a session cannot grow past its declared size."""
+        upload_id = self.create(base_url, "small.bin", 4)
+        response = requests.patch(f"{base_url}/uploads/{upload_id}", data=b"too long",
+                                  headers={'Upload-Offset': '0'})
+        assert response.status_code == 413
+    
+    def test_delete_session(self, base_url):
+        """Test abandoning an upload."""
+        upload_id = self.create(base_url, "gone.bin", 4)
+        assert requests.delete(f"{base_url}/uploads/{upload_id}").status_code == 204
+        assert requests.get(f"{base_url}/uploads/{upload_id}").status_code == 404
+    
+    def test_invalid_create_request(self, base_url):
+        """Test that session creation validates its input."""
+        assert requests.post(base_url + "/uploads", json={"filename": "x"}).status_code == 400
+        assert requests.post(base_url + "/uploads", data=b"not json").status_code == 400
+    
+    def test_state_directory_not_served(self, base_url, temp_dir):
+        """Test that in-progress uploads cannot be downloaded."""
+        upload_id = self.create(base_url, "secret.bin", 4)
+        response = requests.get(f"{base_url}/{ts_server.STATE_DIR_NAME}/uploads/{upload_id}.json")
+        assert response.status_code == 404
+        assert requests.get(f"{base_url}/%2Ets-server/uploads/").status_code == 404
+    
+    def test_sessions_survive_restart(self, temp_dir):
+        """Test that a new store picks up sessions written by an old one."""
+        import io
+        store = ts_server.ResumableUploadStore(temp_dir)
+        session = store.create("resume.bin", 6)
+        store.append(session['id'], 0, io.BytesIO(b"abc"), 3)
+        
+        restarted = ts_server.ResumableUploadStore(temp_dir)
+        assert restarted.get(session['id'])['offset'] == 3
+        restarted.append(session['id'], 3, io.BytesIO(b"def"), 3)
+        restarted.finalize(session['id'], os.path.join(temp_dir, "resume.bin"))
+        with open(os.path.join(temp_dir, "resume.bin"), "rb") as f:
+            assert f.read() == b"abcdef"
+    
+    def test_expired_sessions_purged(self, temp_dir):
+        """Test that abandoned sessions are cleaned up."""
+        store = ts_server.ResumableUploadStore(temp_dir)
+        session = store.create("old.bin", 6)
+        old = 1000000000
+        for path in store._paths(session['id']):
+            os.utime(path, (old, old))
+        
+        ts_server.ResumableUploadStore(temp_dir)
+        with pytest.raises(ts_server.UploadSessionError):
+            store.get(session['id'])
@@ -0,0 +1,92 @@
+import pytest
+import json
+import os
+import re
+import sys
+import time
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+def parse_server_timing(value):
+    """Return {name: ms} from a Server-Timing header."""
+    timings = {}
+    for metric in value.split(","):
+        name, duration = re.fullmatch(r"\s*(\w+);dur=([\d.]+)", metric).groups()
+        timings[name] = float(duration)
+    return timings
+
+class TestRequestTimer:
+    """Test how phase times are accumulated."""
+
+    def test_nested_phases_are_exclusive(self):
+        """Test that an outer phase excludes the time recorded inside it."""
+        timer = ts_server.RequestTimer()
+        with timer.measure("parse"):
+            time.sleep(0.02)
+            timer.add("read", 0.005)
+            with timer.measure("disk"):
+                time.sleep(0.02)
+        assert timer.phases["read"] == 0.005
+        assert 0.02 <= timer.phases["disk"] < 0.2
+        assert 0.015 <= timer.phases["parse"] < 0.2
+
+        header = parse_server_timing(timer.header(1.0))
+        assert list(header) == ["read", "parse", "disk", "total"]
+        assert header["read"] == 5 and header["total"] == 1000
+
+    def test_phases_outside_a_request_are_ignored(self):
+        """Test that record_phase() and request_phase() work with no request being timed."""
+        ts_server.record_phase("disk", 1.0)
+        with ts_server.request_phase("scan"):
+            pass
+
+class TestServerTiming:
+    """Test Server-Timing headers and the matching access log fields."""
+
+    @pytest.fixture
+    def server(self, start_server, engine, temp_dir):
+        log_path = os.path.join(temp_dir, "access.log")
+        server = start_server(engine, use_auth=True, password="test123", access_log=log_path,
+                              server_timing=True, durability="fsync")
+        server.log_path = log_path
+        return server
+
+    def test_phases_by_route(self, server):
+        """Test that uploads, listings and downloads report the phases they went through."""
+        base_url = f"http://localhost:{server.server_address[1]}"
+        session = requests.Session()
+        session.auth = ('user', 'test123')
+
+        response = session.post(base_url + "/", files={"file": ("a b.bin", os.urandom(500000))})
+        upload = parse_server_timing(response.headers["Server-Timing"])
+        assert {"auth", "read", "parse", "sanitize", "disk", "commit", "total"} <= set(upload)
+        assert "send" not in upload
+        assert sum(value for name, value in upload.items() if name != "total") <= upload["total"]
+
+        listing = parse_server_timing(session.get(base_url + "/list").headers["Server-Timing"])
+        assert {"auth", "scan", "total"} <= set(listing) and "disk" not in listing
+        download = parse_server_timing(session.get(base_url + "/a_b.bin").headers["Server-Timing"])
+        assert set(download) == {"auth", "total"}
+        assert "Server-Timing" in requests.get(base_url + "/list").headers
+
+        assert ts_server.get_access_log(server.log_path).flush()
+        with open(server.log_path) as f:
+            records = [json.loads(line) for line in f]
+        timings = [record["timings"] for record in records if "route" in record]
+        assert {"read", "parse", "disk", "commit", "send"} <= set(timings[0])
+        assert timings[0]["disk"] == pytest.approx(upload["disk"], abs=0.002)
+        assert timings[2]["send"] > 0
+
+    def test_header_is_opt_in(self, start_server):
+        """Test that without --server-timing no header is sent."""
+        server = start_server(access_log=None)
+        assert "Server-Timing" not in requests.get(f"http://localhost:{server.server_address[1]}/list").headers
@@ -0,0 +1,153 @@
+import pytest
+import os
+import sys
+import time
+import requests
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+AUTH = ('user', 'test123')
+
+class TestTokens:
+    """Test signing and verifying tokens."""
+
+    def test_sign_and_verify(self):
+        """Test that only the signed fields, key and an unexpired time verify."""
+        expires = str(int(time.time()) + 60)
+        signature = ts_server.sign_token(b"key", "download", "/a.txt", expires)
+        assert ts_server.token_valid(b"key", signature, expires, "download", "/a.txt")
+        assert not ts_server.token_valid(b"other", signature, expires, "download", "/a.txt")
+        assert not ts_server.token_valid(b"key", signature, expires, "download", "/b.txt")
+        assert not ts_server.token_valid(b"key", signature, expires, "upload", "/a.txt")
+        assert not ts_server.token_valid(b"key", signature + "x", expires, "download", "/a.txt")
+        assert not ts_server.token_valid(b"key", "é", expires, "download", "/a.txt")
+
+        past = str(int(time.time()) - 1)
+        signature = ts_server.sign_token(b"key", "download", "/a.txt", past)
+        assert not ts_server.token_valid(b"key", signature, past, "download", "/a.txt")
+        assert not ts_server.token_valid(b"key", signature, "", "download", "/a.txt")
+
+class TestSessions:
+    """Test session cookies and signed share links through the running server."""
+
+    @pytest.fixture
+    def make_url(self, start_server, temp_dir):
+        with open(os.path.join(temp_dir, "report.txt"), "w") as f:
+            f.write("quarterly numbers")
+        def _create(**kwargs):
+            server = start_server(use_auth=True, password="test123", **kwargs)
+            return f"http://localhost:{server.server_address[1]}"
+        return _create
+
+    def share(self, base_url, **request):
+        response = requests.post(base_url + "/share", auth=AUTH, json=request)
+        assert response.status_code == 200
+        return base_url + response.json()['url']
+
+    def test_basic_auth_starts_session(self, make_url):
+        """Test that the cookie from one Basic auth admits later requests."""
+        base_url = make_url()
+        session = requests.Session()
+        response = session.get(base_url + "/report.txt", auth=AUTH)
+        assert response.status_code == 200
+        cookie = response.headers['Set-Cookie']
+        assert cookie.startswith(ts_server.SESSION_COOKIE + '=all.')
+        assert 'HttpOnly' in cookie and 'SameSite=Lax' in cookie
+
+        response = session.get(base_url + "/list")
+        assert response.status_code == 200
+        assert 'Set-Cookie' not in response.headers
+
+        # A tampered cookie is rejected
+        value = session.cookies[ts_server.SESSION_COOKIE]
+        assert requests.get(base_url + "/list", headers={
+            'Cookie': f"{ts_server.SESSION_COOKIE}={value[:-2]}AA"}).status_code == 401
+
+    def test_session_expiry(self, make_url):
+        """Test that expired sessions are refused and session_ttl=0 issues none."""
+        base_url = make_url()
+        expires = int(time.time()) - 1
+        signature = ts_server.sign_token(ts_server.SESSION_SECRET + b"test123", 'session', 'all', expires)
+        cookie = f"{ts_server.SESSION_COOKIE}=all.{expires}.{signature}"
+        assert requests.get(base_url + "/list", headers={'Cookie': cookie}).status_code == 401
+
+        response = requests.get(make_url(session_ttl=0) + "/list", auth=AUTH)
+        assert response.status_code == 200
+        assert 'Set-Cookie' not in response.headers
+
+    def test_download_link(self, make_url):
+        """Test that a signed link fetches exactly one file, without credentials."""
+        base_url = make_url()
+        url = self.share(base_url, path="/report.txt")
+        response = requests.get(url)
+        assert response.status_code == 200
+        assert response.text == "quarterly numbers"
+        assert 'Set-Cookie' not in response.headers
+        assert requests.head(url).status_code == 200
+
+        query = url.split('?', 1)[1]
+        assert requests.get(base_url + "/list?" + query).status_code == 401
+        assert requests.post(url, files={'file': ('x.txt', b'x')}).status_code == 401
+
+        expired = self.share(base_url, path="/report.txt", expires_in=1)
+        time.sleep(2.1)
+        assert requests.get(expired).status_code == 401
+
+    def test_upload_link(self, make_url, temp_dir):
+        """Test that an upload link serves the page and accepts uploads, but nothing else."""
+        base_url = make_url()
+        url = self.share(base_url, action="upload")
+        session = requests.Session()
+        response = session.get(url, headers={'Accept-Encoding': 'identity'})
+        assert response.status_code == 200
+        assert b'<form' in response.content
+        assert session.cookies[ts_server.SESSION_COOKIE].startswith('upload.')
+
+        stylesheet = next(path for path in ts_server.STATIC_ASSETS if path.endswith('.css'))
+        assert session.get(base_url + stylesheet).status_code == 200
+        assert session.get(base_url + "/list").status_code == 403
+        assert session.get(base_url + "/report.txt").status_code == 403
+        assert session.post(base_url + "/share", json={'path': '/report.txt'}).status_code == 403
+        for path in ("/?x=1", "/?"):
+            response = session.get(base_url + path, headers={'Accept-Encoding': 'identity'})
+            assert b'<form' in response.content and b'report.txt' not in response.content
+
+        response = session.post(base_url + "/", files={'file': ('from-link.txt', b'dropped off')})
+        assert response.status_code == 200
+        response = requests.post(url, files={'file': ('direct.txt', b'scripted')})
+        assert response.status_code == 200
+        with open(os.path.join(temp_dir, "from-link.txt"), "rb") as f:
+            assert f.read() == b'dropped off'
+        with open(os.path.join(temp_dir, "direct.txt"), "rb") as f:
+            assert f.read() == b'scripted'
+
+        # Credentials still unlock everything for the owner
+        assert session.get(base_url + "/list", auth=AUTH).status_code == 200
+
+    def test_links_do_not_list_directories(self, make_url, temp_dir):
+        """Test that only full access gets a directory listing."""
+        base_url = make_url()
+        os.mkdir(os.path.join(temp_dir, "sub"))
+        with open(os.path.join(temp_dir, "sub", "inside.txt"), "w") as f:
+            f.write("inside")
+        response = requests.get(self.share(base_url, path="/sub/"))
+        assert response.status_code == 403
+        assert b'inside.txt' not in response.content
+        assert b'inside.txt' in requests.get(base_url + "/sub/", auth=AUTH).content
+
+    def test_share_validation(self, make_url):
+        """Test that malformed share requests are rejected."""
+        base_url = make_url()
+        assert requests.post(base_url + "/share", json={'path': '/report.txt'}).status_code == 401
+        for request in ({}, {'path': 'report.txt'}, {'path': '/a', 'action': 'upload'},
+                        {'path': '/a', 'action': 'delete'}, {'path': '/a', 'expires_in': 0},
+                        {'path': '/a', 'expires_in': ts_server.MAX_SHARE_LINK_TTL + 1}):
+            assert requests.post(base_url + "/share", auth=AUTH, json=request).status_code == 400
@@ -0,0 +1,116 @@
+import pytest
+import os
+import sys
+import socket
+import threading
+import time
+import http.client
+import requests
+from functools import partial
+
+# Add the parent directory to the path so we can import ts-server
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import the module - handle the hyphen in filename
+import importlib.util
+spec = importlib.util.spec_from_file_location("ts_server",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ts-server.py"))
+ts_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ts_server)
+
+class TestWorkerPool:
+    """Test the bounded worker pool engine."""
+
+    @pytest.fixture
+    def pool_server(self, temp_dir):
+        servers = []
+        def _create(**kwargs):
+            handler = partial(ts_server.AuthHandler, use_auth=False, password="")
+            server = ts_server.PooledHTTPServer(('localhost', 0), handler, **kwargs)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+            return server
+        yield _create
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    def stall(self, server):
+        """Open a connection that sends half a request and then waits."""
+        conn = socket.create_connection(server.server_address)
+        conn.sendall(b"GET /list HTTP/1.1\r\n")
+        return conn
+
+    def test_serves_requests(self, pool_server, temp_dir):
+        """Test that the pool serves ordinary requests."""
+        with open(os.path.join(temp_dir, "a.txt"), "w") as f:
+            f.write("pooled")
+        server = pool_server(workers=2, backlog=16)
+        url = f"http://localhost:{server.server_address[1]}"
+        assert server.request_queue_size == 16
+        assert requests.get(url + "/a.txt").text == "pooled"
+        assert [entry['name'] for entry in requests.get(url + "/list").json()] == ['a.txt']
+
+    def test_overload_returns_503(self, pool_server):
+        """Test that connections beyond workers + queue get a fast 503."""
+        server = pool_server(workers=1, queue_size=1)
+        url = f"http://localhost:{server.server_address[1]}"
+        busy = self.stall(server)
+        time.sleep(0.2)
+        queued = self.stall(server)
+        time.sleep(0.2)
+        try:
+            start = time.monotonic()
+            response = requests.get(url + "/list", timeout=5)
+            assert time.monotonic() - start < 1
+            assert response.status_code == 503
+            assert response.headers['Retry-After'] == str(ts_server.OVERLOAD_RETRY_AFTER)
+            assert server.rejected == 1
+        finally:
+            busy.close()
+            queued.close()
+
+        # Once the stalled clients go away the pool recovers
+        time.sleep(0.2)
+        assert requests.get(url + "/list", timeout=5).status_code == 200
+
+    def test_stalled_client_times_out(self, pool_server):
+        """Test that a client that stops sending frees its worker."""
+        server = pool_server(workers=1, queue_size=1, socket_timeout=0.5)
+        url = f"http://localhost:{server.server_address[1]}"
+        busy = self.stall(server)
+        time.sleep(0.2)
+        try:
+            assert requests.get(url + "/list", timeout=5).status_code == 200
+        finally:
+            busy.close()
+
+    def test_idle_keepalive_does_not_starve_new_connections(self, pool_server, temp_dir):
+        """Test that idle persistent connections give their workers up to queued ones."""
+        server = pool_server(workers=2, queue_size=2)
+        url = f"http://localhost:{server.server_address[1]}"
+        idle = [requests.Session() for _ in range(2)]
+        for session in idle:
+            assert session.get(url + "/list").status_code == 200
+        try:
+            start = time.monotonic()
+            assert requests.get(url + "/list", timeout=5).status_code == 200
+            assert time.monotonic() - start < 1
+        finally:
+            for session in idle:
+                session.close()
+
+    def test_idle_keepalive_is_kept_when_pool_is_free(self, pool_server):
+        """Test that an idle connection stays open while no one is waiting for a worker."""
+        server = pool_server(workers=2)
+        conn = http.client.HTTPConnection('localhost', server.server_address[1], timeout=5)
+        try:
+            conn.request('GET', '/list')
+            assert conn.getresponse().read() == b'[]'
+            sock = conn.sock
+            time.sleep(0.3)
+            conn.request('GET', '/list')
+            assert conn.getresponse().read() == b'[]'
+            assert conn.sock is sock
+        finally:
+            conn.close()
@@ -14,58 +14,2600 @@ import atexit
 import hmac
 import hashlib
 import tempfile
-from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import socket
+import select
+import threading
+import time
+import urllib.parse
+import stat
+import struct
+import ctypes
+import ctypes.util
+import bisect
+import cProfile
+import pstats
+import marshal
+import random
+import itertools
+import math
+import fnmatch
+from collections import namedtuple, OrderedDict, Counter
+import datetime
+import email.utils
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import queue
+from http.server import HTTPServer, ThreadingHTTPServer, SimpleHTTPRequestHandler
 from functools import partial
 from email.message import EmailMessage
 from email import message_from_bytes
 import json
+import mimetypes
+import tarfile
+import zipfile
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Configure logging for consistent output
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 
-def parse_multipart_form_data(data, boundary):
-    """Parse multipart/form-data without using deprecated cgi module."""
-    parts = data.split(b'--' + boundary.encode())
-    files = []
-    
-    for part in parts:
-        if b'Content-Disposition: form-data' not in part:
+# Size of the reads used when streaming request bodies from the socket
+STREAM_CHUNK_SIZE = 256 * 1024
+# Upper bound on the header block of a single multipart part
+MAX_PART_HEADER_SIZE = 16 * 1024
+
+
+class MultipartError(ValueError):
+    """Raised when a multipart/form-data body is malformed or truncated."""
+
+
+class MultipartParser:
+    """Incremental multipart/form-data parser.
+
+    Data is pushed in with feed() in arbitrarily sized chunks. For every part
+    with a non-empty filename, open_part(filename) is called and must return an
+    object with write() and close(); the part body is streamed into it as it
+    arrives and close() is called once the next boundary has been seen. Only a
+    delimiter-sized tail is held back between chunks, so memory use does not
+    depend on the size of the body.
+    """
+
+    def __init__(self, boundary, open_part):
+        self.delimiter = b'\r\n--' + boundary.encode()
+        self.open_part = open_part
+        # Pretend the body starts with CRLF so the first boundary matches the
+        # same delimiter as every later one.
+        self.buffer = bytearray(b'\r\n')
+        self.state = 'preamble'
+        self.sink = None
+        self.part = None
+        self.files = []
+
+    def feed(self, data):
+        """Consume the next chunk of the body."""
+        self.buffer += data
+        while self._step():
+            pass
+
+    def close(self):
+        """Signal the end of the body; raise MultipartError if it was cut short."""
+        if self.state != 'epilogue':
+            self.abort()
+            raise MultipartError("Multipart body ended before the closing boundary")
+
+    def abort(self):
+        """Drop the part currently being written, if any."""
+        sink, self.sink = self.sink, None
+        if sink is not None:
+            if hasattr(sink, 'abort'):
+                sink.abort()
+            else:
+                sink.close()
+
+    def _step(self):
+        """Advance the state machine once; return False when more data is needed."""
+        buf = self.buffer
+        keep = len(self.delimiter) - 1
+
+        if self.state == 'preamble':
+            index = buf.find(self.delimiter)
+            if index < 0:
+                if len(buf) > keep:
+                    del buf[:len(buf) - keep]
+                return False
+            del buf[:index + len(self.delimiter)]
+            self.state = 'boundary'
+            return True
+
+        if self.state == 'boundary':
+            if len(buf) < 2:
+                return False
+            if buf[:2] == b'--':
+                self.state = 'epilogue'
+                return True
+            index = buf.find(b'\r\n')
+            if index < 0:
+                if len(buf) > MAX_PART_HEADER_SIZE:
+                    raise MultipartError("Malformed boundary line")
+                return False
+            del buf[:index + 2]
+            self.state = 'headers'
+            return True
+
+        if self.state == 'headers':
+            if buf[:2] == b'\r\n':
+                headers, consumed = b'', 2
+            else:
+                index = buf.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(buf) > MAX_PART_HEADER_SIZE:
+                        raise MultipartError("Part headers too large")
+                    return False
+                headers, consumed = bytes(buf[:index]), index + 4
+            del buf[:consumed]
+            self._start_part(headers.decode('utf-8', errors='ignore'))
+            self.state = 'body'
+            return True
+
+        if self.state == 'body':
+            index = buf.find(self.delimiter)
+            if index < 0:
+                if len(buf) > keep:
+                    self._write(buf[:len(buf) - keep])
+                    del buf[:len(buf) - keep]
+                return False
+            self._write(buf[:index])
+            del buf[:index + len(self.delimiter)]
+            self._finish_part()
+            self.state = 'boundary'
+            return True
+
+        # epilogue: anything after the closing boundary is ignored
+        buf.clear()
+        return False
+
+    def _start_part(self, headers_text):
+        self.sink = None
+        self.part = None
+        if 'Content-Disposition: form-data' not in headers_text:
+            return
+        filename_match = re.search(r'filename="([^"]*)"', headers_text)
+        if filename_match and filename_match.group(1):
+            self.part = {'filename': filename_match.group(1), 'size': 0}
+            self.sink = self.open_part(self.part['filename'])
+
+    def _write(self, data):
+        if self.sink is not None and data:
+            self.sink.write(data)
+            self.part['size'] += len(data)
+
+    def _finish_part(self):
+        sink, self.sink = self.sink, None
+        if sink is not None:
+            sink.close()
+            self.files.append(self.part)
+
+
+def stream_multipart_form_data(rfile, boundary, content_length, open_part,
+                               chunk_size=STREAM_CHUNK_SIZE):
+    """Parse a multipart/form-data body straight from rfile in fixed-size chunks.
+
+    Each file part is handed to open_part(filename) as described in
+    MultipartParser. Returns a list of {'filename', 'size'} dicts for the
+    file parts that were completely received.
+    """
+    parser = MultipartParser(boundary, open_part)
+    remaining = content_length
+    try:
+        while remaining > 0:
+            chunk = rfile.read(min(chunk_size, remaining))
+            if not chunk:
+                raise MultipartError("Request body ended early")
+            remaining -= len(chunk)
+            parser.feed(chunk)
+        parser.close()
+    except BaseException:
+        parser.abort()
+        raise
+    return parser.files
+
+
+class _MemoryPart:
+    """In-memory sink used by parse_multipart_form_data."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+
+    def close(self):
+        pass
+
+
+def parse_multipart_form_data(data, boundary):
+    """Parse multipart/form-data without using deprecated cgi module."""
+    sinks = []
+
+    def open_part(filename):
+        sinks.append(_MemoryPart())
+        return sinks[-1]
+
+    parser = MultipartParser(boundary, open_part)
+    try:
+        parser.feed(data)
+    except MultipartError:
+        return []
+    return [
+        {'filename': part['filename'], 'content': b''.join(sink.chunks)}
+        for part, sink in zip(parser.files, sinks)
+    ]
+
+
+# Telemetry served at /metrics in the Prometheus text format
+METRICS_URL = '/metrics'
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DISK_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+# 1 KiB to 4 GiB in steps of four
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(12))
+# name: (type, help, histogram buckets)
+METRIC_DEFINITIONS = {
+    'ts_server_requests_total': (
+        'counter', 'Requests served, by route, method and status.', None),
+    'ts_server_request_duration_seconds': (
+        'histogram', 'Time from reading a request line to finishing its response, by route.', LATENCY_BUCKETS),
+    'ts_server_received_bytes_total': ('counter', 'Bytes read from clients, request heads included.', None),
+    'ts_server_sent_bytes_total': ('counter', 'Bytes written to clients, response heads included.', None),
+    'ts_server_active_connections': ('gauge', 'Client connections currently open.', None),
+    'ts_server_threads': ('gauge', 'Threads in this server process.', None),
+    'ts_server_upload_size_bytes': (
+        'histogram', 'Size of each received file, by upload path.', SIZE_BUCKETS),
+    'ts_server_auth_failures_total': (
+        'counter', 'Requests refused for missing or invalid credentials or an insufficient scope.', None),
+    'ts_server_disk_write_seconds': (
+        'histogram', 'Latency of upload writes and of committing finished uploads.', DISK_LATENCY_BUCKETS),
+    'ts_server_access_log_dropped_total': (
+        'counter', 'Access log records dropped because the log writer fell behind.', None),
+    'ts_server_profile_skipped_total': (
+        'counter', 'Sampled requests not profiled because another profile was running.', None),
+}
+
+
+class _MetricsShard:
+    """One thread's metric values; folded into the totals when the thread exits."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.values = {}
+        with metrics.lock:
+            metrics.shards[id(self)] = self.values
+
+    def __del__(self):
+        self.metrics.retire(id(self))
+
+
+class Metrics:
+    """Counters, gauges and histograms for /metrics.
+
+    Every thread updates a shard of its own without taking a lock; a
+    scrape copies and sums the shards. A histogram value is a list of
+    per-bucket counts (the last one +Inf) followed by the sum of the
+    observations. Gauges are counters that also go down.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        # Reentrant: a shard can be retired by garbage collection while
+        # its thread is inside snapshot()
+        self.lock = threading.RLock()
+        self.shards = {}
+        self.retired = {}
+
+    def _values(self):
+        try:
+            return self.local.shard.values
+        except AttributeError:
+            self.local.shard = _MetricsShard(self)
+            return self.local.shard.values
+
+    def inc(self, name, value=1, labels=()):
+        values = self._values()
+        key = (name, labels)
+        values[key] = values.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        values = self._values()
+        key = (name, labels)
+        buckets = METRIC_DEFINITIONS[name][2]
+        histogram = values.get(key)
+        if histogram is None:
+            histogram = values[key] = [0] * (len(buckets) + 2)
+        histogram[bisect.bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+    @staticmethod
+    def _merge(totals, values):
+        for key, value in values.items():
+            if isinstance(value, list):
+                total = totals.get(key)
+                totals[key] = value[:] if total is None else [a + b for a, b in zip(total, value)]
+            else:
+                totals[key] = totals.get(key, 0) + value
+
+    def retire(self, shard_id):
+        with self.lock:
+            values = self.shards.pop(shard_id, None)
+            if values is not None:
+                self._merge(self.retired, values)
+
+    def snapshot(self):
+        """Return {(name, labels): value} summed over all threads."""
+        with self.lock:
+            totals = {}
+            self._merge(totals, self.retired)
+            for values in list(self.shards.values()):
+                # Copied first: the owning thread may be adding keys
+                self._merge(totals, dict(values))
+        return totals
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        totals = self.snapshot()
+        totals['ts_server_threads', ()] = threading.active_count()
+        by_name = {}
+        for (name, labels), value in sorted(totals.items()):
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, (kind, help_text, buckets) in METRIC_DEFINITIONS.items():
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in by_name.get(name, ()):
+                if kind != 'histogram':
+                    lines.append('%s%s %s' % (name, format_metric_labels(labels), value))
+                    continue
+                count = 0
+                for bound, observations in zip(buckets + (math.inf,), value):
+                    count += observations
+                    le = '+Inf' if bound == math.inf else repr(float(bound))
+                    lines.append('%s_bucket%s %d' % (name, format_metric_labels(labels + (('le', le),)), count))
+                lines.append('%s_sum%s %r' % (name, format_metric_labels(labels), float(value[-1])))
+                lines.append('%s_count%s %d' % (name, format_metric_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+def format_metric_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"')
+                                          .replace('\n', r'\n')) for name, value in labels)
+
+
+METRICS = Metrics()
+
+
+# Phases a request's time is broken down into, in Server-Timing order
+TIMING_PHASES = ('auth', 'throttle', 'read', 'parse', 'sanitize', 'disk', 'commit', 'scan', 'send')
+
+
+class RequestTimer:
+    """Seconds one request spent in each of TIMING_PHASES.
+
+    measure() blocks nest: a block records only the time that the
+    phases inside it did not, so parse excludes the body reads and disk
+    writes the parser triggers.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.recorded = 0.0
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.recorded += seconds
+
+    def measure(self, phase):
+        return _TimedBlock(self, phase)
+
+    def milliseconds(self):
+        """Return {phase: ms} for the phases that took any time."""
+        phases = self.phases
+        return {phase: round(phases[phase] * 1000, 3) for phase in TIMING_PHASES if phases.get(phase, 0) > 0}
+
+    def header(self, total):
+        """Return a Server-Timing header value, ending with total seconds."""
+        phases = self.phases
+        return ''.join(['%s;dur=%.3f, ' % (phase, phases[phase] * 1000) for phase in TIMING_PHASES
+                        if phases.get(phase, 0) > 0]) + 'total;dur=%.3f' % (total * 1000)
+
+
+class _TimedBlock:
+    """Context manager behind RequestTimer.measure()."""
+    __slots__ = ('timer', 'phase', 'started', 'recorded')
+
+    def __init__(self, timer, phase):
+        self.timer = timer
+        self.phase = phase
+
+    def __enter__(self):
+        self.recorded = self.timer.recorded
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        self.timer.add(self.phase, elapsed - (self.timer.recorded - self.recorded))
+
+
+# The RequestTimer of the request the current thread is serving
+_request_timer = threading.local()
+
+
+def record_phase(phase, seconds):
+    """Add seconds to a phase of the current thread's request, if it is timed."""
+    timer = getattr(_request_timer, 'timer', None)
+    if timer is not None:
+        timer.add(phase, seconds)
+
+
+def request_phase(phase):
+    """Return a context manager timing its block as a phase of the current request."""
+    timer = getattr(_request_timer, 'timer', None)
+    return timer.measure(phase) if timer is not None else contextlib.nullcontext()
+
+
+def observe_disk_write(op, seconds):
+    """Record an upload 'write' or 'commit' in the metrics and the request's timing."""
+    METRICS.observe('ts_server_disk_write_seconds', seconds, (('op', op),))
+    record_phase('disk' if op == 'write' else 'commit', seconds)
+
+
+class CountingStream:
+    """Wrap a handler's rfile or wfile, adding the bytes moved to a counter.
+
+    count keeps the connection's own total for the access log, and the
+    time spent moving them is recorded as the request's phase.
+    """
+
+    def __init__(self, stream, counter, phase):
+        self.stream = stream
+        self.counter = counter
+        self.phase = phase
+        self.count = 0
+
+    def add(self, size):
+        """Count bytes moved around the stream, e.g. by sendfile()."""
+        self.count += size
+        METRICS.inc(self.counter, size)
+
+    def read(self, *args):
+        started = time.perf_counter()
+        data = self.stream.read(*args)
+        record_phase(self.phase, time.perf_counter() - started)
+        self.add(len(data))
+        return data
+
+    def readline(self, *args):
+        started = time.perf_counter()
+        data = self.stream.readline(*args)
+        record_phase(self.phase, time.perf_counter() - started)
+        self.add(len(data))
+        return data
+
+    def write(self, data):
+        started = time.perf_counter()
+        written = self.stream.write(data)
+        record_phase(self.phase, time.perf_counter() - started)
+        self.add(len(data))
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+# Access log records waiting for the writer thread; more are dropped
+ACCESS_LOG_QUEUE_SIZE = 10000
+# Records written (and flushed) together by the writer thread
+ACCESS_LOG_BATCH_SIZE = 512
+
+
+class AccessLog:
+    """Write JSON access log lines to a stream from a background thread.
+
+    Request threads only put a record on a bounded queue, so a slow
+    terminal or journald pipe never holds up a response. When the writer
+    falls that far behind, records are dropped and counted instead.
+    """
+
+    def __init__(self, stream=None, queue_size=ACCESS_LOG_QUEUE_SIZE):
+        # None follows sys.stderr, which may be replaced after startup
+        self.stream = stream
+        self.records = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self.run, name='access-log', daemon=True)
+        self.thread.start()
+
+    def log(self, record):
+        """Queue a dict to be written as one JSON line; never blocks."""
+        try:
+            self.records.put_nowait(record)
+        except queue.Full:
+            METRICS.inc('ts_server_access_log_dropped_total')
+
+    def flush(self, timeout=5):
+        """Wait until the records queued so far are written."""
+        written = threading.Event()
+        try:
+            self.records.put(written, timeout=timeout)
+        except queue.Full:
+            return False
+        return written.wait(timeout)
+
+    def run(self):
+        while True:
+            batch = [self.records.get()]
+            try:
+                while len(batch) < ACCESS_LOG_BATCH_SIZE:
+                    batch.append(self.records.get_nowait())
+            except queue.Empty:
+                pass
+            lines = [json.dumps(record, separators=(',', ':')) + '\n'
+                     for record in batch if not isinstance(record, threading.Event)]
+            stream = self.stream or sys.stderr
+            try:
+                stream.write(''.join(lines))
+                stream.flush()
+            except (OSError, ValueError):
+                # A closed or broken log stream must not kill the writer
+                pass
+            for record in batch:
+                if isinstance(record, threading.Event):
+                    record.set()
+
+
+def log_timestamp():
+    """Return the current UTC time in ISO 8601 with milliseconds."""
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds')
+
+
+_access_logs = {}
+_access_logs_lock = threading.Lock()
+
+
+def get_access_log(target):
+    """Return the process's AccessLog for target: '-' for stderr, or a file path.
+
+    Keyed by process too, so each prefork worker starts its own writer.
+    """
+    with _access_logs_lock:
+        access_log = _access_logs.get((target, os.getpid()))
+        if access_log is None:
+            stream = None if target == '-' else open(target, 'a', encoding='utf-8')
+            access_log = _access_logs[target, os.getpid()] = AccessLog(stream)
+            atexit.register(access_log.flush, 1)
+        return access_log
+
+
+def resolve_access_log(target, serve_dir):
+    """Return the absolute --access-log file for target and check it can be appended to.
+
+    The log names clients and paths, so it may not be written where it
+    would be listed and served: inside serve_dir it must be under the
+    state directory. Raises ValueError otherwise, or if it cannot be opened.
+    """
+    path = os.path.realpath(target)
+    serve_dir = os.path.realpath(serve_dir)
+    state_dir = os.path.join(serve_dir, STATE_DIR_NAME)
+    if os.path.commonpath([path, serve_dir]) == serve_dir:
+        if os.path.commonpath([path, state_dir]) != state_dir or path == state_dir:
+            raise ValueError("%s is inside the served directory; put it under %s or elsewhere"
+                             % (path, state_dir))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        open(path, 'a', encoding='utf-8').close()
+    except OSError as e:
+        raise ValueError("cannot append to %s: %s" % (path, e.strerror or e)) from None
+    return path
+
+
+# Profiling of sampled requests (--profile, --profile-routes)
+PROFILE_URL = '/profile'
+# How often the threads serving profiled requests have their stacks sampled
+PROFILE_SAMPLE_INTERVAL = 0.005
+# From Python 3.12 cProfile observes every thread and only one profile can
+# be enabled per process, so sampled requests are profiled one at a time
+PROFILE_ONE_AT_A_TIME = sys.version_info >= (3, 12)
+
+
+def collapse_stack(route, frame):
+    """Return a frame's stack as one line of the collapsed (flame graph) format."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('%s (%s:%d)' % (getattr(code, 'co_qualname', code.co_name),
+                                     os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    names.append(route)
+    return ';'.join(reversed(names))
+
+
+class RequestProfiler:
+    """cProfile a sample of requests and aggregate the results per process.
+
+    rate is the fraction of all requests profiled; requests to the named
+    routes are always profiled. Each sampled request gets its own
+    cProfile.Profile, added to one pstats.Stats when it finishes. While
+    any sampled request runs, a sampler thread also records the stacks of
+    the threads serving them, for flame graphs. Where only one profile
+    can run at a time, a sampled request that arrives while another is
+    profiled is counted as skipped instead.
+    """
+
+    def __init__(self, rate=0.0, routes=(), one_at_a_time=PROFILE_ONE_AT_A_TIME):
+        self.rate = rate
+        self.routes = frozenset(routes)
+        self.lock = threading.Lock()
+        # Held by the profiled request when only one may run
+        self.exclusive = threading.Lock() if one_at_a_time else None
+        self.stats = None
+        self.requests = 0
+        self.skipped = 0
+        self.stacks = Counter()
+        # Thread ident: route of the profiled request it is serving
+        self.active = {}
+        self.running = threading.Event()
+        self.sampler = None
+
+    def start(self, route):
+        """Return an enabled profile if this request is sampled, else None."""
+        if route not in self.routes and not (self.rate and random.random() < self.rate):
+            return None
+        if self.exclusive is not None and not self.exclusive.acquire(blocking=False):
+            self.skip()
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in the process, outside our control
+            if self.exclusive is not None:
+                self.exclusive.release()
+            self.skip()
+            return None
+        with self.lock:
+            self.active[threading.get_ident()] = route
+            self.running.set()
+            if self.sampler is None or not self.sampler.is_alive():
+                self.sampler = threading.Thread(target=self.sample, name='profile-sampler', daemon=True)
+                self.sampler.start()
+        return profile
+
+    def skip(self):
+        """Count a sampled request that could not be profiled."""
+        with self.lock:
+            self.skipped += 1
+        METRICS.inc('ts_server_profile_skipped_total')
+
+    def finish(self, profile):
+        """Stop a profile returned by start() and add it to the totals."""
+        profile.disable()
+        if self.exclusive is not None:
+            self.exclusive.release()
+        with self.lock:
+            self.active.pop(threading.get_ident(), None)
+            if not self.active:
+                self.running.clear()
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+            self.requests += 1
+
+    def sample(self):
+        while True:
+            self.running.wait()
+            time.sleep(PROFILE_SAMPLE_INTERVAL)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, route in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self.stacks[collapse_stack(route, frame)] += 1
+            del frames
+
+    def reset(self):
+        with self.lock:
+            self.stats = None
+            self.requests = 0
+            self.skipped = 0
+            self.stacks.clear()
+
+    def report(self, sort='cumulative', limit=40):
+        """Return the top functions as pstats prints them."""
+        output = io.StringIO()
+        with self.lock:
+            output.write('%d requests profiled in process %d, %d skipped while another was profiled\n'
+                         % (self.requests, os.getpid(), self.skipped))
+            if self.stats is not None:
+                self.stats.stream = output
+                self.stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def pstats_data(self):
+        """Return the totals in the file format pstats.Stats() and snakeviz load."""
+        with self.lock:
+            return marshal.dumps(self.stats.stats if self.stats is not None else {})
+
+    def collapsed(self):
+        """Return the sampled stacks in the collapsed format flamegraph.pl and speedscope read."""
+        with self.lock:
+            return ''.join('%s %d\n' % (stack, count) for stack, count in self.stacks.most_common())
+
+    def dump(self, directory):
+        """Write the totals to .ts-server/profile/ in directory; return the paths."""
+        path = os.path.join(directory, STATE_DIR_NAME, 'profile')
+        os.makedirs(path, exist_ok=True)
+        prefix = os.path.join(path, '%s-%d' % (time.strftime('%Y%m%d-%H%M%S'), os.getpid()))
+        with open(prefix + '.pstats', 'wb') as f:
+            f.write(self.pstats_data())
+        with open(prefix + '.collapsed', 'w') as f:
+            f.write(self.collapsed())
+        return prefix + '.pstats', prefix + '.collapsed'
+
+
+# How uploaded files reach the disk: 'none' writes straight to the final
+# name, 'rename' writes a temp file and renames it into place, 'fsync' also
+# fsyncs the file and its directory around the rename, and 'group' does the
+# same but shares one filesystem sync between concurrent uploads.
+DURABILITY_MODES = ('none', 'rename', 'fsync', 'group')
+DEFAULT_DURABILITY = 'rename'
+# Upload temp files left behind by a crash are removed after this many seconds
+UPLOAD_TEMP_TTL = 24 * 3600
+
+
+def fsync_directory(path):
+    """Make a rename in path durable; best effort where directories cannot be synced."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class GroupCommitter:
+    """Share filesystem syncs between uploads that commit at the same time.
+
+    sync(fd) returns once a sync that started after the call has finished.
+    While one sync runs, every caller that arrives queues for the next one,
+    so a burst of concurrent uploads costs two syncfs() calls rather than
+    one fsync each. Without syncfs() (or after it fails) callers fall back
+    to fsyncing their own file.
+    """
+
+    def __init__(self, syncfs=None):
+        self.syncfs = syncfs if syncfs is not None else self._load_syncfs()
+        self.condition = threading.Condition()
+        self.started = 0
+        self.finished = 0
+        self.syncing = False
+        self.syncs = 0
+
+    @staticmethod
+    def _load_syncfs():
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+            function = libc.syncfs
+        except (OSError, AttributeError):
+            return None
+
+        def syncfs(fd):
+            if function(fd) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+        return syncfs
+
+    def sync(self, fd):
+        if self.syncfs is None:
+            os.fsync(fd)
+            return
+        with self.condition:
+            # A sync already in progress may have missed this caller's writes
+            needed = self.started + 1
+            while self.finished < needed:
+                if self.syncing:
+                    self.condition.wait()
+                    continue
+                self.syncing = True
+                self.started += 1
+                generation = self.started
+                self.condition.release()
+                try:
+                    self.syncfs(fd)
+                except OSError as e:
+                    logging.warning("syncfs failed, fsyncing uploads individually: %s", e)
+                    self.syncfs = None
+                finally:
+                    self.condition.acquire()
+                    self.syncing = False
+                    self.finished = generation
+                    self.syncs += 1
+                    self.condition.notify_all()
+            failed = self.syncfs is None
+        if failed:
+            os.fsync(fd)
+
+
+_group_committer = None
+_group_committer_lock = threading.Lock()
+
+
+def get_group_committer():
+    """Return the process-wide GroupCommitter."""
+    global _group_committer
+    with _group_committer_lock:
+        if _group_committer is None:
+            _group_committer = GroupCommitter()
+        return _group_committer
+
+
+def commit_file(f, temp_path, destination, durability):
+    """Flush f, open on temp_path, as durability requires and rename it to destination."""
+    started = time.perf_counter()
+    f.flush()
+    if durability == 'fsync':
+        os.fsync(f.fileno())
+    elif durability == 'group':
+        get_group_committer().sync(f.fileno())
+    os.replace(temp_path, destination)
+    if durability == 'fsync':
+        fsync_directory(os.path.dirname(destination))
+    elif durability == 'group':
+        # syncfs() covers the directory entry as well
+        get_group_committer().sync(f.fileno())
+    observe_disk_write('commit', time.perf_counter() - started)
+
+
+class UploadSink:
+    """Write target for one uploaded file; leaves nothing behind if the upload fails.
+
+    Unless durability is 'none' the data is written to a temp file in
+    temp_dir (which must be on the same filesystem as path) and renamed
+    over path by close(), so a partial upload is never visible under its
+    final name and two uploads of the same name cannot interleave.
+    """
+
+    def __init__(self, path, durability=DEFAULT_DURABILITY, temp_dir=None, blobs=None, checksum=False):
+        self.path = path
+        self.durability = durability
+        self.size = 0
+        self.deduplicated = False
+        # Stat of the stored file once close() has committed it
+        self.stat = None
+        # With a BlobStore (or when asked to) the content is hashed as it streams in
+        self.blobs = blobs if durability != 'none' else None
+        self.digest = hashlib.sha256() if self.blobs is not None or checksum else None
+        if durability == 'none':
+            self.temp_path = None
+            self.file = open(path, 'wb')
+            return
+        temp_dir = temp_dir or os.path.dirname(path)
+        os.makedirs(temp_dir, exist_ok=True)
+        self.temp_path = os.path.join(temp_dir, 'upload-%s.tmp' % secrets.token_hex(8))
+        self.file = open(os.open(self.temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), 'wb')
+
+    def write(self, data):
+        started = time.perf_counter()
+        self.file.write(data)
+        observe_disk_write('write', time.perf_counter() - started)
+        self.size += len(data)
+        if self.digest is not None:
+            self.digest.update(data)
+
+    def close(self):
+        if self.temp_path is not None:
+            try:
+                if self.blobs is not None:
+                    self.file, self.deduplicated = self.blobs.deduplicate(
+                        self.file, self.temp_path, self.digest.hexdigest(), self.size)
+                commit_file(self.file, self.temp_path, self.path, self.durability)
+            except:
+                self.abort()
+                raise
+        else:
+            self.file.flush()
+        self.stat = os.fstat(self.file.fileno())
+        self.file.close()
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.unlink(self.temp_path or self.path)
+        except OSError:
+            pass
+
+
+# Directory inside the served directory that holds server state (such as
+# in-progress resumable uploads); it is never listed or served.
+STATE_DIR_NAME = '.ts-server'
+# Resumable uploads untouched for this many seconds are discarded
+UPLOAD_SESSION_TTL = 7 * 24 * 3600
+UPLOAD_PATH_RE = re.compile(r'^/uploads(?:/([A-Za-z0-9_-]{16,64})(/finalize)?)?/?$')
+
+
+class UploadSessionError(Exception):
+    """Raised when a resumable upload request cannot be applied."""
+
+    def __init__(self, status, message, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ResumableUploadStore:
+    """On-disk state for resumable uploads.
+
+    Every session is a metadata file (<id>.json) next to the bytes received
+    so far (<id>.part). The committed offset is the size of the .part file,
+    so a session survives both client disconnects and server restarts.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, STATE_DIR_NAME, 'uploads')
+        # Temp files for uploads in flight (see UploadSink)
+        self.temp_path = os.path.join(directory, STATE_DIR_NAME, 'tmp')
+        self.lock = threading.Lock()
+        self.session_locks = {}
+        self.purge_expired()
+
+    def _paths(self, upload_id):
+        base = os.path.join(self.path, upload_id)
+        return base + '.json', base + '.part'
+
+    def _session_lock(self, upload_id):
+        with self.lock:
+            return self.session_locks.setdefault(upload_id, threading.Lock())
+
+    def _open_part(self, upload_id):
+        """Open a session's .part file for appending, locked against other
+        worker processes (--workers), and return it with the session state.
+
+        The state is loaded after the lock is taken, so it reflects any
+        append, finalize or delete another process has just completed.
+        """
+        _, part_path = self._paths(upload_id)
+        try:
+            f = open(os.open(part_path, os.O_WRONLY | os.O_APPEND), 'ab')
+        except OSError:
+            raise UploadSessionError(404, "Upload session not found")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            return f, self._load(upload_id)
+        except:
+            f.close()
+            raise
+
+    def _load(self, upload_id):
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            meta['offset'] = os.path.getsize(part_path)
+        except (OSError, ValueError):
+            raise UploadSessionError(404, "Upload session not found")
+        return meta
+
+    def create(self, filename, size):
+        """Start a new session and return its state."""
+        os.makedirs(self.path, exist_ok=True)
+        upload_id = secrets.token_urlsafe(24)
+        meta_path, part_path = self._paths(upload_id)
+        meta = {'id': upload_id, 'filename': filename, 'size': size, 'created': time.time()}
+        open(part_path, 'wb').close()
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        return dict(meta, offset=0)
+
+    def get(self, upload_id):
+        """Return the state of a session, including its committed offset."""
+        return self._load(upload_id)
+
+    def append(self, upload_id, offset, rfile, length):
+        """Append length bytes from rfile at offset; return the new offset."""
+        with self._session_lock(upload_id):
+            f, meta = self._open_part(upload_id)
+            remaining = length
+            with f:
+                if offset != meta['offset']:
+                    raise UploadSessionError(409, "Offset does not match the upload", meta['offset'])
+                if offset + length > meta['size']:
+                    raise UploadSessionError(413, "Chunk extends past the declared size", meta['offset'])
+                while remaining > 0:
+                    chunk = rfile.read(min(STREAM_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    started = time.perf_counter()
+                    f.write(chunk)
+                    observe_disk_write('write', time.perf_counter() - started)
+                    remaining -= len(chunk)
+            offset += length - remaining
+            if remaining:
+                raise UploadSessionError(400, "Chunk ended early", offset)
+            return offset
+
+    def finalize(self, upload_id, destination, durability=DEFAULT_DURABILITY, blobs=None, checksum=False):
+        """Move a completely received upload to destination.
+
+        The .part file is renamed into place even with durability 'none'.
+        With a BlobStore it is hashed and deduplicated first; meta then
+        records whether it was a duplicate. The returned meta also carries
+        the stored file's 'stat' and, if it was hashed, its 'sha256'.
+        """
+        with self._session_lock(upload_id):
+            f, meta = self._open_part(upload_id)
+            meta_path, part_path = self._paths(upload_id)
+            with f:
+                if meta['offset'] != meta['size']:
+                    raise UploadSessionError(409, "Upload is incomplete", meta['offset'])
+                committed = f
+                if blobs is not None or checksum:
+                    meta['sha256'] = hash_file(part_path)
+                if blobs is not None:
+                    committed, meta['deduplicated'] = blobs.deduplicate(
+                        f, part_path, meta['sha256'], meta['size'])
+                with committed:
+                    commit_file(committed, part_path, destination, durability)
+                    meta['stat'] = os.fstat(committed.fileno())
+                os.unlink(meta_path)
+        with self.lock:
+            self.session_locks.pop(upload_id, None)
+        return meta
+
+    def delete(self, upload_id):
+        """Abandon a session and remove its data."""
+        with self._session_lock(upload_id):
+            f, _ = self._open_part(upload_id)
+            with f:
+                for path in self._paths(upload_id):
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+        with self.lock:
+            self.session_locks.pop(upload_id, None)
+
+    def purge_expired(self):
+        """Remove sessions that have not received data within UPLOAD_SESSION_TTL,
+        and upload temp files abandoned for UPLOAD_TEMP_TTL."""
+        try:
+            temp_names = os.listdir(self.temp_path)
+        except OSError:
+            temp_names = []
+        cutoff = time.time() - UPLOAD_TEMP_TTL
+        for name in temp_names:
+            path = os.path.join(self.temp_path, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+            except OSError:
+                pass
+        cutoff = time.time() - UPLOAD_SESSION_TTL
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            paths = self._paths(name[:-len('.json')])
+            try:
+                last_activity = max(os.path.getmtime(path) for path in paths if os.path.exists(path))
+            except (OSError, ValueError):
+                continue
+            if last_activity < cutoff:
+                for path in paths:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+
+
+_upload_stores = {}
+_upload_stores_lock = threading.Lock()
+
+
+def get_upload_store(directory):
+    """Return the shared ResumableUploadStore for a served directory."""
+    with _upload_stores_lock:
+        store = _upload_stores.get(directory)
+        if store is None:
+            store = _upload_stores[directory] = ResumableUploadStore(directory)
+        return store
+
+
+class BlobStore:
+    """Content-addressed store that lets identical uploads share one copy.
+
+    Blobs live in .ts-server/blobs named by their SHA-256 and fanned out by
+    its first two hex digits (blobs/ab/ab12...), so the store doubles as an
+    on-disk hash index: finding a duplicate is a single stat() however many
+    files are stored. Served files are hardlinks to their blob, and blobs
+    are read-only so nothing edits the shared content in place. A blob
+    whose link count is back to 1 is not used by any name and is removed.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, STATE_DIR_NAME, 'blobs')
+        threading.Thread(target=self.purge_orphans, daemon=True).start()
+
+    def blob_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest)
+
+    def deduplicate(self, f, temp_path, digest, size):
+        """Store the completed file f, open on temp_path, by content.
+
+        If a blob with this content exists, temp_path is replaced by a link
+        to it and the copy just written is dropped without ever being
+        synced; otherwise the file becomes the blob. Returns the file object
+        to commit from and whether the content was a duplicate.
+        """
+        f.flush()
+        blob_path = self.blob_path(digest)
+        try:
+            existing = os.stat(blob_path)
+        except OSError:
+            existing = None
+        if existing is not None and existing.st_size == size:
+            link_path = temp_path + '.link'
+            try:
+                os.link(blob_path, link_path)
+            except OSError:
+                # Such as EMLINK when a blob has reached the link limit; keep the copy
+                return f, False
+            os.replace(link_path, temp_path)
+            f.close()
+            return open(temp_path, 'rb'), True
+        # The content must be on disk before its blob can be found, or a
+        # crash could leave a blob that does not match its name
+        os.fsync(f.fileno())
+        os.fchmod(f.fileno(), stat.S_IMODE(os.fstat(f.fileno()).st_mode) & ~0o222)
+        try:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.link(temp_path, blob_path)
+        except OSError:
+            # An identical upload finishing at the same moment won the race
+            pass
+        return f, False
+
+    def purge_orphans(self):
+        """Remove blobs that no served file links to any more."""
+        try:
+            prefixes = os.listdir(self.path)
+        except OSError:
+            return
+        removed = 0
+        for prefix in prefixes:
+            try:
+                with os.scandir(os.path.join(self.path, prefix)) as entries:
+                    for entry in entries:
+                        if entry.stat(follow_symlinks=False).st_nlink == 1:
+                            os.unlink(entry.path)
+                            removed += 1
+            except OSError:
+                continue
+        if removed:
+            logging.info("Removed %d unused deduplicated blobs", removed)
+
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_blob_stores = {}
+_blob_stores_lock = threading.Lock()
+
+
+def get_blob_store(directory):
+    """Return the shared BlobStore for a served directory."""
+    with _blob_stores_lock:
+        store = _blob_stores.get(directory)
+        if store is None:
+            store = _blob_stores[directory] = BlobStore(directory)
+        return store
+
+
+# Without inotify, a directory index is rescanned when the directory's mtime
+# changes or after this many seconds (to pick up in-place size changes)
+INDEX_POLL_INTERVAL = 2.0
+
+# listing is the entry's pre-encoded /list JSON object, built once per
+# change; sha256 is filled in by the catalog (--catalog) once known
+IndexEntry = namedtuple('IndexEntry', 'size mtime_ns ino listing sha256')
+
+
+def make_index_entry(name, st, sha256=None):
+    """Build the IndexEntry for a file from its stat result."""
+    return build_index_entry(name, st.st_size, st.st_mtime_ns, st.st_ino, sha256)
+
+
+def build_index_entry(name, size, mtime_ns, ino, sha256=None):
+    # Formatted by hand: json.dumps of the whole object dominates building
+    # (or seeding) the index of a large directory
+    listing = '{"name": %s, "size": %d, "mtime": %d' % (json.dumps(name), size, mtime_ns // 10**9)
+    if sha256 is not None:
+        listing += ', "sha256": "%s"' % sha256
+    return IndexEntry(size, mtime_ns, ino, (listing + '}').encode(), sha256)
+
+
+class Inotify:
+    """Minimal ctypes binding to Linux inotify.
+
+    A single non-blocking inotify descriptor is shared by every
+    DirectoryIndex; pending events are drained synchronously by poll(), so
+    no background thread is needed and an index is never behind a change
+    that completed before the request arrived.
+    """
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                  IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self):
+        self.fd = None
+        self.lock = threading.Lock()
+        self.watches = {}
+        if not sys.platform.startswith('linux'):
+            return
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+            fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return
+        if fd >= 0:
+            self.fd = fd
+
+    @property
+    def available(self):
+        return self.fd is not None
+
+    def add_watch(self, path, callback):
+        """Watch a directory; callback(name, mask) runs for each event."""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        with self.lock:
+            self.watches[wd] = callback
+        return wd
+
+    def poll(self):
+        """Dispatch every event queued since the last call."""
+        if self.fd is None:
+            return
+        with self.lock:
+            while True:
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    return
+                position = 0
+                while position < len(data):
+                    wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, position)
+                    position += self.EVENT_HEADER.size
+                    name = os.fsdecode(data[position:position + length].rstrip(b'\0'))
+                    position += length
+                    if mask & self.IN_Q_OVERFLOW:
+                        for callback in self.watches.values():
+                            callback(None, mask)
+                        continue
+                    callback = self.watches.get(wd)
+                    if callback is not None:
+                        callback(name, mask)
+                    if mask & self.IN_IGNORED:
+                        self.watches.pop(wd, None)
+
+
+class DirectoryIndex:
+    """In-memory listing of the visible regular files in one directory.
+
+    Entries are kept current from inotify events, restating only the names
+    that changed; where inotify is unavailable the directory is rescanned
+    when its mtime moves or every INDEX_POLL_INTERVAL seconds.
+
+    An index seeded from the catalog serves the catalog's entries at once
+    and leaves the first full scan to reconcile(), off the request path.
+    An entry keeps its checksum for as long as its size, mtime and inode
+    do not change.
+    """
+
+    def __init__(self, directory, inotify=None):
+        self.directory = directory
+        self.inotify = inotify
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.dirty = set()
+        self.needs_rescan = True
+        self.generation = 0
+        self.watching = False
+        self.scanned_at = 0.0
+        self.dir_mtime_ns = None
+        self.sorted_cache = {}
+        self.reconcile_pending = False
+        # Names restated while reconcile() was scanning
+        self.restated = set()
+        # Checksums for files the index has not caught up with yet
+        self.pending_checksums = {}
+        # Distinguishes this index's generations from those of another
+        # process (or an earlier run) in validators built from them
+        self.instance = secrets.token_hex(4)
+
+    def _on_event(self, name, mask):
+        with self.lock:
+            if mask & (Inotify.IN_Q_OVERFLOW | Inotify.IN_DELETE_SELF |
+                       Inotify.IN_MOVE_SELF | Inotify.IN_IGNORED):
+                self.needs_rescan = True
+                if mask & Inotify.IN_IGNORED:
+                    self.watching = False
+            elif name and not name.startswith('.'):
+                self.dirty.add(name)
+
+    def refresh(self):
+        """Bring the index up to date with the directory."""
+        if self.watching:
+            self.inotify.poll()
+        elif self.inotify is not None and self.inotify.available:
+            # (Re)establish the watch before scanning so no change is missed
+            try:
+                self.inotify.add_watch(self.directory, self._on_event)
+                self.watching = True
+                self.needs_rescan = not self.reconcile_pending
+            except OSError:
+                pass
+        dir_mtime_ns = None if self.watching else os.stat(self.directory).st_mtime_ns
+
+        with self.lock:
+            # A seeded index waits for reconcile() rather than rescanning here
+            if dir_mtime_ns is not None and not self.reconcile_pending and (
+                    dir_mtime_ns != self.dir_mtime_ns or
+                    time.monotonic() - self.scanned_at > INDEX_POLL_INTERVAL):
+                self.dir_mtime_ns = dir_mtime_ns
+                self.needs_rescan = True
+            if self.needs_rescan:
+                self._rescan()
+            elif self.dirty:
+                for name in self.dirty:
+                    self._restat(name)
+                self.dirty.clear()
+                self.generation += 1
+
+    def _scan(self):
+        """Stat every visible regular file; return {name: stat_result}."""
+        found = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_file():
+                        found[entry.name] = entry.stat()
+                except OSError:
+                    continue
+        return found
+
+    def _entry(self, name, st):
+        """Build the entry for name, keeping a checksum that still applies."""
+        key = (st.st_size, st.st_mtime_ns, st.st_ino)
+        old = self.entries.get(name)
+        pending = self.pending_checksums.pop(name, None)
+        if pending is not None and pending[:3] == key:
+            return make_index_entry(name, st, pending[3])
+        if old is not None and (old.size, old.mtime_ns, old.ino) == key:
+            return old
+        return make_index_entry(name, st)
+
+    def _rescan(self):
+        self.entries = {name: self._entry(name, st) for name, st in self._scan().items()}
+        self.dirty.clear()
+        self.needs_rescan = False
+        self.reconcile_pending = False
+        self.scanned_at = time.monotonic()
+        self.generation += 1
+
+    def _restat(self, name):
+        if self.reconcile_pending:
+            self.restated.add(name)
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+        except OSError:
+            self.entries.pop(name, None)
+            return
+        if stat.S_ISREG(st.st_mode):
+            self.entries[name] = self._entry(name, st)
+        else:
+            self.entries.pop(name, None)
+
+    def seed(self, rows):
+        """Start from (name, size, mtime_ns, ino, sha256) rows instead of a scan.
+
+        Does nothing once the index has been built; otherwise the rows are
+        trusted until reconcile() runs.
+        """
+        with self.lock:
+            if self.generation:
+                return
+            self.entries = {row[0]: build_index_entry(*row) for row in rows}
+            self.needs_rescan = False
+            self.reconcile_pending = True
+            self.dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+            self.scanned_at = time.monotonic()
+            self.generation += 1
+
+    def reconcile(self):
+        """Replace seeded entries with a full scan, without blocking readers."""
+        with self.lock:
+            self.restated.clear()
+        found = self._scan()
+        with self.lock:
+            if self.reconcile_pending:
+                self.entries = {name: self._entry(name, st) for name, st in found.items()}
+                # The scan may have seen these before they changed
+                self.dirty.update(self.restated)
+                self.restated.clear()
+                self.reconcile_pending = False
+                self.scanned_at = time.monotonic()
+                self.generation += 1
+
+    def set_checksums(self, checksums):
+        """Attach (name, size, mtime_ns, ino, sha256) checksums to matching entries."""
+        changed = False
+        with self.lock:
+            for name, size, mtime_ns, ino, sha256 in checksums:
+                entry = self.entries.get(name)
+                if entry is None or (entry.size, entry.mtime_ns, entry.ino) != (size, mtime_ns, ino):
+                    # Such as a fresh upload that has not been restated yet
+                    self.pending_checksums[name] = (size, mtime_ns, ino, sha256)
+                elif entry.sha256 != sha256:
+                    self.entries[name] = build_index_entry(name, size, mtime_ns, ino, sha256)
+                    changed = True
+            if changed:
+                self.generation += 1
+
+    def mark_dirty(self, name):
+        """Note that name changed; used by writers that bypass inotify."""
+        with self.lock:
+            self.dirty.add(name)
+
+    def items(self):
+        """Return a refreshed list of (name, IndexEntry) pairs."""
+        self.refresh()
+        with self.lock:
+            return list(self.entries.items())
+
+    def sorted_items(self, sort='name'):
+        """Return refreshed (sort key, name, IndexEntry) tuples in ascending order.
+
+        The sorted list is cached until the directory changes.
+        """
+        self.refresh()
+        with self.lock:
+            cached = self.sorted_cache.get(sort)
+            if cached is not None and cached[0] == self.generation:
+                return cached[1]
+            field = LIST_SORT_FIELDS[sort]
+            rows = sorted((entry[field] if field is not None else name, name, entry)
+                          for name, entry in self.entries.items())
+            self.sorted_cache[sort] = (self.generation, rows)
+            return rows
+
+    def version(self):
+        """Return a refreshed token that changes whenever the listing does."""
+        self.refresh()
+        with self.lock:
+            return '%s-%d' % (self.instance, self.generation)
+
+    def lookup(self, name):
+        """Return the refreshed IndexEntry for name, or None."""
+        self.refresh()
+        with self.lock:
+            return self.entries.get(name)
+
+
+# Sort orders accepted by /list, mapped to the IndexEntry field used as key
+LIST_SORT_FIELDS = {'name': None, 'size': 0, 'mtime': 1}
+# Largest page /list will return when a limit is given
+MAX_LIST_LIMIT = 10000
+# Entries per write when streaming a JSON array
+JSON_STREAM_BATCH = 1000
+
+
+def encode_list_cursor(row):
+    """Encode the position after a (key, name, entry) row as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(row[:2]).encode()).decode().rstrip('=')
+
+
+def decode_list_cursor(cursor):
+    """Decode a cursor from encode_list_cursor(); raise ValueError if invalid."""
+    try:
+        key, name = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(name, str) or not isinstance(key, (str, int)) or isinstance(key, bool):
+        raise ValueError("Invalid cursor")
+    return key, name
+
+
+def query_directory_index(index, sort='name', descending=False, prefix='', pattern=None,
+                          cursor=None, limit=None):
+    """Select one page of a DirectoryIndex.
+
+    Returns (rows, next_cursor) where rows are (key, name, IndexEntry)
+    tuples in the requested order and next_cursor is None on the last
+    page. Only the rows that are returned (plus any filtered out on the
+    way) are visited, so deep pages stay cheap.
+    """
+    rows = index.sorted_items(sort)
+    position = None
+    if cursor is not None:
+        position = decode_list_cursor(cursor)
+        if not isinstance(position[0], str if LIST_SORT_FIELDS[sort] is None else int):
+            raise ValueError("Cursor does not match the sort order")
+    if descending:
+        start = 0
+        stop = len(rows) if position is None else bisect.bisect_left(rows, position)
+    else:
+        stop = len(rows)
+        start = 0
+        if position is not None:
+            start = bisect.bisect_left(rows, position)
+            if start < len(rows) and rows[start][:2] == position:
+                start += 1
+        if prefix and sort == 'name':
+            start = max(start, bisect.bisect_left(rows, (prefix,)))
+
+    if not prefix and pattern is None:
+        # Unfiltered: the page is a plain slice (one extra row tells us
+        # whether another page follows)
+        if limit is None:
+            page = rows[start:stop]
+        elif descending:
+            page = rows[max(start, stop - limit - 1):stop]
+        else:
+            page = rows[start:start + limit + 1]
+        if descending:
+            page.reverse()
+        if limit is not None and len(page) > limit:
+            del page[limit:]
+            return page, encode_list_cursor(page[-1])
+        return page, None
+
+    if descending:
+        candidates = (rows[i] for i in range(stop - 1, start - 1, -1))
+    else:
+        candidates = (rows[i] for i in range(start, stop))
+
+    page = []
+    for row in candidates:
+        name = row[1]
+        if prefix and not name.startswith(prefix):
+            if sort == 'name' and not descending and name > prefix:
+                break
+            continue
+        if pattern is not None and not fnmatch.fnmatchcase(name, pattern):
+            continue
+        if limit is not None and len(page) == limit:
+            return page, encode_list_cursor(page[-1])
+        page.append(row)
+    return page, None
+
+
+_inotify = None
+_directory_indexes = {}
+_directory_indexes_lock = threading.Lock()
+
+
+def get_directory_index(directory):
+    """Return the shared DirectoryIndex for a directory."""
+    global _inotify
+    with _directory_indexes_lock:
+        index = _directory_indexes.get(directory)
+        if index is None:
+            if _inotify is None:
+                _inotify = Inotify()
+            index = _directory_indexes[directory] = DirectoryIndex(directory, _inotify)
+        return index
+
+
+# File metadata catalog (--catalog), kept in the state directory
+CATALOG_NAME = 'catalog.sqlite3'
+CHECKSUM_URL_PREFIX = '/checksum/'
+# Seconds between the background scanner's passes
+CATALOG_SCAN_INTERVAL = 30
+
+CatalogRow = namedtuple('CatalogRow', 'name size mtime_ns ino mime sha256')
+
+
+def guess_mime_type(name):
+    """Return the Content-Type a file is served with."""
+    ext = os.path.splitext(name)[1]
+    return (AuthHandler.extensions_map.get(ext) or AuthHandler.extensions_map.get(ext.lower()) or
+            mimetypes.guess_type(name)[0] or 'application/octet-stream')
+
+
+class Catalog:
+    """Persistent per-file metadata for one served directory.
+
+    Size, mtime, inode, MIME type and SHA-256 of every visible file are
+    kept in SQLite (.ts-server/catalog.sqlite3), written by the upload path
+    and by a background scanner that hashes files changed behind the
+    server's back. A row is only trusted while the file's size, mtime and
+    inode still match it. At startup the directory index is seeded from the
+    catalog so huge directories are listed at once, and the scanner
+    reconciles the index with the disk afterwards.
+
+    With --workers every process reads the catalog, but only the one
+    holding the scan lock hashes files.
+    """
+
+    def __init__(self, directory, index):
+        self.directory = directory
+        self.index = index
+        state_dir = os.path.join(directory, STATE_DIR_NAME)
+        os.makedirs(state_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(state_dir, CATALOG_NAME), timeout=30,
+                                  isolation_level=None, check_same_thread=False)
+        with self.lock:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER NOT NULL, '
+                            'mtime_ns INTEGER NOT NULL, ino INTEGER NOT NULL, mime TEXT NOT NULL, sha256 TEXT)')
+        self.scan_lock_path = os.path.join(state_dir, CATALOG_NAME + '.scan')
+        self.scan_lock = None
+        with self.lock:
+            index.seed(self.db.execute('SELECT name, size, mtime_ns, ino, sha256 FROM files'))
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def rows(self):
+        with self.lock:
+            return [CatalogRow(*row) for row in self.db.execute(
+                'SELECT name, size, mtime_ns, ino, mime, sha256 FROM files')]
+
+    def get(self, name):
+        with self.lock:
+            row = self.db.execute('SELECT name, size, mtime_ns, ino, mime, sha256 FROM files WHERE name = ?',
+                                  (name,)).fetchone()
+        return CatalogRow(*row) if row is not None else None
+
+    def record(self, name, st, sha256=None):
+        """Store the metadata of name as of st, and its checksum if known."""
+        row = CatalogRow(name, st.st_size, st.st_mtime_ns, st.st_ino, guess_mime_type(name), sha256)
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', row)
+        if sha256 is not None:
+            self.index.set_checksums([(name, row.size, row.mtime_ns, row.ino, sha256)])
+        return row
+
+    def forget(self, names):
+        with self.lock:
+            self.db.execute('BEGIN')
+            self.db.executemany('DELETE FROM files WHERE name = ?', ((name,) for name in names))
+            self.db.execute('COMMIT')
+
+    def checksum(self, name):
+        """Return the CatalogRow for name, hashing the file if its row is stale.
+
+        Raises OSError if name is not a regular file.
+        """
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            st = os.fstat(f.fileno())
+            if not stat.S_ISREG(st.st_mode):
+                raise IsADirectoryError(name)
+            row = self.get(name)
+            if row is not None and row.sha256 is not None and \
+                    (row.size, row.mtime_ns, row.ino) == (st.st_size, st.st_mtime_ns, st.st_ino):
+                return row
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+                digest.update(chunk)
+            after = os.fstat(f.fileno())
+        row = CatalogRow(name, st.st_size, st.st_mtime_ns, st.st_ino, guess_mime_type(name), digest.hexdigest())
+        if (after.st_size, after.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+            # Only a file that held still while it was read gets recorded
+            row = self.record(name, st, row.sha256)
+        return row
+
+    def holds_scan_lock(self):
+        """Become (or confirm being) the process that hashes files."""
+        if self.scan_lock is None:
+            f = open(self.scan_lock_path, 'a')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self.scan_lock = f
+        return True
+
+    def scan_once(self):
+        """Reconcile the catalog with the directory and hash what is missing."""
+        self.index.reconcile()
+        entries = self.index.items()
+        rows = {row.name: row for row in self.rows()}
+        self.forget(rows.keys() - {name for name, _ in entries})
+        known, missing = [], []
+        for name, entry in entries:
+            row = rows.get(name)
+            if row is not None and row.sha256 is not None and \
+                    (row.size, row.mtime_ns, row.ino) == (entry.size, entry.mtime_ns, entry.ino):
+                known.append((name, row.size, row.mtime_ns, row.ino, row.sha256))
+            else:
+                missing.append(name)
+        # Checksums recorded by another process or an earlier run
+        self.index.set_checksums(known)
+        if missing and self.holds_scan_lock():
+            for name in missing:
+                try:
+                    self.checksum(name)
+                except OSError:
+                    continue
+
+    def run(self):
+        while os.path.isdir(self.directory):
+            try:
+                self.scan_once()
+            except Exception:
+                logging.exception("Catalog scan of %s failed", self.directory)
+            time.sleep(CATALOG_SCAN_INTERVAL)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(directory):
+    """Return the shared Catalog for a served directory."""
+    with _catalogs_lock:
+        catalog = _catalogs.get(directory)
+        if catalog is None:
+            catalog = _catalogs[directory] = Catalog(directory, get_directory_index(directory))
+        return catalog
+
+
+# Files smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 1024
+# Larger files are only served compressed from a prebuilt sibling (.gz etc.)
+COMPRESS_MAX_SIZE = 64 * 1024 * 1024
+# Default bound on the on-disk cache of compressed variants
+COMPRESS_CACHE_SIZE = 256 * 1024 * 1024
+# Content encodings in order of preference, with the suffix of their
+# precompressed siblings
+CONTENT_ENCODINGS = [('zstd', '.zst'), ('br', '.br'), ('gzip', '.gz')]
+# Types that are already compressed and gain nothing from another pass.
+# Unknown types (application/octet-stream) are left alone too.
+INCOMPRESSIBLE_TYPES = re.compile(
+    r'^(image/(?!svg)|video/|audio/|font/woff|application/(octet-stream|zip|gzip|x-gzip|zstd|x-bzip2|x-xz|'
+    r'x-7z-compressed|x-rar-compressed|vnd\.rar|java-archive|pdf|x-compress|epub\+zip|'
+    r'vnd\.openxmlformats|vnd\.android\.package-archive))')
+
+
+def available_encodings():
+    """Return the content encodings this process can produce itself."""
+    encodings = ['gzip']
+    if zstandard is not None:
+        encodings.insert(0, 'zstd')
+    if brotli is not None:
+        encodings.insert(-1, 'br')
+    return encodings
+
+
+class _BrotliCompressor:
+    """Adapts brotli.Compressor to the compressobj interface."""
+
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.finish()
+
+
+def make_compressor(encoding):
+    """Return a streaming compressor (compress()/flush()) for a content encoding."""
+    if encoding == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    if encoding == 'br' and brotli is not None:
+        return _BrotliCompressor()
+    raise ValueError("Unsupported content encoding: %s" % encoding)
+
+
+def is_compressible(ctype):
+    """Return True if a MIME type is worth compressing."""
+    return not INCOMPRESSIBLE_TYPES.match(ctype)
+
+
+def acceptable_encodings(header):
+    """Return the encodings an Accept-Encoding header allows, best first.
+
+    Encodings are ordered by q-value, ties broken by CONTENT_ENCODINGS order.
+    """
+    qualities = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding] = quality
+    preference = [encoding for encoding, _ in CONTENT_ENCODINGS]
+    wildcard = qualities.get('*', 0.0)
+    ranked = [(qualities.get(encoding, wildcard), -preference.index(encoding), encoding)
+              for encoding in preference]
+    return [encoding for quality, _, encoding in sorted(ranked, reverse=True) if quality > 0]
+
+
+class CompressionCache:
+    """Size-bounded on-disk cache of compressed file variants.
+
+    Variants are keyed by the source file's ETag and the encoding, so a
+    changed file simply misses. Entries are evicted least recently used
+    first once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=COMPRESS_CACHE_SIZE):
+        self.path = os.path.join(directory, STATE_DIR_NAME, 'compressed')
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total = 0
+        self.building = {}
+        try:
+            existing = []
+            for entry in os.scandir(self.path):
+                if entry.name.endswith('.tmp'):
+                    os.unlink(entry.path)
+                    continue
+                st = entry.stat()
+                existing.append((st.st_mtime, entry.name, st.st_size))
+            for _, name, size in sorted(existing):
+                self.entries[name] = size
+                self.total += size
+        except OSError:
+            pass
+
+    def get(self, source, etag, encoding):
+        """Return the path of the compressed variant of an open file, building it if needed."""
+        extension = dict(CONTENT_ENCODINGS)[encoding]
+        name = hashlib.sha256((etag + encoding).encode()).hexdigest()[:32] + extension
+        path = os.path.join(self.path, name)
+        with self.lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                hit = True
+            else:
+                hit = False
+                build_lock = self.building.setdefault(name, threading.Lock())
+        if hit:
+            # The mtime keeps the LRU order across restarts
+            try:
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                # Evicted by another worker process; build it again
+                with self.lock:
+                    self.total -= self.entries.pop(name, 0)
+                    build_lock = self.building.setdefault(name, threading.Lock())
+            except OSError:
+                return path
+
+        with build_lock:
+            with self.lock:
+                if name in self.entries:
+                    return path
+            os.makedirs(self.path, exist_ok=True)
+            temp_path = '%s.%s.tmp' % (path, secrets.token_hex(4))
+            try:
+                compressor = make_compressor(encoding)
+                source.seek(0)
+                with open(temp_path, 'wb') as out:
+                    while True:
+                        chunk = source.read(COPY_BUFFER_SIZE)
+                        if not chunk:
+                            break
+                        out.write(compressor.compress(chunk))
+                    out.write(compressor.flush())
+                size = os.path.getsize(temp_path)
+                os.replace(temp_path, path)
+            except BaseException:
+                with self.lock:
+                    self.building.pop(name, None)
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                raise
+            with self.lock:
+                self.building.pop(name, None)
+                self.entries[name] = size
+                self.total += size
+                self._evict()
+        return path
+
+    def _evict(self):
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.total -= size
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except OSError:
+                pass
+
+
+_compression_caches = {}
+_compression_caches_lock = threading.Lock()
+
+
+def get_compression_cache(directory, max_bytes=COMPRESS_CACHE_SIZE):
+    """Return the shared CompressionCache for a served directory."""
+    with _compression_caches_lock:
+        cache = _compression_caches.get(directory)
+        if cache is None:
+            cache = _compression_caches[directory] = CompressionCache(directory, max_bytes)
+        return cache
+
+
+# Buffer size for the userspace copy used when sendfile() is not possible
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Rate limits allow bursts of this many seconds' worth of tokens
+RATE_BURST_SECONDS = 1.0
+# Largest slice of a throttled transfer sent or read at once
+THROTTLE_CHUNK_SIZE = 64 * 1024
+# Clients with buckets kept per limit; the least recently seen are dropped
+MAX_RATE_LIMITED_CLIENTS = 10000
+
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens per second, holding at most burst.
+
+    Shared by all of one client's connections, so it is thread-safe.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate * RATE_BURST_SECONDS)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        # Throttled transfers move about a tenth of a second's worth at a time
+        self.chunk_size = int(max(1024, min(THROTTLE_CHUNK_SIZE, rate / 10)))
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, count=1):
+        """Take count tokens if available; otherwise return the seconds until they are."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= count:
+                self.tokens -= count
+                return 0
+            return (count - self.tokens) / self.rate
+
+    def take(self, count):
+        """Take count tokens, sleeping until the bucket has paid for them."""
+        with self.lock:
+            self._refill()
+            # Going into debt queues concurrent callers behind each other
+            self.tokens -= count
+            deficit = -self.tokens
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+            record_phase('throttle', deficit / self.rate)
+
+
+class RateLimiter:
+    """A TokenBucket per client for one limit."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def bucket(self, key):
+        """Return the bucket for a client key, creating it if needed."""
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = TokenBucket(self.rate)
+                if len(self.buckets) > MAX_RATE_LIMITED_CLIENTS:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+            return bucket
+
+
+class ThrottledReader:
+    """Wrap a request body stream so reads are paced by a TokenBucket."""
+
+    def __init__(self, rfile, bucket):
+        self.rfile = rfile
+        self.bucket = bucket
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.bucket.chunk_size:
+            size = self.bucket.chunk_size
+        data = self.rfile.read(size)
+        self.bucket.take(len(data))
+        return data
+
+
+class LimitedReader:
+    """Expose the first length bytes of a request body as a stream of its own."""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return b''
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        if not data:
+            self.remaining = 0
+        return data
+
+    def drain(self):
+        """Discard what is left, so the connection can carry another request."""
+        while self.read(STREAM_CHUNK_SIZE):
+            pass
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(kind, rate):
+    """Return the shared RateLimiter for a kind of limit ('requests', 'upload', 'download')."""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get((kind, rate))
+        if limiter is None:
+            limiter = _rate_limiters[kind, rate] = RateLimiter(rate)
+        return limiter
+
+
+def send_file_range(outputfile, source, offset, count, sock=None, throttle=None):
+    """Send count bytes of source, starting at offset, to the client.
+
+    When sock is a plain socket (or an asyncio engine connection) the
+    kernel copies the data with sendfile() and it never passes through
+    Python; otherwise the bytes are copied into
+    outputfile through one large reusable buffer. With a throttle
+    TokenBucket the data goes out in slices paid for one at a time.
+    Returns the bytes sent.
+    """
+    if count <= 0:
+        return 0
+    if sock is not None and type(sock) in (socket.socket, AsyncConnection) and hasattr(os, 'sendfile'):
+        try:
+            source.fileno()
+        except (AttributeError, OSError, ValueError):
+            pass
+        else:
+            # These bytes bypass the handler's counted wfile
+            counted = outputfile.add if isinstance(outputfile, CountingStream) else \
+                partial(METRICS.inc, 'ts_server_sent_bytes_total')
+            if throttle is None:
+                with request_phase('send'):
+                    sent = sock.sendfile(source, offset, count)
+                counted(sent)
+                return sent
+            sent = 0
+            while sent < count:
+                step = min(throttle.chunk_size, count - sent)
+                throttle.take(step)
+                with request_phase('send'):
+                    step = sock.sendfile(source, offset + sent, step)
+                if not step:
+                    break
+                sent += step
+                counted(step)
+            return sent
+
+    source.seek(offset)
+    buffer_size = throttle.chunk_size if throttle is not None else COPY_BUFFER_SIZE
+    buffer = memoryview(bytearray(min(buffer_size, count)))
+    sent = 0
+    while sent < count:
+        read = source.readinto(buffer[:min(len(buffer), count - sent)])
+        if not read:
+            break
+        if throttle is not None:
+            throttle.take(read)
+        outputfile.write(buffer[:read])
+        sent += read
+    return sent
+
+
+# Requests asking for more ranges than this get the whole file instead
+MAX_RANGES = 64
+
+
+def parse_range_header(header, size):
+    """Parse a Range header into sorted, merged (start, end) inclusive ranges.
+
+    Returns None if the header is malformed, uses a unit other than bytes or
+    asks for too many ranges; the whole file should then be served. Returns
+    an empty list if none of the ranges can be satisfied (416).
+    """
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+    specs = specs.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.strip().partition('-')
+        if not dash or not (first + last).isdigit():
+            return None
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length > 0 and size > 0:
+                ranges.append((max(0, size - length), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            end = int(last) if last else size - 1
+            ranges.append((start, min(end, size - 1)))
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def file_etag(size, mtime_ns, ino):
+    """Return the strong ETag for a file version."""
+    return '"%x-%x-%x"' % (ino, size, mtime_ns)
+
+
+def etag_matches(header, etag, weak=True):
+    """Return True if an If-None-Match/If-Range style header matches etag.
+
+    With weak=True the W/ prefix is ignored on both sides (the comparison
+    If-None-Match uses); otherwise both tags must be strong and identical.
+    """
+    header = header.strip()
+    if header == '*':
+        return True
+    if not weak:
+        return not etag.startswith('W/') and header == etag
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+# Archive downloads stream a selection of files and directories as one
+# zip, tar or gzipped tar, built on the fly: no temp archive, and only one
+# member is open at a time
+ARCHIVE_URL = '/archive'
+ARCHIVE_FORMATS = {
+    'zip': ('application/zip', '.zip'),
+    'tar': ('application/x-tar', '.tar'),
+    'tgz': ('application/gzip', '.tar.gz'),
+}
+DEFAULT_ARCHIVE_FORMAT = 'zip'
+# Largest urlencoded POST /archive body (a long selection) accepted
+MAX_ARCHIVE_FORM_SIZE = 4 * 1024 * 1024
+# Range of timestamps a zip entry can hold
+ZIP_MIN_DATE = (1980, 1, 1, 0, 0, 0)
+ZIP_MAX_DATE = (2107, 12, 31, 23, 59, 58)
+
+
+def select_archive_paths(directory, paths):
+    """Resolve client paths into sorted (archive name, filesystem path) pairs.
+
+    Paths are relative to directory; '/' selects all of it, under the
+    empty archive name. Paths inside another selected directory are
+    dropped so no member is archived twice. Raises ValueError for '..' or
+    dot-prefixed components and FileNotFoundError for missing paths.
+    """
+    selection = {}
+    for path in paths:
+        parts = [part for part in path.split('/') if part]
+        if any(part.startswith('.') or '\0' in part for part in parts):
+            raise ValueError(path)
+        selection['/'.join(parts)] = os.path.join(directory, *parts)
+    selected = []
+    for name in sorted(selection):
+        parts = name.split('/')
+        ancestors = [''] + ['/'.join(parts[:i]) for i in range(1, len(parts))] if name else []
+        if any(ancestor in selection for ancestor in ancestors):
             continue
-            
-        # Split headers and content
-        if b'\r\n\r\n' in part:
-            headers_section, content = part.split(b'\r\n\r\n', 1)
+        if not os.path.exists(selection[name]):
+            raise FileNotFoundError(name)
+        selected.append((name, selection[name]))
+    return selected
+
+
+def iter_archive_files(selection):
+    """Yield (archive name, open file, stat result) for each regular file selected.
+
+    Directories are walked in name order without following symlinked
+    subdirectories; dot-prefixed names are skipped. Files that vanish or
+    cannot be read are left out.
+    """
+    def walk(name, path):
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            child = name + '/' + entry.name if name else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from walk(child, entry.path)
+                elif entry.is_file():
+                    yield child, entry.path
+            except OSError:
+                continue
+
+    def files():
+        for name, path in selection:
+            if os.path.isdir(path):
+                yield from walk(name, path)
+            else:
+                yield name, path
+
+    for name, path in files():
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            continue
+        with f:
+            st = os.fstat(f.fileno())
+            if stat.S_ISREG(st.st_mode):
+                yield name, f, st
+
+
+class ArchiveStream:
+    """The write end of an archive download.
+
+    Small writes (member headers, padding) are coalesced into chunks of
+    chunk_size bytes, framed for chunked transfer coding when chunked is
+    set, optionally compressed and paced by a download throttle. File
+    bodies that need no compression are sent by write_file() with
+    sendfile() as chunks of their own.
+    """
+
+    def __init__(self, wfile, chunked, sock=None, throttle=None, compressor=None):
+        self.wfile = wfile
+        self.chunked = chunked
+        self.sock = sock
+        self.throttle = throttle
+        self.compressor = compressor
+        self.chunk_size = throttle.chunk_size if throttle is not None else STREAM_CHUNK_SIZE
+        self.buffer = bytearray()
+
+    def write(self, data):
+        size = len(data)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+        return size
+
+    def write_file(self, f, size):
+        """Write the first size bytes of f; raise OSError if it has fewer."""
+        if self.compressor is not None or size < self.chunk_size:
+            # Small files are coalesced with their neighbours' headers
+            remaining = size
+            while remaining:
+                data = f.read(min(self.chunk_size, remaining))
+                if not data:
+                    raise OSError("File shrank while being archived")
+                self.write(data)
+                remaining -= len(data)
+            return
+        self.flush()
+        if self.chunked:
+            self.wfile.write(b'%x\r\n' % size)
+        if send_file_range(self.wfile, f, 0, size, sock=self.sock, throttle=self.throttle) != size:
+            raise OSError("File shrank while being archived")
+        if self.chunked:
+            self.wfile.write(b'\r\n')
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.throttle is not None:
+            self.throttle.take(len(self.buffer))
+        if self.chunked:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(self.buffer), self.buffer))
         else:
+            self.wfile.write(self.buffer)
+        self.buffer = bytearray()
+
+    def close(self):
+        """Flush the compressor and buffer and end the chunked body."""
+        if self.compressor is not None:
+            self.buffer += self.compressor.flush()
+        self.flush()
+        if self.chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+
+def write_tar_archive(stream, files):
+    """Write (name, file, stat) members to stream as a POSIX (pax) tar."""
+    offset = 0
+    for name, f, st in files:
+        info = tarfile.TarInfo(name)
+        info.size = st.st_size
+        info.mtime = int(st.st_mtime)
+        info.mode = stat.S_IMODE(st.st_mode)
+        header = info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+        padding = -info.size % tarfile.BLOCKSIZE
+        stream.write(header)
+        stream.write_file(f, info.size)
+        stream.write(tarfile.NUL * padding)
+        offset += len(header) + info.size + padding
+    # Two empty blocks end the archive, padded out to a full record
+    offset += 2 * tarfile.BLOCKSIZE
+    stream.write(tarfile.NUL * (2 * tarfile.BLOCKSIZE + -offset % tarfile.RECORDSIZE))
+
+
+def write_zip_archive(stream, files):
+    """Write (name, file, stat) members to stream as a stored (uncompressed) zip.
+
+    The stream cannot seek, so each member's CRC and sizes follow its data
+    in a data descriptor; Zip64 records are used for large members. The
+    central directory, written last, is the only state kept per member.
+    """
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+        for name, f, st in files:
+            info = zipfile.ZipInfo(name, max(ZIP_MIN_DATE, min(ZIP_MAX_DATE, time.localtime(st.st_mtime)[:6])))
+            info.external_attr = (st.st_mode & 0xFFFF) << 16
+            # Read by zipfile to decide on Zip64 before any data is written
+            info.file_size = st.st_size
+            with archive.open(info, 'w') as member:
+                remaining = st.st_size
+                while remaining:
+                    data = f.read(min(stream.chunk_size, remaining))
+                    if not data:
+                        raise OSError("File shrank while being archived")
+                    member.write(data)
+                    remaining -= len(data)
+
+
+# Tar streams posted here are extracted into the served directory
+EXTRACT_URL = '/extract'
+
+
+def make_directories(directory, parts, created):
+    """Create the directory named by the path components parts below directory.
+
+    Raises ValueError where a component exists as anything but a real
+    directory, so extraction never follows a symlink out of the tree.
+    created caches the directories already made or checked.
+    """
+    path = directory
+    for part in parts:
+        path = os.path.join(path, part)
+        if path in created:
             continue
-            
-        # Remove trailing boundary markers
-        content = content.rstrip(b'\r\n--')
-        
-        # Parse the Content-Disposition header
-        headers_text = headers_section.decode('utf-8', errors='ignore')
-        if 'filename=' in headers_text:
-            # Extract filename
-            filename_match = re.search(r'filename="([^"]*)"', headers_text)
-            if filename_match:
-                filename = filename_match.group(1)
-                if filename:  # Only add if filename is not empty
-                    files.append({
-                        'filename': filename,
-                        'content': content
-                    })
-    
-    return files
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            if not stat.S_ISDIR(os.lstat(path).st_mode):
+                raise ValueError(path)
+        created.add(path)
+
+
+def content_disposition(filename):
+    """Return an attachment Content-Disposition header value for filename."""
+    fallback = re.sub(r'[^A-Za-z0-9._-]', '_', filename)
+    return "attachment; filename=\"%s\"; filename*=UTF-8''%s" % (fallback, urllib.parse.quote(filename))
+
+
+# Seconds a persistent connection may wait for its next request
+KEEPALIVE_TIMEOUT = 15
+# Requests served on one connection before the server closes it
+KEEPALIVE_MAX_REQUESTS = 1000
+# Unread request body bytes drained after a response to keep the
+# connection open; a larger remainder closes it instead
+MAX_DRAINED_BODY = 64 * 1024
+
+
+# Sessions and share links are signed with this secret. It is created once
+# per server start, before prefork workers fork, so every worker accepts
+# the others' tokens
+SESSION_SECRET = secrets.token_bytes(32)
+SESSION_COOKIE = 'ts_session'
+# Seconds a session cookie issued after Basic auth stays valid
+SESSION_TTL = 12 * 3600
+# Default and longest lifetime of a share link, in seconds
+SHARE_LINK_TTL = 24 * 3600
+MAX_SHARE_LINK_TTL = 30 * 24 * 3600
+
+
+def sign_token(key, *fields):
+    """Return the URL-safe HMAC-SHA256 signature of fields."""
+    message = '\n'.join(str(field) for field in fields).encode()
+    digest = hmac.new(key, message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def token_valid(key, signature, expires, *fields):
+    """Return True if signature signs fields plus expires and expires is in the future."""
+    if not expires.isascii() or not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(sign_token(key, *fields, expires).encode(), signature.encode())
+
 
 def generate_password(length=12):
     """Generate a random password of the given length."""
     alphabet = string.ascii_letters + string.digits
     return ''.join(secrets.choice(alphabet) for _ in range(length))
 
+
+# Methods the handler implements; /metrics counts anything else as 'other'
+METRIC_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE'))
+# Every label request_route() returns
+REQUEST_ROUTES = ('page', 'upload', 'list', 'share', 'archive', 'extract', 'metrics', 'profile',
+                  'checksum', 'static', 'resumable', 'file')
+
+
+def request_route(command, path):
+    """Classify a request into one of the fixed route labels /metrics uses."""
+    path = urllib.parse.urlsplit(path).path
+    if path == '/':
+        return 'upload' if command == 'POST' else 'page'
+    if path in ('/list', '/share', ARCHIVE_URL, EXTRACT_URL, METRICS_URL, PROFILE_URL):
+        return path[1:]
+    if path.startswith(CHECKSUM_URL_PREFIX):
+        return 'checksum'
+    if path.startswith(STATIC_URL_PREFIX):
+        return 'static'
+    if UPLOAD_PATH_RE.match(path):
+        return 'resumable'
+    return 'file'
+
 class AuthHandler(SimpleHTTPRequestHandler):
-    def __init__(self, *args, use_auth=False, password='', **kwargs):
+    # Serve file bodies with sendfile() where possible; the benchmarks turn
+    # this off to measure the userspace copy path.
+    use_sendfile = True
+
+    # Persistent connections: every response carries a Content-Length, is
+    # chunked, or closes the connection
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # second one waits for the client's delayed ACK on a reused connection
+    disable_nagle_algorithm = True
+    # Set per connection in setup() unless access logging is off
+    access_logger = None
+
+    # Common text formats mimetypes does not know, so they are compressed
+    extensions_map = dict(SimpleHTTPRequestHandler.extensions_map, **{
+        '.log': 'text/plain',
+        '.jsonl': 'application/x-ndjson',
+        '.ndjson': 'application/x-ndjson',
+        '.yaml': 'application/yaml',
+        '.yml': 'application/yaml',
+    })
+
+    def __init__(self, *args, use_auth=False, password='',
+                 compress_cache_size=COMPRESS_CACHE_SIZE, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                 max_requests=KEEPALIVE_MAX_REQUESTS, session_ttl=SESSION_TTL,
+                 request_rate=0, upload_rate=0, download_rate=0,
+                 durability=DEFAULT_DURABILITY, dedup=False, catalog=False, access_log='-', profiler=None,
+                 server_timing=False, **kwargs):
         self.use_auth = use_auth
         self.username = 'user'
         self.password = password
+        self.signing_key = SESSION_SECRET + password.encode()
+        self.session_ttl = session_ttl
+        self.session_cookie = None
+        # Per-client limits in requests and bytes per second; 0 is unlimited
+        self.request_rate = request_rate
+        self.upload_rate = upload_rate
+        self.download_rate = download_rate
+        self.durability = durability
+        self.dedup = dedup
+        self.use_catalog = catalog
+        # '-' for stderr, a file path, or None for no access log
+        self.access_log = access_log
+        # A RequestProfiler with --profile; None costs nothing per request
+        self.profiler = profiler
+        self.profile = None
+        # Send each request's phase timings in a Server-Timing header
+        self.server_timing = server_timing
+        self.timer = None
+        self.compress_cache_size = compress_cache_size
+        self.keepalive_timeout = keepalive_timeout
+        self.max_requests = max_requests
+        self.requests_served = 0
+        self.response_started = False
+        self.close_after_response = False
+        self.request_started = None
+        self.response_status = None
+        # The request body, capped at its Content-Length
+        self.body = None
+        # 'all', 'download' or 'upload' once require_auth() admits the request
+        self.auth_scope = None
         super().__init__(*args, **kwargs)
 
     def add_security_headers(self):
@@ -75,12 +2617,259 @@ class AuthHandler(SimpleHTTPRequestHandler):
         self.send_header('X-XSS-Protection', '1; mode=block')
         self.send_header('Referrer-Policy', 'strict-origin-when-cross-origin')
 
-    def do_AUTHHEAD(self):
+    def add_cache_headers(self, etag=None, last_modified=None, cache_control=None, vary=False):
+        """Add validators and a Cache-Control policy to a response.
+
+        vary marks responses whose content encoding was negotiated.
+        """
+        if vary:
+            self.send_header('Vary', 'Accept-Encoding')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if last_modified is not None:
+            self.send_header('Last-Modified', last_modified)
+        if cache_control is None:
+            # Always revalidate; keep authenticated content out of shared caches
+            cache_control = 'private, no-cache' if self.use_auth else 'no-cache'
+        self.send_header('Cache-Control', cache_control)
+
+    def setup(self):
+        super().setup()
+        self.rfile = CountingStream(self.rfile, 'ts_server_received_bytes_total', 'read')
+        self.wfile = CountingStream(self.wfile, 'ts_server_sent_bytes_total', 'send')
+        self.access_logger = get_access_log(self.access_log) if self.access_log else None
+
+    def handle(self):
+        """Serve requests until the client closes, idles or reaches max_requests.
+
+        The asyncio engine hands over one request at a time and waits for
+        the next one itself.
+        """
+        if isinstance(self.request, AsyncConnection):
+            self.requests_served = self.request.requests_served
+            self.handle_one_request()
+            return
+        METRICS.inc('ts_server_active_connections')
+        try:
+            self.close_connection = True
+            self.handle_one_request()
+            while not self.close_connection and self.wait_for_request():
+                self.handle_one_request()
+        finally:
+            METRICS.inc('ts_server_active_connections', -1)
+
+    def handle_one_request(self):
+        """Handle one request and record it in the request metrics and access log."""
+        self.request_started = None
+        self.timer = None
+        self.body = None
+        received, sent = self.rfile.count, self.wfile.count
+        try:
+            super().handle_one_request()
+            self.discard_request_body()
+        finally:
+            _request_timer.timer = None
+            if self.profile is not None:
+                self.profiler.finish(self.profile)
+                self.profile = None
+            if self.request_started is not None:
+                duration = time.perf_counter() - self.request_started
+                route = request_route(self.command, self.path) if self.command else 'invalid'
+                method = self.command if self.command in METRIC_METHODS else 'other'
+                METRICS.inc('ts_server_requests_total', labels=(
+                    ('route', route), ('method', method), ('status', str(self.response_status or 0))))
+                METRICS.observe('ts_server_request_duration_seconds', duration, (('route', route),))
+                if self.access_logger is not None:
+                    self.access_logger.log({
+                        'time': log_timestamp(),
+                        'client': self.log_client(),
+                        'method': self.command,
+                        'path': self.path if self.command else None,
+                        'route': route,
+                        'status': self.response_status,
+                        'bytes': self.wfile.count - sent,
+                        'received': self.rfile.count - received,
+                        'duration_ms': round(duration * 1000, 3),
+                        'timings': self.timer.milliseconds() if self.timer is not None else {},
+                    })
+
+    def discard_request_body(self):
+        """Drain what the handler left of the request body, or close the connection.
+
+        Unread body bytes would otherwise be parsed as the next request on
+        the connection.
+        """
+        if self.body is None or self.body.remaining <= 0 or self.close_connection:
+            return
+        if self.body.remaining > MAX_DRAINED_BODY:
+            self.close_connection = True
+            return
+        try:
+            self.body.drain()
+        except OSError:
+            self.close_connection = True
+
+    def log_client(self):
+        """Return the client as rate limits see it, or the peer address before the headers are parsed."""
+        try:
+            return self.client_key()
+        except AttributeError:
+            return self.client_address[0]
+
+    def log_request(self, code='-', size='-'):
+        """Do nothing: handle_one_request() logs the request once its response is complete."""
+
+    def log_message(self, format, *args):
+        """Queue a message for the access log writer instead of writing to stderr."""
+        if self.access_logger is not None:
+            self.access_logger.log({'time': log_timestamp(), 'client': self.log_client(),
+                                    'message': format % args})
+
+    def wait_for_request(self):
+        """Wait up to keepalive_timeout for the next request on the connection.
+
+        On the pool engine an idle connection holds a worker, so it is
+        given up as soon as another connection is queued for one.
+        """
+        timeout = self.connection.gettimeout()
+        connections_waiting = getattr(self.server, 'connections_waiting', None)
+        try:
+            if connections_waiting is not None:
+                # Without blocking, peek() returns pipelined data or nothing
+                self.connection.settimeout(0)
+                if self.rfile.peek(1):
+                    return True
+                deadline = time.monotonic() + self.keepalive_timeout
+                while not select.select([self.connection], [], [], WORKER_IDLE_POLL)[0]:
+                    if connections_waiting() or time.monotonic() >= deadline:
+                        return False
+                self.connection.settimeout(timeout)
+            else:
+                self.connection.settimeout(self.keepalive_timeout)
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(timeout)
+
+    def parse_request(self):
+        """Parse the request head, noting bodies that would go unread."""
+        self.close_after_response = False
+        self.session_cookie = None
+        self.auth_scope = None
+        self.request_started = time.perf_counter()
+        self.response_status = None
+        if not super().parse_request():
+            return False
+        self.timer = _request_timer.timer = RequestTimer()
+        # Handlers read the body through self.body, so they can never read
+        # into the next request; only Content-Length bodies are understood
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if length < 0 or 'Transfer-Encoding' in self.headers:
+            self.close_after_response = True
+            length = 0
+        self.body = LimitedReader(self.rfile, length)
+        if self.request_rate:
+            retry_after = get_rate_limiter('requests', self.request_rate).bucket(self.client_key()).try_take()
+            if retry_after:
+                self.send_rate_limited(retry_after)
+                return False
+        if self.profiler is not None:
+            self.profile = self.profiler.start(request_route(self.command, self.path))
+        return True
+
+    def client_key(self):
+        """Return the identity rate limits are kept for.
+
+        Behind a local proxy such as Funnel every connection comes from
+        loopback, so the proxy's Tailscale-User-Login or X-Forwarded-For
+        identifies the client instead.
+        """
+        address = self.client_address[0]
+        if address in ('127.0.0.1', '::1', '::ffff:127.0.0.1'):
+            login = self.headers.get('Tailscale-User-Login')
+            if login:
+                return 'user:' + login
+            forwarded = self.headers.get('X-Forwarded-For')
+            if forwarded:
+                # The last hop is the one the proxy itself added
+                return forwarded.split(',')[-1].strip()
+        return address
+
+    def send_rate_limited(self, retry_after):
+        """Answer a client over its request rate with 429 and Retry-After."""
+        body = b'Too many requests, retry shortly.\n'
+        self.log_error("code 429, rate limit exceeded by %s", self.client_key())
+        self.send_response(429)
+        self.send_header('Retry-After', str(max(1, math.ceil(retry_after))))
+        self.send_header('Content-type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        if self.has_request_body():
+            self.close_after_response = True
+        self.add_security_headers()
+        self.end_headers()
+        self.write_body(body)
+
+    def upload_throttle(self):
+        """Return the client's upload TokenBucket, or None without a limit."""
+        if not self.upload_rate:
+            return None
+        return get_rate_limiter('upload', self.upload_rate).bucket(self.client_key())
+
+    def download_throttle(self):
+        """Return the client's download TokenBucket, or None without a limit."""
+        if not self.download_rate:
+            return None
+        return get_rate_limiter('download', self.download_rate).bucket(self.client_key())
+
+    def request_body(self):
+        """Return the stream to read the request body from, paced by the upload limit."""
+        throttle = self.upload_throttle()
+        return self.body if throttle is None else ThrottledReader(self.body, throttle)
+
+    def has_request_body(self):
+        return self.headers.get('Content-Length', '0').strip() not in ('', '0')
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        self.response_started = True
+        self.response_status = code
+
+    def end_headers(self):
+        """Finish the headers, announcing whether the connection stays open."""
+        if self.response_started:
+            self.response_started = False
+            self.requests_served += 1
+            if self.session_cookie is not None:
+                self.send_header('Set-Cookie', self.session_cookie)
+                self.session_cookie = None
+            if self.body is not None and self.body.remaining > MAX_DRAINED_BODY:
+                # Too much of the body is left to drain afterwards
+                self.close_after_response = True
+            if not self.close_connection:
+                if self.close_after_response or self.requests_served >= self.max_requests:
+                    self.send_header('Connection', 'close')
+                elif self.request_version == 'HTTP/1.0':
+                    self.send_header('Connection', 'keep-alive')
+            if self.server_timing and self.timer is not None:
+                # Phases still running, like writing the body, are only logged
+                self.send_header('Server-Timing', self.timer.header(time.perf_counter() - self.request_started))
+        super().end_headers()
+
+    def do_AUTHHEAD(self, body=b'Authentication required'):
         self.send_response(401)
         self.send_header('WWW-Authenticate', 'Basic realm="Restricted Access"')
         self.send_header('Content-type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        if self.has_request_body():
+            # The body of an unauthenticated request is never read
+            self.close_after_response = True
         self.add_security_headers()
         self.end_headers()
+        self.write_body(body)
 
     def authenticate(self, auth_header):
         """Safely parse and validate the basic authentication header with timing attack protection."""
@@ -98,51 +2887,669 @@ class AuthHandler(SimpleHTTPRequestHandler):
             logging.warning("Failed to parse authentication header")
             return False
 
+    def require_auth(self):
+        """Return True if the request may proceed, otherwise send a 401 or 403.
+
+        A signed link or a session cookie is checked before Basic auth, so
+        the credentials are only parsed when neither admits the request;
+        successful Basic auth then starts a session.
+        """
+        if not self.use_auth:
+            self.auth_scope = 'all'
+            return True
+        with request_phase('auth'):
+            session = self.session_scope()
+            scope = self.link_scope(session) if 'sig=' in self.path else None
+            if scope is None:
+                scope = session
+            auth_header = None
+            if not self.scope_allows(scope):
+                auth_header = self.headers.get('Authorization')
+                if auth_header and self.authenticate(auth_header):
+                    scope = 'all'
+                    self.start_session(scope, int(time.time()) + self.session_ttl)
+        if scope is None:
+            METRICS.inc('ts_server_auth_failures_total',
+                        labels=(('reason', 'invalid' if auth_header else 'missing'),))
+            self.do_AUTHHEAD()
+            return False
+        if not self.scope_allows(scope):
+            METRICS.inc('ts_server_auth_failures_total', labels=(('reason', 'scope'),))
+            self.send_error(403, "Not allowed by this link")
+            return False
+        self.auth_scope = scope
+        return True
+
+    def session_scope(self):
+        """Return the scope of the request's valid session cookie, or None."""
+        for header in self.headers.get_all('Cookie', ()):
+            for cookie in header.split(';'):
+                name, _, value = cookie.strip().partition('=')
+                if name != SESSION_COOKIE:
+                    continue
+                scope, _, rest = value.partition('.')
+                expires, _, signature = rest.partition('.')
+                if token_valid(self.signing_key, signature, expires, 'session', scope):
+                    return scope
+        return None
+
+    def start_session(self, scope, expires):
+        """Set a session cookie with scope 'all' or 'upload' on the response."""
+        max_age = expires - int(time.time())
+        if max_age <= 0:
+            return
+        value = '%s.%d.%s' % (scope, expires, sign_token(self.signing_key, 'session', scope, expires))
+        self.session_cookie = '%s=%s; Path=/; Max-Age=%d; HttpOnly; SameSite=Lax' % (
+            SESSION_COOKIE, value, max_age)
+
+    def link_scope(self, session=None):
+        """Return 'download' or 'upload' if the URL carries a valid signature.
+
+        The signature is removed from self.path. Opening an upload link
+        also starts an upload session, so the page it serves can post the
+        files.
+        """
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        expires = query.get('expires', [''])[-1]
+        signature = query.get('sig', [''])[-1]
+        path = urllib.parse.unquote(url.path)
+        if self.command in ('GET', 'HEAD') and token_valid(
+                self.signing_key, signature, expires, 'download', path):
+            scope = 'download'
+        elif path == '/' and token_valid(self.signing_key, signature, expires, 'upload', path):
+            scope = 'upload'
+            if self.command == 'GET' and session != 'all':
+                self.start_session(scope, int(expires))
+        else:
+            return None
+        self.path = url.path
+        return scope
+
+    def scope_allows(self, scope):
+        """Return True if a session or link of the given scope covers this request."""
+        if scope in ('all', 'download'):
+            # Download links are only valid for the path they sign
+            return True
+        if scope == 'upload':
+            path = urllib.parse.urlsplit(self.path).path
+            return (path == '/' or path.startswith(STATIC_URL_PREFIX) or
+                    UPLOAD_PATH_RE.match(path) is not None)
+        return False
+
+    def create_share_link(self):
+        """Sign a download or upload link from {"path", "action", "expires_in"}."""
+        request = self.read_json_body()
+        if not isinstance(request, dict):
+            request = {}
+        path = request.get('path')
+        action = request.get('action', 'download')
+        expires_in = request.get('expires_in', SHARE_LINK_TTL)
+        if action == 'upload' and path is None:
+            path = '/'
+        if (not isinstance(path, str) or not path.startswith('/') or
+                action not in ('download', 'upload') or (action == 'upload' and path != '/') or
+                not isinstance(expires_in, int) or not 0 < expires_in <= MAX_SHARE_LINK_TTL):
+            self.send_error(400, "Expected a JSON object with path, action and expires_in")
+            return
+        path = urllib.parse.unquote(urllib.parse.urlsplit(path).path)
+        expires = int(time.time()) + expires_in
+        query = urllib.parse.urlencode({
+            'expires': expires, 'sig': sign_token(self.signing_key, action, path, expires)})
+        self.send_json(200, {'url': urllib.parse.quote(path) + '?' + query, 'expires': expires})
+
+    def write_body(self, data):
+        """Write a response body, skipping it for HEAD requests."""
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def send_json(self, status, obj, headers=None):
+        """Send obj as a JSON response."""
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.add_cache_headers(cache_control='no-store')
+        self.add_security_headers()
+        self.end_headers()
+        self.write_body(body)
+
     def do_GET(self):
         """Handle GET requests - serve files or the upload page."""
-        if self.use_auth:
-            auth_header = self.headers.get('Authorization')
-            if not auth_header or not self.authenticate(auth_header):
-                self.do_AUTHHEAD()
-                self.wfile.write(b'Authentication required')
-                return
+        if not self.require_auth():
+            return
+
+        url = urllib.parse.urlsplit(self.path)
 
         # Serve the file list as JSON
-        if self.path == '/list':
-            files = self.list_directory_json()
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.add_security_headers()
-            self.end_headers()
-            self.wfile.write(json.dumps(files).encode())
+        if url.path == '/list':
+            self.send_file_list(urllib.parse.parse_qs(url.query))
+            return
+
+        # Serve telemetry for Prometheus
+        if url.path == METRICS_URL:
+            self.send_metrics()
+            return
+
+        # Report the profiled requests
+        if url.path == PROFILE_URL and self.profiler is not None:
+            self.send_profile(urllib.parse.parse_qs(url.query))
+            return
+
+        # Stream an archive of the selected files
+        if url.path == ARCHIVE_URL:
+            self.send_archive(urllib.parse.parse_qs(url.query))
+            return
+
+        # Report a file's checksum
+        if url.path.startswith(CHECKSUM_URL_PREFIX):
+            self.send_checksum(urllib.parse.unquote(url.path[len(CHECKSUM_URL_PREFIX):]))
             return
 
         # Serve the upload page for the root path
-        if self.path == '/':
+        if url.path == '/':
             self.send_upload_page()
             return
+
+        # Serve the page's stylesheet and script
+        asset = STATIC_ASSETS.get(url.path)
+        if asset is not None:
+            self.send_static_asset(asset)
+            return
+
+        # Report the state of a resumable upload
+        upload_match = UPLOAD_PATH_RE.match(url.path)
+        if upload_match and upload_match.group(1) and not upload_match.group(2):
+            self.handle_upload_session(upload_match.group(1))
+            return
         
         # Serve files for other paths
-        super().do_GET()
+        f = self.send_head()
+        if f:
+            try:
+                self.send_body(f)
+            finally:
+                f.close()
+
+    def do_HEAD(self):
+        """Handle HEAD requests exactly like GET, minus the body."""
+        self.do_GET()
+
+    def if_range_matches(self, etag, last_modified):
+        """Return True unless an If-Range validator says the file has changed."""
+        validator = self.headers.get('If-Range')
+        if validator is None:
+            return True
+        validator = validator.strip()
+        if validator.startswith(('"', 'W/')):
+            return etag_matches(validator, etag, weak=False)
+        # A date only matches if it is exactly the Last-Modified we send
+        return validator == last_modified
+
+    def not_modified_since(self, mtime):
+        """Return True if If-Modified-Since shows the client's copy is current."""
+        if 'If-Modified-Since' not in self.headers or 'If-None-Match' in self.headers:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(self.headers['If-Modified-Since'])
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        return int(mtime) <= since.timestamp()
+
+    def is_fresh(self, etag, mtime=None):
+        """Return True if the client's cached copy (per its validators) is current."""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag_matches(if_none_match, etag)
+        return mtime is not None and self.not_modified_since(mtime)
+
+    def send_not_modified(self, etag, last_modified=None, cache_control=None, vary=False):
+        """Send a 304 carrying the current validators."""
+        self.send_response(304)
+        self.add_cache_headers(etag, last_modified, cache_control, vary)
+        self.add_security_headers()
+        self.end_headers()
+
+    def send_head(self):
+        """Send the headers for a file, honouring Range and If-Range.
+
+        Returns the open file, or None if there is no body to send. The
+        byte ranges to write, and any multipart framing around them, are
+        left in self.body_parts and self.body_trailer for send_body().
+        """
+        self.body_parts = None
+        self.body_trailer = b''
+        url_path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+        if STATE_DIR_NAME in url_path.split('/'):
+            self.send_error(404, "File not found")
+            return None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or path.endswith('/'):
+            return super().send_head()
+
+        # Revalidations of top-level files are answered from the directory
+        # index without touching the file, as long as inotify keeps it exact.
+        # Entries seeded from the catalog may predate changes made while the
+        # server was down, so they are not trusted until reconciled
+        name = os.path.basename(path)
+        if 'If-None-Match' in self.headers and os.path.join(self.directory, name) == path:
+            try:
+                index = get_directory_index(self.directory)
+                seeded = index.reconcile_pending
+                entry = index.lookup(name)
+            except OSError:
+                entry = None
+            if entry is not None and index.watching and not seeded:
+                etag = file_etag(entry.size, entry.mtime_ns, entry.ino)
+                if self.is_fresh(etag):
+                    self.send_not_modified(etag, self.date_time_string(entry.mtime_ns // 10**9))
+                    return None
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+
+        try:
+            fs = os.fstat(f.fileno())
+            size = fs.st_size
+            ctype = self.guess_type(path)
+            last_modified = self.date_time_string(fs.st_mtime)
+            etag = file_etag(size, fs.st_mtime_ns, fs.st_ino)
+
+            # Range requests address the identity encoding, so only whole
+            # file responses are compressed
+            vary = is_compressible(ctype) and size >= COMPRESS_MIN_SIZE
+            variant = None
+            if vary and 'Range' not in self.headers:
+                variant = self.select_compressed_variant(path, fs, etag)
+            if variant is not None:
+                encoding, variant_path, variant_etag = variant
+                source_etag, etag = etag, variant_etag
+
+            if self.is_fresh(etag, fs.st_mtime):
+                self.send_not_modified(etag, last_modified, vary=vary)
+                f.close()
+                return None
+
+            if variant is not None:
+                try:
+                    if variant_path is None:
+                        cache = get_compression_cache(self.directory, self.compress_cache_size)
+                        variant_path = cache.get(f, source_etag, encoding)
+                    compressed = open(variant_path, 'rb')
+                except OSError:
+                    # Fall back to the identity encoding
+                    variant, etag = None, source_etag
+                else:
+                    f.close()
+                    f = compressed
+                    size = os.fstat(f.fileno()).st_size
+
+            ranges = None
+            if (self.command == 'GET' and 'Range' in self.headers and
+                    self.if_range_matches(etag, last_modified)):
+                ranges = parse_range_header(self.headers['Range'], size)
+
+            if ranges == []:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.add_security_headers()
+                self.end_headers()
+                f.close()
+                return None
+
+            if ranges is None:
+                self.send_response(200)
+                self.send_header('Content-type', ctype)
+                if variant is not None:
+                    self.send_header('Content-Encoding', encoding)
+                self.body_parts = [(b'', 0, size)]
+                length = size
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                self.send_response(206)
+                self.send_header('Content-type', ctype)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                self.body_parts = [(b'', start, end - start + 1)]
+                length = end - start + 1
+            else:
+                boundary = secrets.token_hex(16)
+                self.send_response(206)
+                self.send_header('Content-type', f'multipart/byteranges; boundary={boundary}')
+                self.body_parts = []
+                for start, end in ranges:
+                    separator = '\r\n' if self.body_parts else ''
+                    part_header = (
+                        f'{separator}--{boundary}\r\n'
+                        f'Content-Type: {ctype}\r\n'
+                        f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+                    ).encode('latin-1')
+                    self.body_parts.append((part_header, start, end - start + 1))
+                self.body_trailer = f'\r\n--{boundary}--\r\n'.encode('latin-1')
+                length = sum(len(header) + count for header, _, count in self.body_parts)
+                length += len(self.body_trailer)
+
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.add_cache_headers(etag, last_modified, vary=vary)
+            self.add_security_headers()
+            self.end_headers()
+            return f
+        except:
+            f.close()
+            raise
+
+    def select_compressed_variant(self, path, fs, etag):
+        """Pick the content encoding to serve a file with.
+
+        A precompressed sibling (name.zst, name.br, name.gz) at least as new
+        as the file is preferred; otherwise the file is compressed into the
+        compression cache, if it is small enough. Returns (encoding,
+        sibling_path_or_None, etag) or None for the identity encoding.
+        """
+        producible = available_encodings() if self.compress_cache_size else []
+        for encoding in acceptable_encodings(self.headers.get('Accept-Encoding')):
+            sibling = path + dict(CONTENT_ENCODINGS)[encoding]
+            try:
+                sibling_stat = os.stat(sibling)
+            except OSError:
+                sibling_stat = None
+            if (sibling_stat is not None and stat.S_ISREG(sibling_stat.st_mode) and
+                    sibling_stat.st_mtime_ns >= fs.st_mtime_ns):
+                sibling_etag = file_etag(sibling_stat.st_size, sibling_stat.st_mtime_ns, sibling_stat.st_ino)
+                return encoding, sibling, '%s-%s"' % (sibling_etag[:-1], encoding)
+            if encoding in producible and fs.st_size <= COMPRESS_MAX_SIZE:
+                return encoding, None, '%s-%s"' % (etag[:-1], encoding)
+        return None
+
+    def send_body(self, f):
+        """Write the body prepared by send_head() to the client."""
+        if self.command == 'HEAD':
+            return
+        if self.body_parts is None:
+            self.copyfile(f, self.wfile)
+            return
+        sock = self.connection if self.use_sendfile else None
+        throttle = self.download_throttle()
+        for part_header, offset, count in self.body_parts:
+            if part_header:
+                self.wfile.write(part_header)
+            send_file_range(self.wfile, f, offset, count, sock=sock, throttle=throttle)
+        if self.body_trailer:
+            self.wfile.write(self.body_trailer)
+
+    def copyfile(self, source, outputfile):
+        """Copy the rest of source to the client without userspace buffering."""
+        try:
+            offset = source.tell()
+            count = os.fstat(source.fileno()).st_size - offset
+        except (AttributeError, OSError, ValueError):
+            # In-memory bodies such as generated directory listings
+            shutil.copyfileobj(source, outputfile, COPY_BUFFER_SIZE)
+            return
+        if outputfile is not self.wfile:
+            send_file_range(outputfile, source, offset, count)
+            return
+        sock = self.connection if self.use_sendfile else None
+        send_file_range(outputfile, source, offset, count, sock=sock, throttle=self.download_throttle())
+
+    def send_file_list(self, query):
+        """Stream the /list JSON array, optionally paginated, sorted and filtered.
+
+        Query parameters: sort=name|size|mtime, order=asc|desc, prefix=,
+        glob=, limit= and cursor=. When more entries remain, the cursor for
+        the next page is sent in X-Next-Cursor and a Link rel="next" header.
+        """
+        def param(name, default=None):
+            return query.get(name, [default])[-1]
+
+        sort = param('sort', 'name')
+        order = param('order', 'asc')
+        limit = param('limit')
+        if sort not in LIST_SORT_FIELDS or order not in ('asc', 'desc'):
+            self.send_error(400, "Invalid sort order")
+            return
+        if limit is not None:
+            if not limit.isdigit() or int(limit) == 0:
+                self.send_error(400, "Invalid limit")
+                return
+            limit = min(int(limit), MAX_LIST_LIMIT)
+
+        encoding = next((encoding for encoding in acceptable_encodings(self.headers.get('Accept-Encoding'))
+                         if encoding in available_encodings()), None)
+        try:
+            with request_phase('scan'):
+                # The catalog seeds the index on first use
+                self.catalog()
+                index = get_directory_index(self.directory)
+                query_key = json.dumps(sorted(query.items())).encode()
+                etag = 'W/"list-%s-%s%s"' % (index.version(), hashlib.sha256(query_key).hexdigest()[:16],
+                                             '-' + encoding if encoding else '')
+                fresh = self.is_fresh(etag)
+                if not fresh:
+                    rows, next_cursor = query_directory_index(
+                        index, sort=sort, descending=order == 'desc', prefix=param('prefix', ''),
+                        pattern=param('glob'), cursor=param('cursor'), limit=limit)
+            if fresh:
+                self.send_not_modified(etag, vary=True)
+                return
+        except ValueError:
+            self.send_error(400, "Invalid cursor")
+            return
+        except OSError:
+            rows, next_cursor, etag = [], None, None
+
+        headers = {}
+        if next_cursor is not None:
+            next_query = {name: values[-1] for name, values in query.items()}
+            next_query['cursor'] = next_cursor
+            headers['X-Next-Cursor'] = next_cursor
+            headers['Link'] = '</list?%s>; rel="next"' % urllib.parse.urlencode(next_query)
+        self.send_json_stream([entry.listing for _, _, entry in rows], headers, etag, encoding)
+
+    def send_checksum(self, name):
+        """Send the size, mtime, MIME type and SHA-256 of a top-level file.
+
+        With --catalog a checksum that is still current comes from the
+        catalog; otherwise the file is hashed now.
+        """
+        if not name or '/' in name or name.startswith('.'):
+            self.send_error(404, "File not found")
+            return
+        try:
+            catalog = self.catalog()
+            if catalog is not None:
+                row = catalog.checksum(name)
+            else:
+                path = os.path.join(self.directory, name)
+                st = os.stat(path)
+                if not stat.S_ISREG(st.st_mode):
+                    raise IsADirectoryError(name)
+                row = CatalogRow(name, st.st_size, st.st_mtime_ns, st.st_ino, guess_mime_type(name),
+                                 hash_file(path))
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        self.send_json(200, {'name': row.name, 'size': row.size, 'mtime': row.mtime_ns // 10**9,
+                             'type': row.mime, 'sha256': row.sha256})
+
+    def send_metrics(self):
+        """Send this process's metrics in the Prometheus text format."""
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.add_cache_headers(cache_control='no-store')
+        self.add_security_headers()
+        self.end_headers()
+        self.write_body(body)
+
+    def send_profile(self, query):
+        """Send this process's request profile and optionally start a new one.
+
+        format= is text (top functions, the default), pstats (a file for
+        pstats.Stats or snakeviz) or collapsed (stacks for flame graphs).
+        sort= picks the pstats sort key for text and reset=1 clears the
+        totals once they are sent.
+        """
+        output_format = query.get('format', ['text'])[0]
+        if output_format == 'pstats':
+            body, content_type = self.profiler.pstats_data(), 'application/octet-stream'
+        elif output_format == 'collapsed':
+            body, content_type = self.profiler.collapsed().encode(), 'text/plain; charset=utf-8'
+        elif output_format == 'text':
+            try:
+                body = self.profiler.report(query.get('sort', ['cumulative'])[0]).encode()
+            except KeyError:
+                self.send_error(400, "Unknown sort key")
+                return
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            self.send_error(400, "format must be text, pstats or collapsed")
+            return
+        if query.get('reset', ['0'])[0] == '1':
+            self.profiler.reset()
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if output_format == 'pstats':
+            self.send_header('Content-Disposition', content_disposition('profile-%d.pstats' % os.getpid()))
+        self.add_cache_headers(cache_control='no-store')
+        self.add_security_headers()
+        self.end_headers()
+        self.write_body(body)
+
+    def send_archive(self, query):
+        """Stream the files and directories named by path= as one archive.
+
+        format= picks zip (stored, the default), tar or tgz. Directories are
+        archived recursively; path=/ archives everything served. The archive
+        is written while the files are read, so nothing is staged on disk
+        and memory use does not grow with the selection.
+        """
+        archive_format = query.get('format', [DEFAULT_ARCHIVE_FORMAT])[-1]
+        if archive_format not in ARCHIVE_FORMATS or not query.get('path'):
+            self.send_error(400, "Expected path= and format=zip|tar|tgz")
+            return
+        try:
+            with request_phase('scan'):
+                selection = select_archive_paths(self.directory, query['path'])
+        except (ValueError, OSError):
+            self.send_error(404, "File not found")
+            return
+        content_type, extension = ARCHIVE_FORMATS[archive_format]
+        if len(selection) == 1:
+            name = selection[0][0] or os.path.basename(os.path.abspath(self.directory))
+            filename = name.rsplit('/', 1)[-1] + extension
+        else:
+            filename = 'files' + extension
+
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Disposition', content_disposition(filename))
+        self.add_cache_headers(cache_control='no-store')
+        self.add_security_headers()
+        # The length is not known up front: HTTP/1.1 clients get the body
+        # chunked, older ones see it end when the connection closes
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+
+        stream = ArchiveStream(self.wfile, chunked, self.connection if self.use_sendfile else None,
+                               self.download_throttle(),
+                               make_compressor('gzip') if archive_format == 'tgz' else None)
+        files = iter_archive_files(selection)
+        try:
+            if archive_format == 'zip':
+                write_zip_archive(stream, files)
+            else:
+                write_tar_archive(stream, files)
+            stream.close()
+        except (OSError, ValueError) as e:
+            # Too late for an error status: cut the body short instead
+            logging.warning("Archive download %s failed: %s", filename, e)
+            self.close_connection = True
+        finally:
+            files.close()
+
+    def send_json_stream(self, items, headers=None, etag=None, encoding=None):
+        """Send a sequence of encoded JSON values as an array, streamed in batches.
+
+        With an encoding the batches are compressed on the fly.
+        """
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.add_cache_headers(etag, vary=True)
+        self.add_security_headers()
+        # The length is not known up front: HTTP/1.1 clients get the body
+        # chunked, older ones see it end when the connection closes
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+
+        compressor = make_compressor(encoding) if encoding else None
+
+        def write(data, final=False):
+            if compressor is not None:
+                data = compressor.compress(data)
+                if final:
+                    data += compressor.flush()
+            if data and chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            elif data:
+                self.wfile.write(data)
+
+        # The closing bracket goes out with the last batch to avoid a tiny
+        # trailing write.
+        items = iter(items)
+        pending = b'['
+        while True:
+            batch = b','.join(itertools.islice(items, JSON_STREAM_BATCH))
+            if not batch:
+                break
+            if len(pending) > 1:
+                write(pending)
+                pending = b','
+            pending += batch
+        write(pending + b']', final=True)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+    def list_directory(self, path):
+        """List a directory for full access only; links and upload sessions get a 403."""
+        if self.auth_scope != 'all':
+            self.send_error(403, "Not allowed by this link")
+            return None
+        return super().list_directory(path)
 
     def list_directory_json(self):
         """Return a JSON list of files in the current directory."""
-        files = []
         try:
-            file_list = os.listdir(self.directory)
-            for name in file_list:
-                if name.startswith('.'):
-                    continue
-                fullname = os.path.join(self.directory, name)
-                if os.path.isfile(fullname):
-                    size = os.path.getsize(fullname)
-                    files.append({
-                        'name': name,
-                        'size': size
-                    })
-            return files
+            entries = get_directory_index(self.directory).items()
         except OSError:
             return []
+        return [{'name': name, 'size': entry.size} for name, entry in entries]
 
     def sanitize_filename(self, filename):
         """Sanitize the filename to prevent directory traversal attacks."""
@@ -165,14 +3572,35 @@ class AuthHandler(SimpleHTTPRequestHandler):
         
         return safe_filename
 
-    def do_POST(self):
-        """Handle POST requests for file uploads."""
-        if self.use_auth:
-            auth_header = self.headers.get('Authorization')
-            if not auth_header or not self.authenticate(auth_header):
-                self.do_AUTHHEAD()
-                self.wfile.write(b'Authentication required')
+    def do_POST(self):
+        """Handle POST requests for file uploads."""
+        if not self.require_auth():
+            return
+
+        upload_match = UPLOAD_PATH_RE.match(self.path)
+        if upload_match:
+            self.handle_upload_session(upload_match.group(1), upload_match.group(2))
+            return
+
+        if self.path == '/share':
+            self.create_share_link()
+            return
+
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == EXTRACT_URL:
+            self.extract_archive(urllib.parse.parse_qs(url.query))
+            return
+
+        # Long selections are posted as a form rather than a query string
+        if url.path == ARCHIVE_URL:
+            form = self.read_form_body(MAX_ARCHIVE_FORM_SIZE)
+            if form is None:
+                self.send_error(400, "Expected an urlencoded form body")
                 return
+            for name, values in urllib.parse.parse_qs(url.query).items():
+                form.setdefault(name, []).extend(values)
+            self.send_archive(form)
+            return
 
         content_type = self.headers.get('Content-Type')
         if not content_type or 'multipart/form-data' not in content_type:
@@ -187,9 +3615,6 @@ class AuthHandler(SimpleHTTPRequestHandler):
                 self.send_error(400, "No content provided")
                 return
             
-            # Read the entire request body
-            post_data = self.rfile.read(content_length)
-            
             # Extract boundary from Content-Type header
             boundary_match = re.search(r'boundary=([^;]+)', content_type)
             if not boundary_match:
@@ -197,30 +3622,52 @@ class AuthHandler(SimpleHTTPRequestHandler):
                 return
             
             boundary = boundary_match.group(1).strip('"')
-            
-            # Parse multipart form data
-            uploaded_files = parse_multipart_form_data(post_data, boundary)
-            
-            files_received = False
-            for file_data in uploaded_files:
-                original_filename = self.sanitize_filename(file_data['filename'])
-                
-                try:
-                    with open(original_filename, 'wb') as f:
-                        f.write(file_data['content'])
-                    logging.info("Received and saved file: %s", original_filename)
-                    files_received = True
-                except Exception as e:
-                    logging.error("Error saving file %s: %s", original_filename, e)
-                    self.send_error(500, "Error saving file")
-                    return
+
+            saved_names = []
+            sinks = []
+            catalog = self.catalog()
+
+            def open_part(filename):
+                with request_phase('sanitize'):
+                    original_filename = self.sanitize_filename(filename)
+                saved_names.append(original_filename)
+                sinks.append(UploadSink(os.path.join(self.directory, original_filename), self.durability,
+                                        get_upload_store(self.directory).temp_path, self.blob_store(),
+                                        checksum=catalog is not None))
+                return sinks[-1]
+
+            # Stream the body to disk part by part
+            try:
+                with request_phase('parse'):
+                    uploaded_files = stream_multipart_form_data(
+                        self.request_body(), boundary, content_length, open_part)
+            except MultipartError as e:
+                logging.warning("Rejected malformed upload: %s", e)
+                self.send_error(400, "Malformed multipart body")
+                return
+            except OSError as e:
+                logging.error("Error saving file: %s", e)
+                self.send_error(500, "Error saving file")
+                return
+
+            index = get_directory_index(self.directory)
+            for saved_name, sink, file_data in zip(saved_names, sinks, uploaded_files):
+                index.mark_dirty(saved_name)
+                if catalog is not None:
+                    catalog.record(saved_name, sink.stat, sink.digest.hexdigest())
+                METRICS.observe('ts_server_upload_size_bytes', file_data['size'], (('path', 'multipart'),))
+                logging.info("Received and saved file: %s (%d bytes%s)", saved_name, file_data['size'],
+                             ", deduplicated" if sink.deduplicated else "")
+            files_received = bool(uploaded_files)
 
             if files_received:
+                body = b"File(s) received and saved successfully.\n"
                 self.send_response(200)
                 self.send_header('Content-type', 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
                 self.add_security_headers()
                 self.end_headers()
-                self.wfile.write(b"File(s) received and saved successfully.\n")
+                self.wfile.write(body)
             else:
                 self.send_error(400, "No valid files were uploaded")
 
@@ -228,206 +3675,920 @@ class AuthHandler(SimpleHTTPRequestHandler):
             logging.error("Error processing upload: %s", e)
             self.send_error(500, "Internal server error")
     
+    def sanitize_path(self, path):
+        """Split a relative upload path into components sanitized like filenames.
+
+        Empty and '.' components are dropped; '..' raises ValueError.
+        """
+        parts = [part for part in path.split('/') if part not in ('', '.')]
+        if '..' in parts:
+            raise ValueError("Path leaves the upload directory: %s" % path)
+        return [self.sanitize_filename(part) for part in parts]
+
+    def extract_archive(self, query):
+        """Extract a tar stream (plain, gzip, bzip2 or xz) posted as the request body.
+
+        Members are written to disk one at a time as they arrive, through
+        the same UploadSink pipeline as other uploads, below the directory
+        given by path= if any. Member paths are sanitized component by
+        component like upload filenames. Links, devices, members with '..'
+        components and members that would land on or pass through a
+        symlink are skipped.
+        """
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.send_error(411, "Content-Length required")
+            return
+        try:
+            base = self.sanitize_path(query.get('path', [''])[-1])
+        except ValueError:
+            self.close_after_response = True
+            self.send_error(400, "Invalid path")
+            return
+
+        body = LimitedReader(self.request_body(), length)
+        catalog = self.catalog()
+        index = get_directory_index(self.directory)
+        temp_dir = get_upload_store(self.directory).temp_path
+        directories = set()
+        files = size = skipped = 0
+        try:
+            with request_phase('parse'):
+                with tarfile.open(fileobj=body, mode='r|*', bufsize=STREAM_CHUNK_SIZE) as archive:
+                    for member in archive:
+                        try:
+                            with request_phase('sanitize'):
+                                parts = base + self.sanitize_path(member.name)
+                            if member.isdir():
+                                make_directories(self.directory, parts, directories)
+                                continue
+                            if not member.isfile() or not parts:
+                                raise ValueError(member.name)
+                            make_directories(self.directory, parts[:-1], directories)
+                            path = os.path.join(self.directory, *parts)
+                            if os.path.lexists(path) and not stat.S_ISREG(os.lstat(path).st_mode):
+                                raise ValueError(member.name)
+                        except ValueError:
+                            logging.warning("Skipped archive member: %s", member.name)
+                            skipped += 1
+                            continue
+                        top_level = len(parts) == 1
+                        sink = UploadSink(path, self.durability, temp_dir, self.blob_store(),
+                                          checksum=catalog is not None and top_level)
+                        try:
+                            source = archive.extractfile(member)
+                            for chunk in iter(lambda: source.read(STREAM_CHUNK_SIZE), b''):
+                                sink.write(chunk)
+                            sink.close()
+                        except BaseException:
+                            sink.abort()
+                            raise
+                        if top_level:
+                            index.mark_dirty(parts[0])
+                            if catalog is not None:
+                                catalog.record(parts[0], sink.stat, sink.digest.hexdigest())
+                        METRICS.observe('ts_server_upload_size_bytes', member.size, (('path', 'extract'),))
+                        files += 1
+                        size += member.size
+                body.drain()
+        except (tarfile.TarError, EOFError, zlib.error) as e:
+            logging.warning("Rejected malformed archive after %d files: %s", files, e)
+            self.close_after_response = True
+            self.send_error(400, "Malformed tar stream")
+            return
+        except OSError as e:
+            logging.error("Error extracting archive: %s", e)
+            self.close_after_response = True
+            self.send_error(500, "Error saving file")
+            return
+        logging.info("Extracted %d files (%d bytes) from an uploaded archive%s", files, size,
+                     ", skipped %d members" % skipped if skipped else "")
+        self.send_json(200, {'files': files, 'size': size, 'skipped': skipped})
+
+    def do_PATCH(self):
+        """Handle PATCH, PUT and DELETE, which only address resumable uploads."""
+        if not self.require_auth():
+            return
+        upload_match = UPLOAD_PATH_RE.match(self.path)
+        if not upload_match or not upload_match.group(1) or upload_match.group(2):
+            self.send_error(404, "Not found")
+            return
+        self.handle_upload_session(upload_match.group(1))
+
+    do_PUT = do_PATCH
+    do_DELETE = do_PATCH
+
+    def handle_upload_session(self, upload_id, action=None):
+        """Serve the resumable upload API.
+
+        POST /uploads                 create a session from {"filename", "size"}
+        GET|HEAD /uploads/<id>        report the committed offset
+        PATCH|PUT /uploads/<id>       append the body at the Upload-Offset header
+        POST /uploads/<id>/finalize   move the completed file into place
+        DELETE /uploads/<id>          abandon the session
+        """
+        store = get_upload_store(self.directory)
+        try:
+            if upload_id is None:
+                if self.command != 'POST':
+                    self.send_error(405, "Method not allowed")
+                    return
+                request = self.read_json_body()
+                filename = request.get('filename') if isinstance(request, dict) else None
+                size = request.get('size') if isinstance(request, dict) else None
+                if not isinstance(filename, str) or not filename or not isinstance(size, int) or size < 0:
+                    self.send_error(400, "Expected a JSON object with filename and size")
+                    return
+                session = store.create(filename, size)
+                self.send_json(201, session, {'Location': '/uploads/' + session['id'],
+                                              'Upload-Offset': '0'})
+            elif action == '/finalize':
+                if self.has_request_body():
+                    # Finalize never reads a body; send_error() closes the connection
+                    self.send_error(400, "Finalize takes no request body")
+                    return
+                session = store.get(upload_id)
+                with request_phase('sanitize'):
+                    original_filename = self.sanitize_filename(session['filename'])
+                catalog = self.catalog()
+                session = store.finalize(upload_id, os.path.join(self.directory, original_filename),
+                                         self.durability, self.blob_store(), checksum=catalog is not None)
+                get_directory_index(self.directory).mark_dirty(original_filename)
+                if catalog is not None:
+                    catalog.record(original_filename, session['stat'], session['sha256'])
+                METRICS.observe('ts_server_upload_size_bytes', session['size'], (('path', 'resumable'),))
+                logging.info("Received and saved file: %s (%d bytes, resumable%s)",
+                             original_filename, session['size'],
+                             ", deduplicated" if session.get('deduplicated') else "")
+                self.send_json(200, {'name': original_filename, 'size': session['size']})
+            elif self.command in ('GET', 'HEAD'):
+                session = store.get(upload_id)
+                self.send_json(200, session, {'Upload-Offset': str(session['offset'])})
+            elif self.command in ('PATCH', 'PUT'):
+                if 'Content-Length' not in self.headers:
+                    self.send_error(411, "Content-Length required")
+                    return
+                try:
+                    offset = int(self.headers.get('Upload-Offset', ''))
+                    length = int(self.headers['Content-Length'])
+                except ValueError:
+                    self.send_error(400, "Upload-Offset and Content-Length must be integers")
+                    return
+                new_offset = store.append(upload_id, offset, self.request_body(), length)
+                self.send_response(204)
+                self.send_header('Upload-Offset', str(new_offset))
+                self.add_security_headers()
+                self.end_headers()
+            elif self.command == 'DELETE':
+                store.delete(upload_id)
+                self.send_response(204)
+                self.add_security_headers()
+                self.end_headers()
+            else:
+                self.send_error(405, "Method not allowed")
+        except UploadSessionError as e:
+            if e.offset is None:
+                self.send_error(e.status, str(e))
+            else:
+                # Tell the client where to resume from
+                self.send_json(e.status, {'error': str(e), 'offset': e.offset},
+                               {'Upload-Offset': str(e.offset), 'Connection': 'close'})
+        except OSError as e:
+            logging.error("Error handling resumable upload: %s", e)
+            self.send_error(500, "Error saving file")
+
+    def catalog(self):
+        """The directory's Catalog, or None without --catalog."""
+        return get_catalog(self.directory) if self.use_catalog else None
+
+    def blob_store(self):
+        """The BlobStore uploads are deduplicated through, or None."""
+        if not self.dedup or self.durability == 'none':
+            return None
+        return get_blob_store(self.directory)
+
+    def read_json_body(self, limit=64 * 1024):
+        """Read and decode a small JSON request body; return None if invalid."""
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            return None
+        if length <= 0 or length > limit:
+            return None
+        try:
+            return json.loads(self.body.read(length))
+        except ValueError:
+            return None
+
+    def read_form_body(self, limit):
+        """Read and decode an urlencoded form body; return None if invalid."""
+        content_type = self.headers.get('Content-Type', '')
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            return None
+        if not content_type.startswith('application/x-www-form-urlencoded') or not 0 <= length <= limit:
+            # The body is left unread
+            self.close_after_response = True
+            return None
+        try:
+            return urllib.parse.parse_qs(self.body.read(length).decode())
+        except (UnicodeDecodeError, ValueError):
+            return None
+
     def send_upload_page(self):
-        """Send a dark-themed, intuitive HTML upload page with usage instructions on top, aligned buttons, and file selection feedback."""
-        html = """
-<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="UTF-8">
-  <meta name="viewport" content="width=device-width, initial-scale=1">
-  <title>TS File Server</title>
-  <!-- FontAwesome for icons -->
-  <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css">
-  <style>
-    :root {
-      --bg-color: #121212;
-      --container-bg: #1e1e1e;
-      --text-color: #e0e0e0;
-      --border-color: #333333;
-      --hover-color: #2c2c2c;
-      --button-bg: #6200ea;
-      --button-hover: #3700b3;
-      --copy-button-bg: #03dac6;
-      --copy-button-hover: #018786;
-      --download-button-bg: #03a9f4;
-      --download-button-hover: #0288d1;
-      --drop-zone-bg: #2c2c2c;
-    }
-    body {
-      background-color: var(--bg-color);
-      color: var(--text-color);
-      font-family: Arial, sans-serif;
-      margin: 0;
-      padding: 0;
-    }
-    .container {
-      max-width: 800px;
-      margin: 40px auto;
-      background-color: var(--container-bg);
-      padding: 20px;
-      border-radius: 8px;
-      box-shadow: 0 2px 10px rgba(0,0,0,0.5);
-    }
-    h1, h2 {
-      text-align: center;
-      margin-bottom: 20px;
-    }
-    .instructions {
-      margin-bottom: 30px;
-      padding: 15px;
-      background-color: var(--hover-color);
-      border: 1px solid var(--border-color);
-      border-radius: 8px;
-    }
-    .instructions pre {
-      background: #1e1e1e;
-      padding: 10px;
-      border-radius: 4px;
-      overflow-x: auto;
-      margin: 10px 0;
-    }
-    .instructions p {
-      font-size: 14px;
-      line-height: 1.4;
-    }
-    .upload-section {
-      margin-bottom: 30px;
-      padding: 20px;
-      border: 2px dashed var(--border-color);
-      border-radius: 8px;
-      text-align: center;
-      transition: background-color 0.3s ease;
-    }
-    .upload-section:hover {
-      background-color: var(--hover-color);
-    }
-    #drop-zone {
-      padding: 40px;
-      border: 2px dashed var(--border-color);
-      border-radius: 8px;
-      background-color: var(--drop-zone-bg);
-      cursor: pointer;
-      transition: background-color 0.3s ease;
-    }
-    #drop-zone.dragover {
-      background-color: var(--hover-color);
-    }
-    .upload-button {
-      background-color: var(--button-bg);
-      color: #ffffff;
-      padding: 10px 20px;
-      border: none;
-      border-radius: 4px;
-      cursor: pointer;
-      margin-top: 20px;
-      font-size: 16px;
-      transition: background-color 0.3s ease;
-    }
-    .upload-button:hover {
-      background-color: var(--button-hover);
-    }
-    /* Style for selected files list */
-    #selected-files {
-      margin-top: 10px;
-      font-size: 14px;
-      text-align: left;
-    }
-    #selected-files ul {
-      list-style-type: none;
-      padding-left: 0;
-      margin: 0;
-    }
-    #selected-files li {
-      overflow: hidden;
-      white-space: nowrap;
-      text-overflow: ellipsis;
-    }
-    .file-list {
-      margin-top: 30px;
-    }
-    .file-item {
-      display: flex;
-      align-items: center;
-      justify-content: space-between;
-      padding: 10px;
-      border-bottom: 1px solid var(--border-color);
-    }
-    .file-info {
-      flex: 1;
-      margin-right: 10px;
-      overflow: hidden;
-      white-space: nowrap;
-      text-overflow: ellipsis;
-    }
-    .file-info a {
-      color: var(--button-bg);
-      text-decoration: none;
-    }
-    .file-info a:hover {
-      text-decoration: underline;
-    }
-    .button-group {
-      display: flex;
-      gap: 5px;
-      flex-shrink: 0;
+        """Send the prebuilt upload page."""
+        self.send_static_asset(STATIC_ASSETS['/'])
+
+    def send_static_asset(self, asset):
+        """Send a prebuilt StaticAsset, using its precompressed variant if accepted."""
+        encoding = next((encoding for encoding in acceptable_encodings(self.headers.get('Accept-Encoding'))
+                         if encoding in asset.variants), None)
+        etag = '%s-%s"' % (asset.etag[:-1], encoding) if encoding else asset.etag
+        cache_control = asset.cache_control
+        if cache_control and self.use_auth:
+            cache_control = 'private, ' + cache_control
+        if self.is_fresh(etag):
+            self.send_not_modified(etag, cache_control=cache_control, vary=True)
+            return
+        body = asset.variants[encoding] if encoding else asset.body
+        self.send_response(200)
+        self.send_header('Content-type', asset.content_type)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.add_cache_headers(etag, cache_control=cache_control, vary=True)
+        self.add_security_headers()
+        self.end_headers()
+        self.write_body(body)
+
+
+# The upload page and its assets. They are built once at startup into
+# immutable buffers; the stylesheet and script are served from
+# content-hashed URLs so browsers can cache them indefinitely.
+STATIC_URL_PREFIX = '/%s/static/' % STATE_DIR_NAME
+
+UPLOAD_PAGE_CSS = """\
+:root {
+  --bg-color: #121212;
+  --container-bg: #1e1e1e;
+  --text-color: #e0e0e0;
+  --border-color: #333333;
+  --hover-color: #2c2c2c;
+  --button-bg: #6200ea;
+  --button-hover: #3700b3;
+  --copy-button-bg: #03dac6;
+  --copy-button-hover: #018786;
+  --download-button-bg: #03a9f4;
+  --download-button-hover: #0288d1;
+  --drop-zone-bg: #2c2c2c;
+}
+body {
+  background-color: var(--bg-color);
+  color: var(--text-color);
+  font-family: Arial, sans-serif;
+  margin: 0;
+  padding: 0;
+}
+.container {
+  max-width: 800px;
+  margin: 40px auto;
+  background-color: var(--container-bg);
+  padding: 20px;
+  border-radius: 8px;
+  box-shadow: 0 2px 10px rgba(0,0,0,0.5);
+}
+h1, h2 {
+  text-align: center;
+  margin-bottom: 20px;
+}
+.instructions {
+  margin-bottom: 30px;
+  padding: 15px;
+  background-color: var(--hover-color);
+  border: 1px solid var(--border-color);
+  border-radius: 8px;
+}
+.instructions pre {
+  background: #1e1e1e;
+  padding: 10px;
+  border-radius: 4px;
+  overflow-x: auto;
+  margin: 10px 0;
+}
+.instructions p {
+  font-size: 14px;
+  line-height: 1.4;
+}
+.upload-section {
+  margin-bottom: 30px;
+  padding: 20px;
+  border: 2px dashed var(--border-color);
+  border-radius: 8px;
+  text-align: center;
+  transition: background-color 0.3s ease;
+}
+.upload-section:hover {
+  background-color: var(--hover-color);
+}
+#drop-zone {
+  padding: 40px;
+  border: 2px dashed var(--border-color);
+  border-radius: 8px;
+  background-color: var(--drop-zone-bg);
+  cursor: pointer;
+  transition: background-color 0.3s ease;
+}
+#drop-zone.dragover {
+  background-color: var(--hover-color);
+}
+.upload-button {
+  background-color: var(--button-bg);
+  color: #ffffff;
+  padding: 10px 20px;
+  border: none;
+  border-radius: 4px;
+  cursor: pointer;
+  margin-top: 20px;
+  font-size: 16px;
+  transition: background-color 0.3s ease;
+}
+.upload-button:hover {
+  background-color: var(--button-hover);
+}
+/* Style for selected files list */
+#selected-files {
+  margin-top: 10px;
+  font-size: 14px;
+  text-align: left;
+}
+#selected-files ul {
+  list-style-type: none;
+  padding-left: 0;
+  margin: 0;
+}
+#selected-files li {
+  overflow: hidden;
+  white-space: nowrap;
+  text-overflow: ellipsis;
+}
+.file-list {
+  margin-top: 30px;
+}
+.list-controls {
+  display: flex;
+  gap: 10px;
+  margin-bottom: 10px;
+  align-items: center;
+}
+.list-controls input[type="search"], .list-controls select {
+  background-color: var(--drop-zone-bg);
+  color: var(--text-color);
+  border: 1px solid var(--border-color);
+  border-radius: 4px;
+  padding: 5px 8px;
+}
+.list-controls input[type="search"] {
+  flex: 1;
+}
+#download-selected {
+  background-color: var(--download-button-bg);
+  color: #000000;
+  border: none;
+  padding: 5px 10px;
+  border-radius: 4px;
+  cursor: pointer;
+  white-space: nowrap;
+}
+#download-selected:disabled {
+  opacity: 0.5;
+  cursor: default;
+}
+.file-select {
+  margin: 0 10px 0 0;
+  flex-shrink: 0;
+}
+#file-count {
+  font-size: 14px;
+  white-space: nowrap;
+}
+/* The file list is virtualized: only rows in view are in the DOM */
+#files {
+  max-height: 600px;
+  overflow-y: auto;
+}
+#files-spacer {
+  position: relative;
+}
+.file-item {
+  display: flex;
+  align-items: center;
+  justify-content: space-between;
+  padding: 10px;
+  border-bottom: 1px solid var(--border-color);
+  position: absolute;
+  left: 0;
+  right: 0;
+  height: 44px;
+  box-sizing: border-box;
+}
+.file-info {
+  flex: 1;
+  margin-right: 10px;
+  overflow: hidden;
+  white-space: nowrap;
+  text-overflow: ellipsis;
+}
+.file-info a {
+  color: var(--button-bg);
+  text-decoration: none;
+}
+.file-info a:hover {
+  text-decoration: underline;
+}
+.button-group {
+  display: flex;
+  gap: 5px;
+  flex-shrink: 0;
+}
+.copy-button {
+  background-color: var(--copy-button-bg);
+  color: #000000;
+  border: none;
+  padding: 5px 10px;
+  border-radius: 4px;
+  cursor: pointer;
+  transition: background-color 0.3s ease;
+}
+.copy-button:hover {
+  background-color: var(--copy-button-hover);
+}
+.download-button {
+  background-color: var(--download-button-bg);
+  color: #000000;
+  border: none;
+  padding: 5px 10px;
+  border-radius: 4px;
+  cursor: pointer;
+  transition: background-color 0.3s ease;
+  text-decoration: none;
+  display: inline-block;
+}
+.download-button:hover {
+  background-color: var(--download-button-hover);
+}
+#upload-progress {
+  display: none;
+  margin-top: 10px;
+}
+.progress-bar {
+  width: 100%;
+  height: 20px;
+  background-color: var(--border-color);
+  border-radius: 10px;
+  overflow: hidden;
+}
+.progress {
+  width: 0%;
+  height: 100%;
+  background-color: var(--button-bg);
+  transition: width 0.3s ease;
+}
+.message {
+  margin-top: 10px;
+  font-size: 14px;
+}
+.error {
+  color: #ff6b6b;
+}
+.success {
+  color: #4caf50;
+}
+.icon {
+  width: 1em;
+  height: 1em;
+  vertical-align: -0.125em;
+  fill: none;
+  stroke: currentColor;
+  stroke-width: 2;
+  stroke-linecap: round;
+  stroke-linejoin: round;
+}
+"""
+
+UPLOAD_PAGE_JS = """\
+const dropZone = document.getElementById('drop-zone');
+const fileInput = document.getElementById('file-input');
+const selectedFilesDiv = document.getElementById('selected-files');
+const uploadForm = document.getElementById('upload-form');
+const progressBar = document.querySelector('.progress');
+const progressText = document.getElementById('progress-text');
+const uploadProgress = document.getElementById('upload-progress');
+const statusMessage = document.getElementById('status-message');
+
+// Trigger file selector on drop zone click
+dropZone.onclick = () => fileInput.click();
+
+// Function to update the "selected files" list
+function updateSelectedFiles() {
+  const files = fileInput.files;
+  if (files.length > 0) {
+    let fileListHTML = '<ul>';
+    for (let i = 0; i < files.length; i++) {
+      fileListHTML += `<li>${files[i].name} (${formatFileSize(files[i].size)})</li>`;
     }
-    .copy-button {
-      background-color: var(--copy-button-bg);
-      color: #000000;
-      border: none;
-      padding: 5px 10px;
-      border-radius: 4px;
-      cursor: pointer;
-      transition: background-color 0.3s ease;
+    fileListHTML += '</ul>';
+    selectedFilesDiv.innerHTML = fileListHTML;
+  } else {
+    selectedFilesDiv.innerHTML = '';
+  }
+}
+
+// Listen for file selection changes
+fileInput.addEventListener('change', updateSelectedFiles);
+
+// Visual cue for drag and drop
+dropZone.ondragover = (e) => {
+  e.preventDefault();
+  dropZone.classList.add('dragover');
+};
+dropZone.ondragleave = () => {
+  dropZone.classList.remove('dragover');
+};
+dropZone.ondrop = (e) => {
+  e.preventDefault();
+  dropZone.classList.remove('dragover');
+  fileInput.files = e.dataTransfer.files;
+  updateSelectedFiles();
+};
+
+// Files at least this large use the resumable upload API
+const RESUMABLE_THRESHOLD = 16 * 1024 * 1024;
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const MAX_RETRIES = 8;
+
+function sendRequest(method, url, body, headers, onProgress) {
+  return new Promise((resolve, reject) => {
+    const xhr = new XMLHttpRequest();
+    xhr.open(method, url);
+    for (const [name, value] of Object.entries(headers || {})) {
+      xhr.setRequestHeader(name, value);
     }
-    .copy-button:hover {
-      background-color: var(--copy-button-hover);
+    if (onProgress) {
+      xhr.upload.onprogress = (event) => {
+        if (event.lengthComputable) onProgress(event.loaded);
+      };
     }
-    .download-button {
-      background-color: var(--download-button-bg);
-      color: #000000;
-      border: none;
-      padding: 5px 10px;
-      border-radius: 4px;
-      cursor: pointer;
-      transition: background-color 0.3s ease;
-      text-decoration: none;
-      display: inline-block;
+    xhr.onload = () => resolve(xhr);
+    xhr.onerror = () => reject(new Error('Network error'));
+    xhr.send(body);
+  });
+}
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+function uploadMultipart(files, onProgress) {
+  const formData = new FormData();
+  files.forEach(file => formData.append('file', file));
+  return sendRequest('POST', '/', formData, null, onProgress).then(xhr => {
+    if (xhr.status !== 200) throw new Error('Upload failed (' + xhr.status + ')');
+  });
+}
+
+async function fetchOffset(id) {
+  const xhr = await sendRequest('GET', '/uploads/' + id);
+  if (xhr.status !== 200) return null;
+  return JSON.parse(xhr.responseText).offset;
+}
+
+// Upload one file in chunks, resuming where the server left off after
+// network errors or a page reload.
+async function uploadResumable(file, onProgress) {
+  const key = 'ts-upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+  let id = localStorage.getItem(key);
+  let offset = id ? await fetchOffset(id) : null;
+  if (offset === null) {
+    const xhr = await sendRequest('POST', '/uploads',
+      JSON.stringify({filename: file.name, size: file.size}),
+      {'Content-Type': 'application/json'});
+    if (xhr.status !== 201) throw new Error('Could not start upload (' + xhr.status + ')');
+    id = JSON.parse(xhr.responseText).id;
+    localStorage.setItem(key, id);
+    offset = 0;
+  }
+  let failures = 0;
+  while (offset < file.size) {
+    const start = offset;
+    let xhr = null;
+    try {
+      xhr = await sendRequest('PATCH', '/uploads/' + id, file.slice(start, start + CHUNK_SIZE),
+        {'Upload-Offset': String(start), 'Content-Type': 'application/offset+octet-stream'},
+        (loaded) => onProgress(start + loaded));
+    } catch (error) {
+      xhr = null;
     }
-    .download-button:hover {
-      background-color: var(--download-button-hover);
+    if (xhr && xhr.status === 204) {
+      offset = Number(xhr.getResponseHeader('Upload-Offset'));
+      failures = 0;
+      continue;
     }
-    #upload-progress {
-      display: none;
-      margin-top: 10px;
+    if (xhr && xhr.status < 500 && xhr.status !== 409) {
+      localStorage.removeItem(key);
+      throw new Error('Upload rejected (' + xhr.status + ')');
     }
-    .progress-bar {
-      width: 100%;
-      height: 20px;
-      background-color: var(--border-color);
-      border-radius: 10px;
-      overflow: hidden;
+    if (xhr === null || xhr.status >= 500) {
+      if (++failures > MAX_RETRIES) throw new Error('Upload failed after retries');
+      await sleep(Math.min(30000, 500 * 2 ** failures));
     }
-    .progress {
-      width: 0%;
-      height: 100%;
-      background-color: var(--button-bg);
-      transition: width 0.3s ease;
+    try {
+      const committed = await fetchOffset(id);
+      if (committed === null) {
+        localStorage.removeItem(key);
+        throw new Error('Upload session expired');
+      }
+      offset = committed;
+    } catch (error) {
+      if (++failures > MAX_RETRIES) throw error;
     }
-    .message {
-      margin-top: 10px;
-      font-size: 14px;
+  }
+  const xhr = await sendRequest('POST', '/uploads/' + id + '/finalize');
+  if (xhr.status !== 200) throw new Error('Could not finish upload (' + xhr.status + ')');
+  localStorage.removeItem(key);
+}
+
+uploadForm.onsubmit = async (e) => {
+  e.preventDefault();
+  const files = Array.from(fileInput.files);
+  if (files.length === 0) return;
+  const total = files.reduce((sum, file) => sum + file.size, 0);
+  let done = 0;
+  const showProgress = (loaded) => {
+    const percent = total ? Math.min(100, (done + loaded) / total * 100) : 100;
+    progressBar.style.width = percent + '%';
+    progressText.textContent = Math.round(percent) + '%';
+  };
+  uploadProgress.style.display = 'block';
+  statusMessage.textContent = '';
+  try {
+    const small = files.filter(file => file.size < RESUMABLE_THRESHOLD);
+    const large = files.filter(file => file.size >= RESUMABLE_THRESHOLD);
+    if (small.length > 0) {
+      await uploadMultipart(small, showProgress);
+      done += small.reduce((sum, file) => sum + file.size, 0);
     }
-    .error {
-      color: #ff6b6b;
+    for (const file of large) {
+      await uploadResumable(file, showProgress);
+      done += file.size;
     }
-    .success {
-      color: #4caf50;
+    statusMessage.className = 'message success';
+    statusMessage.textContent = 'Files uploaded successfully!';
+    loadFiles();
+    uploadForm.reset();
+    updateSelectedFiles();
+    progressBar.style.width = '0%';
+    progressText.textContent = '0%';
+  } catch (error) {
+    statusMessage.className = 'message error';
+    statusMessage.textContent = 'Upload failed: ' + error.message;
+  }
+  uploadProgress.style.display = 'none';
+};
+
+function formatFileSize(bytes) {
+  const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+  let size = bytes;
+  let unitIndex = 0;
+  while (size >= 1024 && unitIndex < units.length - 1) {
+    size /= 1024;
+    unitIndex++;
+  }
+  return `${size.toFixed(1)} ${units[unitIndex]}`;
+}
+
+const ROW_HEIGHT = 44;
+const PAGE_SIZE = 1000;
+const filesDiv = document.getElementById('files');
+const filesSpacer = document.getElementById('files-spacer');
+const fileFilter = document.getElementById('file-filter');
+const fileSort = document.getElementById('file-sort');
+const fileCount = document.getElementById('file-count');
+const selectAll = document.getElementById('select-all');
+const archiveFormat = document.getElementById('archive-format');
+const downloadSelectedButton = document.getElementById('download-selected');
+let allFiles = [];
+let loadGeneration = 0;
+// Names ticked for "Download selected"; kept across reloads and filters
+const selected = new Set();
+
+function updateSelectionControls() {
+  downloadSelectedButton.disabled = selected.size === 0;
+  downloadSelectedButton.textContent = 'Download selected' + (selected.size ? ' (' + selected.size + ')' : '');
+  selectAll.checked = allFiles.length > 0 && allFiles.every(file => selected.has(file.name));
+}
+
+// Post the selection as a form so the browser saves the streamed archive
+// without holding it in memory, however many files are ticked
+function downloadSelected() {
+  const form = document.createElement('form');
+  form.method = 'post';
+  form.action = '/archive';
+  const add = (name, value) => {
+    const input = document.createElement('input');
+    input.type = 'hidden';
+    input.name = name;
+    input.value = value;
+    form.appendChild(input);
+  };
+  add('format', archiveFormat.value);
+  for (const name of selected) add('path', name);
+  document.body.appendChild(form);
+  form.submit();
+  form.remove();
+}
+
+// A signed link recipients can open without the server's credentials,
+// falling back to the plain URL
+async function shareLink(path) {
+  try {
+    const response = await fetch('/share', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({path: path, action: 'download'}),
+    });
+    if (response.ok) return window.location.origin + (await response.json()).url;
+  } catch (error) {
+    console.error('Error creating share link:', error);
+  }
+  return window.location.origin + path;
+}
+
+function createFileRow(file) {
+  // Create container for the file entry
+  const fileDiv = document.createElement('div');
+  fileDiv.className = 'file-item';
+
+  const checkbox = document.createElement('input');
+  checkbox.type = 'checkbox';
+  checkbox.className = 'file-select';
+  checkbox.checked = selected.has(file.name);
+  checkbox.onchange = () => {
+    if (checkbox.checked) selected.add(file.name);
+    else selected.delete(file.name);
+    updateSelectionControls();
+  };
+
+  // Container for file info with text-overflow
+  const fileInfo = document.createElement('div');
+  fileInfo.className = 'file-info';
+  const fileLink = document.createElement('a');
+  fileLink.href = '/' + encodeURIComponent(file.name);
+  fileLink.textContent = `${file.name} (${formatFileSize(file.size)})`;
+  fileInfo.appendChild(fileLink);
+
+  // Container for the buttons
+  const buttonGroup = document.createElement('div');
+  buttonGroup.className = 'button-group';
+
+  const copyButton = document.createElement('button');
+  copyButton.className = 'copy-button';
+  copyButton.innerHTML = '<svg class="icon"><use href="#icon-copy"></use></svg>';
+  copyButton.onclick = async (e) => {
+    e.preventDefault();
+    navigator.clipboard.writeText(await shareLink('/' + encodeURIComponent(file.name)));
+    copyButton.innerHTML = '<svg class="icon"><use href="#icon-check"></use></svg>';
+    setTimeout(() => {
+      copyButton.innerHTML = '<svg class="icon"><use href="#icon-copy"></use></svg>';
+    }, 2000);
+  };
+
+  const downloadButton = document.createElement('a');
+  downloadButton.className = 'download-button';
+  downloadButton.href = '/' + encodeURIComponent(file.name);
+  downloadButton.setAttribute('download', '');
+  downloadButton.innerHTML = '<svg class="icon"><use href="#icon-download"></use></svg>';
+
+  buttonGroup.appendChild(copyButton);
+  buttonGroup.appendChild(downloadButton);
+
+  fileDiv.appendChild(checkbox);
+  fileDiv.appendChild(fileInfo);
+  fileDiv.appendChild(buttonGroup);
+  return fileDiv;
+}
+
+// Render only the rows currently scrolled into view (plus a margin)
+function renderVisibleFiles() {
+  const first = Math.max(0, Math.floor(filesDiv.scrollTop / ROW_HEIGHT) - 10);
+  const last = Math.min(allFiles.length,
+    Math.ceil((filesDiv.scrollTop + filesDiv.clientHeight) / ROW_HEIGHT) + 10);
+  filesSpacer.style.height = (allFiles.length * ROW_HEIGHT) + 'px';
+  const rows = [];
+  for (let i = first; i < last; i++) {
+    const row = createFileRow(allFiles[i]);
+    row.style.top = (i * ROW_HEIGHT) + 'px';
+    rows.push(row);
+  }
+  filesSpacer.replaceChildren(...rows);
+  fileCount.textContent = allFiles.length + (allFiles.length === 1 ? ' file' : ' files');
+}
+
+let renderPending = false;
+filesDiv.addEventListener('scroll', () => {
+  if (renderPending) return;
+  renderPending = true;
+  requestAnimationFrame(() => {
+    renderPending = false;
+    renderVisibleFiles();
+  });
+});
+
+// Case-insensitive "contains" glob for the filter box
+function filterGlob(text) {
+  return '*' + Array.from(text).map(c => {
+    if ('*?['.includes(c)) return '[' + c + ']';
+    const lower = c.toLowerCase();
+    const upper = c.toUpperCase();
+    return lower !== upper ? '[' + lower + upper + ']' : c;
+  }).join('') + '*';
+}
+
+// Fetch the listing page by page, rendering as each page arrives
+async function loadFiles() {
+  const generation = ++loadGeneration;
+  const [sort, order] = fileSort.value.split(':');
+  const params = new URLSearchParams({sort: sort, order: order, limit: PAGE_SIZE});
+  if (fileFilter.value) params.set('glob', filterGlob(fileFilter.value));
+  let files = [];
+  let cursor = null;
+  try {
+    do {
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch('/list?' + params);
+      if (!response.ok) throw new Error('HTTP ' + response.status);
+      const page = await response.json();
+      if (generation !== loadGeneration) return;
+      for (const file of page) files.push(file);
+      allFiles = files;
+      renderVisibleFiles();
+      cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    if (!fileFilter.value) {
+      // Forget selected files that are gone
+      const names = new Set(files.map(file => file.name));
+      for (const name of selected) if (!names.has(name)) selected.delete(name);
     }
-  </style>
+    updateSelectionControls();
+  } catch (error) {
+    console.error('Error loading files:', error);
+  }
+}
+
+let filterTimer = null;
+fileFilter.addEventListener('input', () => {
+  clearTimeout(filterTimer);
+  filterTimer = setTimeout(() => {
+    filesDiv.scrollTop = 0;
+    loadFiles();
+  }, 200);
+});
+fileSort.addEventListener('change', () => {
+  filesDiv.scrollTop = 0;
+  loadFiles();
+});
+selectAll.addEventListener('change', () => {
+  for (const file of allFiles) {
+    if (selectAll.checked) selected.add(file.name);
+    else selected.delete(file.name);
+  }
+  renderVisibleFiles();
+  updateSelectionControls();
+});
+downloadSelectedButton.addEventListener('click', downloadSelected);
+loadFiles();
+"""
+
+# Self-hosted stroke icons, referenced with <svg><use href="#icon-name">
+UPLOAD_PAGE_ICONS = {
+    'upload': '<path d="M7 18a5 5 0 0 1-.6-9.96A6 6 0 0 1 18 9h.5a4.5 4.5 0 0 1 0 9H17"/>'
+              '<path d="M12 12v9M9 15l3-3 3 3"/>',
+    'copy': '<rect x="9" y="9" width="12" height="12" rx="2"/>'
+            '<path d="M5 15H4a1 1 0 0 1-1-1V4a1 1 0 0 1 1-1h10a1 1 0 0 1 1 1v1"/>',
+    'check': '<path d="M5 12l5 5L20 7"/>',
+    'download': '<path d="M12 3v12M7 10l5 5 5-5M4 21h16"/>',
+}
+
+UPLOAD_PAGE_HTML = """\
+<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>TS File Server</title>
+  <link rel="stylesheet" href="{stylesheet}">
 </head>
 <body>
+{icons}
   <div class="container">
     <h1>TS File Server</h1>
     <div class="instructions">
@@ -440,12 +4601,16 @@ class AuthHandler(SimpleHTTPRequestHandler):
          <em>From the browser:</em> Click the file link or the <strong>Download</strong> button.<br>
          <em>From the command line:</em></p>
       <pre>curl -u user:&lt;generated_password&gt; https://&lt;your-funnel-url&gt;/file.txt -O</pre>
+      <p><strong>4. Download several files at once:</strong><br>
+         <em>From the browser:</em> Tick the files and click <strong>Download selected</strong>.<br>
+         <em>From the command line</em> (a directory, or <code>path=/</code> for everything):</p>
+      <pre>curl -u user:&lt;generated_password&gt; "https://&lt;your-funnel-url&gt;/archive?path=photos&amp;format=tgz" -o photos.tar.gz</pre>
     </div>
     <div class="upload-section">
       <h2>Upload Files</h2>
       <form id="upload-form" enctype="multipart/form-data" method="post">
         <div id="drop-zone">
-          <i class="fas fa-cloud-upload-alt" style="font-size: 48px;"></i>
+          <svg class="icon" style="font-size: 48px;"><use href="#icon-upload"></use></svg>
           <p>Drag & drop files here or click to select</p>
           <input type="file" name="file" multiple style="display: none;" id="file-input">
         </div>
@@ -463,180 +4628,671 @@ class AuthHandler(SimpleHTTPRequestHandler):
     </div>
     <div class="file-list">
       <h2>Available Files</h2>
+      <div class="list-controls">
+        <input type="checkbox" id="select-all" title="Select all listed files">
+        <input type="search" id="file-filter" placeholder="Filter by name">
+        <select id="file-sort">
+          <option value="name:asc">Name</option>
+          <option value="mtime:desc">Newest first</option>
+          <option value="size:desc">Largest first</option>
+        </select>
+        <span id="file-count"></span>
+        <select id="archive-format" title="Archive format">
+          <option value="zip">.zip</option>
+          <option value="tgz">.tar.gz</option>
+          <option value="tar">.tar</option>
+        </select>
+        <button type="button" id="download-selected" disabled>Download selected</button>
+      </div>
       <div id="files">
-        <!-- File list will load here -->
+        <div id="files-spacer">
+          <!-- Visible file rows are rendered here -->
+        </div>
       </div>
     </div>
   </div>
-  <script>
-    const dropZone = document.getElementById('drop-zone');
-    const fileInput = document.getElementById('file-input');
-    const selectedFilesDiv = document.getElementById('selected-files');
-    const uploadForm = document.getElementById('upload-form');
-    const progressBar = document.querySelector('.progress');
-    const progressText = document.getElementById('progress-text');
-    const uploadProgress = document.getElementById('upload-progress');
-    const statusMessage = document.getElementById('status-message');
-
-    // Trigger file selector on drop zone click
-    dropZone.onclick = () => fileInput.click();
-
-    // Function to update the "selected files" list
-    function updateSelectedFiles() {
-      const files = fileInput.files;
-      if (files.length > 0) {
-        let fileListHTML = '<ul>';
-        for (let i = 0; i < files.length; i++) {
-          fileListHTML += `<li>${files[i].name} (${formatFileSize(files[i].size)})</li>`;
-        }
-        fileListHTML += '</ul>';
-        selectedFilesDiv.innerHTML = fileListHTML;
-      } else {
-        selectedFilesDiv.innerHTML = '';
-      }
-    }
-
-    // Listen for file selection changes
-    fileInput.addEventListener('change', updateSelectedFiles);
-
-    // Visual cue for drag and drop
-    dropZone.ondragover = (e) => {
-      e.preventDefault();
-      dropZone.classList.add('dragover');
-    };
-    dropZone.ondragleave = () => {
-      dropZone.classList.remove('dragover');
-    };
-    dropZone.ondrop = (e) => {
-      e.preventDefault();
-      dropZone.classList.remove('dragover');
-      fileInput.files = e.dataTransfer.files;
-      updateSelectedFiles();
-    };
-
-    uploadForm.onsubmit = async (e) => {
-      e.preventDefault();
-      const formData = new FormData(uploadForm);
-      uploadProgress.style.display = 'block';
-      statusMessage.textContent = '';
-      try {
-        const xhr = new XMLHttpRequest();
-        xhr.upload.onprogress = (event) => {
-          if (event.lengthComputable) {
-            const percent = (event.loaded / event.total) * 100;
-            progressBar.style.width = percent + '%';
-            progressText.textContent = Math.round(percent) + '%';
-          }
-        };
-        xhr.onload = function() {
-          if (xhr.status === 200) {
-            statusMessage.className = 'message success';
-            statusMessage.textContent = 'Files uploaded successfully!';
-            loadFiles();
-            uploadForm.reset();
-            updateSelectedFiles();
-            progressBar.style.width = '0%';
-            progressText.textContent = '0%';
-          } else {
-            statusMessage.className = 'message error';
-            statusMessage.textContent = 'Upload failed!';
-          }
-          uploadProgress.style.display = 'none';
-        };
-        xhr.onerror = function() {
-          statusMessage.className = 'message error';
-          statusMessage.textContent = 'Upload failed!';
-          uploadProgress.style.display = 'none';
-        };
-        xhr.open('POST', '/');
-        xhr.send(formData);
-      } catch (error) {
-        statusMessage.className = 'message error';
-        statusMessage.textContent = 'Upload failed: ' + error;
-        uploadProgress.style.display = 'none';
-      }
-    };
-
-    function formatFileSize(bytes) {
-      const units = ['B', 'KB', 'MB', 'GB', 'TB'];
-      let size = bytes;
-      let unitIndex = 0;
-      while (size >= 1024 && unitIndex < units.length - 1) {
-        size /= 1024;
-        unitIndex++;
-      }
-      return `${size.toFixed(1)} ${units[unitIndex]}`;
-    }
-
-    async function loadFiles() {
-      try {
-        const response = await fetch('/list');
-        const files = await response.json();
-        const filesDiv = document.getElementById('files');
-        filesDiv.innerHTML = '';
-        files.forEach(file => {
-          // Create container for the file entry
-          const fileDiv = document.createElement('div');
-          fileDiv.className = 'file-item';
-          
-          // Container for file info with text-overflow
-          const fileInfo = document.createElement('div');
-          fileInfo.className = 'file-info';
-          const fileLink = document.createElement('a');
-          fileLink.href = '/' + file.name;
-          fileLink.textContent = `${file.name} (${formatFileSize(file.size)})`;
-          fileInfo.appendChild(fileLink);
-          
-          // Container for the buttons
-          const buttonGroup = document.createElement('div');
-          buttonGroup.className = 'button-group';
-          
-          const copyButton = document.createElement('button');
-          copyButton.className = 'copy-button';
-          copyButton.innerHTML = '<i class="fas fa-copy"></i>';
-          copyButton.onclick = (e) => {
-            e.preventDefault();
-            navigator.clipboard.writeText(window.location.origin + '/' + file.name);
-            copyButton.innerHTML = '<i class="fas fa-check"></i>';
-            setTimeout(() => {
-              copyButton.innerHTML = '<i class="fas fa-copy"></i>';
-            }, 2000);
-          };
-
-          const downloadButton = document.createElement('a');
-          downloadButton.className = 'download-button';
-          downloadButton.href = '/' + file.name;
-          downloadButton.setAttribute('download', '');
-          downloadButton.innerHTML = '<i class="fas fa-download"></i>';
-
-          buttonGroup.appendChild(copyButton);
-          buttonGroup.appendChild(downloadButton);
-          
-          fileDiv.appendChild(fileInfo);
-          fileDiv.appendChild(buttonGroup);
-          filesDiv.appendChild(fileDiv);
-        });
-      } catch (error) {
-        console.error('Error loading files:', error);
-      }
-    }
-    loadFiles();
-  </script>
+  <script src="{script}"></script>
 </body>
 </html>
+"""
+
+StaticAsset = namedtuple('StaticAsset', 'body variants content_type etag cache_control')
+
+
+def make_static_asset(body, content_type, cache_control=None):
+    """Return a StaticAsset with every content encoding precomputed."""
+    variants = {}
+    for encoding in available_encodings():
+        compressor = make_compressor(encoding)
+        compressed = compressor.compress(body) + compressor.flush()
+        if len(compressed) < len(body):
+            variants[encoding] = compressed
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+    return StaticAsset(body, variants, content_type, etag, cache_control)
+
+
+def build_static_assets():
+    """Build the upload page and its assets, keyed by URL path."""
+    assets = {}
+    urls = {}
+    for name, source, content_type in (('stylesheet', UPLOAD_PAGE_CSS, 'text/css; charset=utf-8'),
+                                       ('script', UPLOAD_PAGE_JS, 'text/javascript; charset=utf-8')):
+        body = source.encode()
+        extension = 'css' if name == 'stylesheet' else 'js'
+        url = '%sapp.%s.%s' % (STATIC_URL_PREFIX, hashlib.sha256(body).hexdigest()[:16], extension)
+        assets[url] = make_static_asset(body, content_type, 'max-age=31536000, immutable')
+        urls[name] = url
+    icons = ''.join('<symbol id="icon-%s" viewBox="0 0 24 24">%s</symbol>' % item
+                    for item in UPLOAD_PAGE_ICONS.items())
+    urls['icons'] = '  <svg style="display: none;">%s</svg>' % icons
+    assets['/'] = make_static_asset(UPLOAD_PAGE_HTML.format(**urls).encode(), 'text/html; charset=utf-8')
+    return assets
+
+
+STATIC_ASSETS = build_static_assets()
+
+
+# Worker pool engine. A fixed set of threads serves connections from a
+# bounded queue; when the queue is full, new connections get an immediate
+# 503 from the accept loop instead of a thread or a refused connect.
+WORKER_THREADS = 32
+# Accepted connections allowed to wait for a free worker
+WORKER_QUEUE_SIZE = 64
+# Kernel queue of connections not yet accepted (listen() backlog)
+LISTEN_BACKLOG = 1024
+# Seconds a pooled connection may stall before its worker gives up on it
+WORKER_SOCKET_TIMEOUT = 60
+# Seconds between an idle keep-alive worker's checks for queued connections
+WORKER_IDLE_POLL = 0.05
+# Seconds saturated clients are told to wait before retrying
+OVERLOAD_RETRY_AFTER = 1
+
+OVERLOAD_BODY = b'Server busy, retry shortly.\n'
+OVERLOAD_RESPONSE = (
+    b'HTTP/1.0 503 Service Unavailable\r\n'
+    b'Retry-After: %d\r\n'
+    b'Content-Type: text/plain\r\n'
+    b'Content-Length: %d\r\n'
+    b'Connection: close\r\n\r\n' % (OVERLOAD_RETRY_AFTER, len(OVERLOAD_BODY))
+) + OVERLOAD_BODY
+
+
+def activate_server(server, backlog, reuse_port=False, sock=None):
+    """Bind and activate a socketserver server created with bind_and_activate=False.
+
+    The socket gets a listen() backlog of its own and, with reuse_port,
+    SO_REUSEPORT. With sock, the server takes over that listening socket
+    instead of binding one.
     """
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.add_security_headers()
-        self.end_headers()
-        self.wfile.write(html.encode())
+    if sock is not None:
+        server.socket.close()
+        server.socket = sock
+        server.server_address = sock.getsockname()
+        server.server_name = socket.getfqdn(server.server_address[0])
+        server.server_port = server.server_address[1]
+        return server
+    server.request_queue_size = backlog
+    try:
+        if reuse_port:
+            server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server.server_bind()
+        server.server_activate()
+    except:
+        server.server_close()
+        raise
+    return server
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server that handles connections on a fixed pool of worker threads.
+
+    Connections wait in a queue of at most queue_size entries; beyond that
+    they are answered with 503 and Retry-After straight from the accept
+    loop, so overload costs neither threads nor hung clients.
+    """
+
+    def __init__(self, server_address, RequestHandlerClass, workers=WORKER_THREADS,
+                 queue_size=WORKER_QUEUE_SIZE, backlog=LISTEN_BACKLOG,
+                 socket_timeout=WORKER_SOCKET_TIMEOUT, reuse_port=False, sock=None):
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate=False)
+        activate_server(self, backlog, reuse_port, sock)
+        self.socket_timeout = socket_timeout
+        self.requests = queue.Queue(queue_size)
+        self.rejected = 0
+        self.workers = [threading.Thread(target=self.worker, name='ts-server-%d' % i, daemon=True)
+                        for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def connections_waiting(self):
+        """Return True if accepted connections are queued for a worker."""
+        return not self.requests.empty()
+
+    def process_request(self, request, client_address):
+        try:
+            self.requests.put_nowait((request, client_address))
+        except queue.Full:
+            self.reject_request(request)
+
+    def reject_request(self, request):
+        """Answer a connection the pool has no room for with a 503."""
+        self.rejected += 1
+        try:
+            request.setblocking(False)
+            # Read whatever part of the request has arrived, so closing the
+            # socket does not reset the connection before the 503 is read
+            try:
+                request.recv(65536)
+            except OSError:
+                pass
+            request.send(OVERLOAD_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def worker(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                request.settimeout(self.socket_timeout)
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # Workers exit once the connections queued ahead of them are done;
+        # any left without a sentinel are daemon threads
+        for _ in self.workers:
+            try:
+                self.requests.put_nowait(None)
+            except queue.Full:
+                break
+
+
+# asyncio engine. The event loop owns every connection: it waits for and
+# reads request heads and writes responses, so idle and slow clients cost a
+# coroutine rather than a thread. Each request is then run through the
+# regular handler in a bounded thread pool, where the file system work
+# happens; the handler's reads and writes are bridged back to the loop and
+# file bodies are handed to loop.sendfile() instead of being copied.
+# Most header bytes the loop buffers for a single request
+MAX_REQUEST_HEAD_SIZE = 64 * 1024
+# Seconds a connection may sit waiting for a request head or body data
+ASYNC_IDLE_TIMEOUT = 300
+# Queued response bytes beyond which handler threads wait for the client
+ASYNC_WRITE_HIGH_WATER = 1024 * 1024
+# Seconds between a waiting handler thread's checks for server shutdown
+ASYNC_ABORT_POLL = 1.0
+CONTENT_LENGTH_RE = re.compile(rb'\r\ncontent-length:[ \t]*(\d+)[ \t]*\r\n', re.IGNORECASE)
+
+
+class _AsyncRequestReader(io.RawIOBase):
+    """Raw reader giving a handler thread the request head, then its body.
+
+    The body is pulled from the connection's StreamReader on the event
+    loop and capped at Content-Length, so the handler can never read into
+    the next request.
+    """
+
+    def __init__(self, connection, head, body_length):
+        self.connection = connection
+        self.head = memoryview(head)
+        self.remaining = body_length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.head:
+            count = min(len(buffer), len(self.head))
+            buffer[:count] = self.head[:count]
+            self.head = self.head[count:]
+            return count
+        if self.remaining <= 0:
+            return 0
+        data = self.connection.call(self.connection.read(min(len(buffer), self.remaining)))
+        self.remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class AsyncConnection:
+    """Socket stand-in that a handler thread uses to talk to an asyncio stream.
+
+    Writes are queued to a writer task on the loop; the calling thread only
+    blocks when more than ASYNC_WRITE_HIGH_WATER bytes are waiting for a
+    slow client. sendfile() queues the file itself, so the thread returns
+    while the loop streams it.
+    """
+
+    def __init__(self, loop, reader, writer, head, body_length, requests_served=0):
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+        self.head = head
+        self.body_length = body_length
+        self.requests_served = requests_served
+        self.output = asyncio.Queue()
+        self.pending = 0
+        self.condition = threading.Condition()
+        self.error = None
+        self.request_reader = None
 
+    def call(self, coroutine):
+        """Run a coroutine on the loop from a handler thread and return its result."""
+        try:
+            future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        except RuntimeError:
+            # The loop has already closed
+            coroutine.close()
+            raise ConnectionAbortedError("server shutting down") from None
+        # A loop that is shutting down may close without running it
+        while True:
+            try:
+                return future.result(ASYNC_ABORT_POLL)
+            except concurrent.futures.TimeoutError:
+                if self.error is not None:
+                    if not self.loop.is_closed():
+                        future.cancel()
+                    raise self.error from None
+
+    async def read(self, size):
+        try:
+            data = await asyncio.wait_for(self.reader.read(size), ASYNC_IDLE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise socket.timeout("timed out reading request body") from None
+        return data
+
+    # Socket methods used by StreamRequestHandler and the handler
+
+    def makefile(self, mode, buffering=-1):
+        self.request_reader = _AsyncRequestReader(self, self.head, self.body_length)
+        return io.BufferedReader(self.request_reader,
+                                 buffering if buffering > 0 else io.DEFAULT_BUFFER_SIZE)
+
+    def settimeout(self, timeout):
+        pass
+
+    def setsockopt(self, *args):
+        pass
+
+    def getpeername(self):
+        return self.writer.get_extra_info('peername')
+
+    def sendall(self, data):
+        data = bytes(data)
+        with self.condition:
+            while self.pending > ASYNC_WRITE_HIGH_WATER and self.error is None:
+                self.condition.wait()
+            if self.error is not None:
+                raise self.error
+            self.pending += len(data)
+        self.loop.call_soon_threadsafe(self.output.put_nowait, data)
+
+    def sendfile(self, file, offset=0, count=None):
+        # The handler closes its file as soon as it returns, so the queued
+        # send gets a file of its own
+        if self.error is not None:
+            raise self.error
+        duplicate = open(os.dup(file.fileno()), 'rb')
+        self.loop.call_soon_threadsafe(self.output.put_nowait, (duplicate, offset, count))
+        return count
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.output.put_nowait, None)
+
+    def abort(self, error):
+        """Fail the handler thread's pending and future writes (loop thread)."""
+        with self.condition:
+            if self.error is None:
+                self.error = error
+            self.condition.notify_all()
+
+    def reusable(self):
+        """Return True if the connection can carry another request."""
+        return (self.error is None and self.request_reader is not None and
+                self.request_reader.remaining <= 0)
+
+    async def write_output(self):
+        """Writer task: send queued bytes and files in order until close()."""
+        while True:
+            item = await self.output.get()
+            if item is None:
+                return
+            try:
+                if self.error is not None:
+                    continue
+                if isinstance(item, bytes):
+                    self.writer.write(item)
+                    await self.writer.drain()
+                else:
+                    file, offset, count = item
+                    await self.loop.sendfile(self.writer.transport, file, offset, count)
+            except (ConnectionError, OSError) as e:
+                self.error = e
+            finally:
+                if isinstance(item, bytes):
+                    with self.condition:
+                        self.pending -= len(item)
+                        self.condition.notify_all()
+                else:
+                    item[0].close()
+                if self.error is not None:
+                    with self.condition:
+                        self.condition.notify_all()
+
+
+class AsyncioHTTPServer:
+    """Drop-in alternative to ThreadingHTTPServer running on an asyncio loop.
+
+    Requests are handled by RequestHandlerClass exactly as with the
+    threaded server, on at most max_workers threads at a time.
+    """
+
+    def __init__(self, server_address, RequestHandlerClass, max_workers=WORKER_THREADS,
+                 backlog=LISTEN_BACKLOG, reuse_port=False, sock=None):
+        self.RequestHandlerClass = RequestHandlerClass
+        self.max_workers = max_workers
+        self.socket = sock or socket.create_server(server_address, backlog=backlog, reuse_port=reuse_port)
+        self.server_address = self.socket.getsockname()
+        self.loop = asyncio.new_event_loop()
+        self.stopping = asyncio.Event()
+        self.serving = False
+        self.stopped = threading.Event()
+        self.connections = set()
+
+    def serve_forever(self):
+        """Serve until shutdown() is called from another thread."""
+        executor = concurrent.futures.ThreadPoolExecutor(self.max_workers, thread_name_prefix='ts-server')
+        self.loop.set_default_executor(executor)
+        self.serving = True
+        try:
+            self.loop.run_until_complete(self._serve())
+        finally:
+            # Unblock handler threads still waiting on the loop
+            for connection in self.connections:
+                connection.abort(ConnectionAbortedError("server shutting down"))
+            try:
+                tasks = asyncio.all_tasks(self.loop)
+                for task in tasks:
+                    task.cancel()
+                if tasks:
+                    self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            finally:
+                executor.shutdown(wait=False)
+                self.loop.close()
+                self.stopped.set()
+
+    async def _serve(self):
+        server = await asyncio.start_server(self.handle_connection, sock=self.socket,
+                                            limit=MAX_REQUEST_HEAD_SIZE)
+        async with server:
+            await self.stopping.wait()
+
+    def shutdown(self):
+        """Stop serve_forever() and wait for it to return."""
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopping.set)
+        if self.serving:
+            self.stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+        if not self.serving:
+            self.loop.close()
+
+    async def handle_connection(self, reader, writer):
+        client_address = writer.get_extra_info('peername')
+        # asyncio only sets this itself for sockets created with IPPROTO_TCP
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        timeout = ASYNC_IDLE_TIMEOUT
+        requests_served = 0
+        METRICS.inc('ts_server_active_connections')
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+                except asyncio.LimitOverrunError:
+                    writer.write(b'HTTP/1.0 431 Request Header Fields Too Large\r\n'
+                                 b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+                    await writer.drain()
+                    return
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    return
+                if self.stopping.is_set():
+                    # wait_for() can swallow the shutdown's cancellation when
+                    # the head arrives at the same moment; don't start a
+                    # handler that nothing would abort
+                    return
+                match = CONTENT_LENGTH_RE.search(head)
+                body_length = int(match.group(1)) if match else 0
 
-def run_server(port, use_auth, password):
-    """Start the multithreaded HTTP server."""
-    handler = partial(AuthHandler, use_auth=use_auth, password=password)
+                connection = AsyncConnection(self.loop, reader, writer, head, body_length, requests_served)
+                self.connections.add(connection)
+                output = asyncio.ensure_future(connection.write_output())
+                try:
+                    handler = await self.loop.run_in_executor(
+                        None, self.process_request, connection, client_address)
+                finally:
+                    self.connections.discard(connection)
+                    connection.close()
+                    await output
+                if handler is None or handler.close_connection or not connection.reusable():
+                    return
+                # Between requests the handler's keep-alive limits apply
+                timeout = handler.keepalive_timeout
+                requests_served = handler.requests_served
+        except (ConnectionError, OSError):
+            pass
+        except asyncio.CancelledError:
+            # Server shutdown; finishing normally keeps asyncio from
+            # logging the cancelled connection task
+            pass
+        finally:
+            METRICS.inc('ts_server_active_connections', -1)
+            writer.close()
+
+    def process_request(self, connection, client_address):
+        """Run one request through the handler; called on an executor thread."""
+        try:
+            return self.RequestHandlerClass(connection, client_address, self)
+        except (ConnectionError, socket.timeout, concurrent.futures.CancelledError):
+            return None
+        except Exception:
+            logging.exception("Error handling request from %s", client_address)
+            return None
+
+
+def make_server(server_address, handler, engine='threading', threads=WORKER_THREADS,
+                queue_size=WORKER_QUEUE_SIZE, backlog=LISTEN_BACKLOG, reuse_port=False, sock=None):
+    """Create an HTTP server for handler on the threading, pool or asyncio engine."""
+    if engine == 'asyncio':
+        return AsyncioHTTPServer(server_address, handler, max_workers=threads, backlog=backlog,
+                                 reuse_port=reuse_port, sock=sock)
+    if engine == 'pool':
+        return PooledHTTPServer(server_address, handler, workers=threads, queue_size=queue_size,
+                                backlog=backlog, reuse_port=reuse_port, sock=sock)
+    httpd = ThreadingHTTPServer(server_address, handler, bind_and_activate=False)
+    return activate_server(httpd, backlog, reuse_port, sock)
+
+
+# Prefork mode. A supervisor process forks --workers processes that each
+# run a server of their own on the same port, so request handling scales
+# across cores. With SO_REUSEPORT every worker binds its own listening
+# socket and the kernel spreads connections over them; otherwise they all
+# accept on one listening socket inherited from the supervisor.
+WORKER_RESTART_DELAY = 1.0
+# Seconds between a worker's checks that its supervisor is still alive
+SUPERVISOR_CHECK_INTERVAL = 1.0
+
+
+class PreforkServer:
+    """Supervisor that keeps `workers` server processes running.
+
+    server_factory(server_address, reuse_port=..., sock=...) creates the
+    server a worker runs. Workers that exit are restarted (after
+    WORKER_RESTART_DELAY if they die right after starting). Everything the
+    workers share, such as the auth password, must exist before
+    serve_forever() forks them.
+    """
+
+    def __init__(self, server_address, server_factory, workers, backlog=LISTEN_BACKLOG):
+        self.server_factory = server_factory
+        self.workers = workers
+        self.reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        if self.reuse_port:
+            # Bound but never listening: reserves the port (and resolves
+            # port 0) for the workers without taking any connections
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.socket.bind(server_address)
+        else:
+            self.socket = socket.create_server(server_address, backlog=backlog)
+        self.server_address = self.socket.getsockname()
+        self.children = {}
+        self.stopping = False
+        # Handlers workers get back after the supervisor takes the signal over
+        self.worker_signals = {}
+
+    def spawn(self):
+        """Fork one worker process."""
+        pid = os.fork()
+        if pid == 0:
+            self.run_worker()
+        self.children[pid] = time.monotonic()
+
+    def run_worker(self):
+        """Worker process body; never returns."""
+        status = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, lambda sig, frame: sys.exit(0))
+            for signum, handler in self.worker_signals.items():
+                signal.signal(signum, handler)
+            threading.Thread(target=self.watch_supervisor, args=(os.getppid(),), daemon=True).start()
+            if self.reuse_port:
+                self.socket.close()
+                server = self.server_factory(self.server_address, reuse_port=True)
+            else:
+                server = self.server_factory(self.server_address, sock=self.socket)
+            server.serve_forever()
+        except SystemExit:
+            pass
+        except BaseException:
+            logging.exception("Worker %d failed", os.getpid())
+            status = 1
+        finally:
+            # Skip the supervisor's atexit handlers (e.g. the funnel reset)
+            os._exit(status)
+
+    @staticmethod
+    def watch_supervisor(supervisor_pid):
+        """Stop this worker if the supervisor dies without stopping it."""
+        while os.getppid() == supervisor_pid:
+            time.sleep(SUPERVISOR_CHECK_INTERVAL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def serve_forever(self):
+        """Start the workers and restart any that exit, until shutdown()."""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda sig, frame: self.shutdown())
+            # A SIGUSR1 handler (the --profile dump) is meant for the workers
+            if hasattr(signal, 'SIGUSR1') and callable(signal.getsignal(signal.SIGUSR1)):
+                self.worker_signals[signal.SIGUSR1] = signal.getsignal(signal.SIGUSR1)
+                signal.signal(signal.SIGUSR1, lambda sig, frame: self.signal_workers(sig))
+        for _ in range(self.workers):
+            self.spawn()
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if self.stopping or started is None:
+                continue
+            logging.warning("Worker %d exited with status %d, restarting", pid, status)
+            if time.monotonic() - started < WORKER_RESTART_DELAY:
+                time.sleep(WORKER_RESTART_DELAY)
+            if not self.stopping:
+                self.spawn()
+
+    def shutdown(self):
+        """Stop restarting workers and ask the running ones to exit."""
+        self.stopping = True
+        self.signal_workers(signal.SIGTERM)
+
+    def signal_workers(self, signum):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def server_close(self):
+        self.shutdown()
+        deadline = time.monotonic() + 5
+        while self.children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.children.pop(pid, None)
+            else:
+                time.sleep(0.05)
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.socket.close()
+
+
+def run_server(port, use_auth, password, compress_cache_size=COMPRESS_CACHE_SIZE,
+               engine='threading', threads=WORKER_THREADS, queue_size=WORKER_QUEUE_SIZE,
+               backlog=LISTEN_BACKLOG, workers=1, keepalive_timeout=KEEPALIVE_TIMEOUT,
+               max_requests=KEEPALIVE_MAX_REQUESTS, session_ttl=SESSION_TTL, request_rate=0,
+               upload_rate=0, download_rate=0, durability=DEFAULT_DURABILITY, dedup=False, catalog=False,
+               access_log='-', profile_rate=0, profile_routes=(), server_timing=False):
+    """Start the HTTP server on the threading, pool or asyncio engine.
+
+    With workers > 1 that many prefork processes each run the engine.
+    """
+    profiler = None
+    if profile_rate or profile_routes:
+        profiler = RequestProfiler(profile_rate, profile_routes)
+        if hasattr(signal, 'SIGUSR1'):
+            def dump_profile(signum, frame):
+                logging.info("Wrote profile of %d requests: %s", profiler.requests,
+                             ", ".join(profiler.dump(os.getcwd())))
+            signal.signal(signal.SIGUSR1, dump_profile)
+    handler = partial(AuthHandler, use_auth=use_auth, password=password,
+                      compress_cache_size=compress_cache_size, keepalive_timeout=keepalive_timeout,
+                      max_requests=max_requests, session_ttl=session_ttl, request_rate=request_rate,
+                      upload_rate=upload_rate, download_rate=download_rate, durability=durability,
+                      dedup=dedup, catalog=catalog, access_log=access_log, profiler=profiler,
+                      server_timing=server_timing)
+    if dedup:
+        # Start the sweep of unused blobs now rather than on the first upload
+        get_blob_store(os.getcwd())
     server_address = ('', port)
-    httpd = ThreadingHTTPServer(server_address, handler)
+    server_factory = partial(make_server, handler=handler, engine=engine, threads=threads,
+                             queue_size=queue_size, backlog=backlog)
+    if workers > 1:
+        httpd = PreforkServer(server_address, server_factory, workers, backlog=backlog)
+    else:
+        httpd = server_factory(server_address)
+        if catalog:
+            # Start the scanner now rather than on the first request (prefork
+            # workers each open the catalog after forking)
+            get_catalog(os.getcwd())
     
     # Print server information
     logging.info("=" * 50)
@@ -644,6 +5300,22 @@ def run_server(port, use_auth, password):
     logging.info("-" * 50)
     logging.info(f"Directory: {os.getcwd()}")
     logging.info(f"Port: {port}")
+    logging.info(f"Engine: {engine}")
+    if workers > 1:
+        logging.info(f"Workers: {workers} processes")
+    logging.info(f"Upload durability: {durability}" + (", deduplicated" if dedup else ""))
+    if catalog:
+        logging.info(f"Catalog: {os.path.join(STATE_DIR_NAME, CATALOG_NAME)}")
+    if request_rate or upload_rate or download_rate:
+        limits = [f"{request_rate:g} requests/s" if request_rate else None,
+                  f"{upload_rate / 1024:g} KiB/s up" if upload_rate else None,
+                  f"{download_rate / 1024:g} KiB/s down" if download_rate else None]
+        logging.info("Per-client limits: " + ", ".join(limit for limit in limits if limit))
+    if profiler is not None:
+        sampled = [f"{profile_rate:.2%} of requests" if profile_rate else None,
+                   "all " + ", ".join(profile_routes) + " requests" if profile_routes else None]
+        logging.info("Profiling: " + " and ".join(part for part in sampled if part) +
+                     f" (GET {PROFILE_URL}, or SIGUSR1 to write {STATE_DIR_NAME}/profile/)")
     
     if use_auth:
         logging.info("\nAuthentication Required:")
@@ -700,7 +5372,62 @@ if __name__ == "__main__":
     parser.add_argument("port", type=int, nargs="?", default=8080, help="Port to run the server on (default: 8080)")
     parser.add_argument("--auth", action="store_true", help="Enable basic authentication")
     parser.add_argument("--dir", type=str, default=".", help="Directory to serve (default: current directory)")
+    parser.add_argument("--compress-cache-mb", type=int, default=COMPRESS_CACHE_SIZE // (1024 * 1024),
+                        help="Size of the on-disk cache of compressed files, 0 to disable (default: 256)")
+    parser.add_argument("--engine", choices=("threading", "pool", "asyncio"), default="threading",
+                        help="Thread per connection, a fixed worker pool, or an asyncio event loop "
+                             "(default: threading)")
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS,
+                        help="Worker threads for the pool and asyncio engines (default: 32)")
+    parser.add_argument("--queue-size", type=int, default=WORKER_QUEUE_SIZE,
+                        help="Connections the pool engine queues before answering 503 (default: 64)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Server processes to prefork; crashed ones are restarted (default: 1)")
+    parser.add_argument("--backlog", type=int, default=LISTEN_BACKLOG,
+                        help="listen() backlog of the server socket (default: 1024)")
+    parser.add_argument("--keepalive-timeout", type=float, default=KEEPALIVE_TIMEOUT,
+                        help="Seconds an idle connection is kept open for its next request (default: 15)")
+    parser.add_argument("--max-requests", type=int, default=KEEPALIVE_MAX_REQUESTS,
+                        help="Requests served on one connection before it is closed (default: 1000)")
+    parser.add_argument("--session-hours", type=float, default=SESSION_TTL / 3600,
+                        help="Lifetime of the session cookie issued after Basic auth, 0 to disable (default: 12)")
+    parser.add_argument("--request-rate", type=float, default=0,
+                        help="Requests per second allowed per client, 0 for no limit (default: 0)")
+    parser.add_argument("--upload-rate", type=float, default=0,
+                        help="Upload bandwidth per client in KiB/s, 0 for no limit (default: 0)")
+    parser.add_argument("--download-rate", type=float, default=0,
+                        help="Download bandwidth per client in KiB/s, 0 for no limit (default: 0)")
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default=DEFAULT_DURABILITY,
+                        help="How uploads are written: in place (none), via a temp file renamed into "
+                             "place (rename), also fsynced (fsync), or fsynced in batches (group) "
+                             "(default: rename)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Store uploads with identical content once, as hardlinks to a shared copy")
+    parser.add_argument("--catalog", action="store_true",
+                        help="Keep file metadata and SHA-256 checksums in a SQLite catalog, filled in by a "
+                             "background scanner, and list from it at startup")
+    parser.add_argument("--access-log", default="-", metavar="PATH",
+                        help="Append JSON access log lines to PATH, '-' for stderr or 'off' (default: -)")
+    parser.add_argument("--server-timing", action="store_true",
+                        help="Break each response's time down into phases in a Server-Timing header")
+    parser.add_argument("--profile", type=float, default=0, metavar="FRACTION",
+                        help="cProfile this fraction of requests, e.g. 0.01; see GET /profile (default: 0)")
+    parser.add_argument("--profile-routes", default="", metavar="ROUTES",
+                        help="Comma-separated routes to profile every request of, e.g. upload,list "
+                             "(%s)" % ", ".join(REQUEST_ROUTES))
     args = parser.parse_args()
+    if args.workers > 1 and not hasattr(os, 'fork'):
+        parser.error("--workers requires a platform with fork()")
+    if args.dedup and args.durability == 'none':
+        parser.error("--dedup requires --durability rename, fsync or group")
+    if args.catalog and sqlite3 is None:
+        parser.error("--catalog requires Python's sqlite3 module")
+    if not 0 <= args.profile <= 1:
+        parser.error("--profile must be between 0 and 1")
+    profile_routes = tuple(filter(None, args.profile_routes.split(",")))
+    unknown_routes = [route for route in profile_routes if route not in REQUEST_ROUTES]
+    if unknown_routes:
+        parser.error("unknown --profile-routes: " + ", ".join(unknown_routes))
 
     port = args.port
     use_auth = args.auth
@@ -710,6 +5437,15 @@ if __name__ == "__main__":
         logging.error("Error: Directory '%s' does not exist.", serve_dir)
         sys.exit(1)
 
+    # Resolved before the chdir, so a relative path is relative to where
+    # the server was started
+    access_log = None if args.access_log == 'off' else args.access_log
+    if access_log not in (None, '-'):
+        try:
+            access_log = resolve_access_log(access_log, serve_dir)
+        except ValueError as e:
+            parser.error("--access-log: %s" % e)
+
     os.chdir(serve_dir)
     logging.info("Serving directory: %s", serve_dir)
 
@@ -724,4 +5460,12 @@ if __name__ == "__main__":
     atexit.register(stop_funnel, funnel_process)
 
     # Start the server
-    run_server(port, use_auth, password)
\ No newline at end of file
+    run_server(port, use_auth, password, compress_cache_size=args.compress_cache_mb * 1024 * 1024,
+               engine=args.engine, threads=args.threads, queue_size=args.queue_size,
+               backlog=args.backlog, workers=args.workers, keepalive_timeout=args.keepalive_timeout,
+               max_requests=args.max_requests, session_ttl=int(args.session_hours * 3600),
+               request_rate=args.request_rate, upload_rate=args.upload_rate * 1024,
+               download_rate=args.download_rate * 1024, durability=args.durability,
+               dedup=args.dedup, catalog=args.catalog,
+               access_log=access_log,
+               profile_rate=args.profile, profile_routes=profile_routes, server_timing=args.server_timing)
\ No newline at end of file